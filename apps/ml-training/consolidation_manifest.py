@@ -0,0 +1,136 @@
+"""Persistent record of consolidated source images, for incremental re-runs.
+
+The manifest lives inside the merged dataset directory as a small SQLite file and keeps,
+per source image, the stat signature it was validated with (size, mtime, inode), the
+validation level and outcome, the destination it was linked to and the fingerprint
+used for duplicate detection. A re-run only validates sources whose signature changed
+and prunes destinations whose source is gone.
+"""
+
+import os
+import sqlite3
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+from duplicate_index import DHASH_VERSION
+
+MANIFEST_NAME = ".consolidation_manifest.db"
+
+# Validation levels ordered by thoroughness; a stored result satisfies any level at or below it
+LEVEL_RANK = {"header": 0, "structure": 1, "full": 2}
+
+
+class FileSignature(NamedTuple):
+    """Cheap change detector for a source file."""
+
+    size: int
+    mtime_ns: int
+    inode: int
+
+
+class ManifestEntry(NamedTuple):
+    signature: FileSignature
+    level: str
+    problem: Optional[str]  # None if the image passed validation
+    dst: str
+    group: str  # "<dataset slug>/<original label>": the class folder the source came from
+    content_hash: Optional[str] = None  # See duplicate_index.py; None if not fingerprinted
+    dhash: Optional[int] = None
+
+
+def file_signature(stat: os.stat_result) -> FileSignature:
+    return FileSignature(stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+
+def is_reusable(entry: Optional[ManifestEntry], signature: FileSignature, level: str) -> bool:
+    """True if a stored result still applies to a source with this signature.
+
+    Rejections always hold (they were confirmed by a full decode); acceptances hold if
+    they were made at a level at least as thorough as the one requested.
+    """
+    if entry is None or entry.signature != signature:
+        return False
+    return entry.problem is not None or LEVEL_RANK[entry.level] >= LEVEL_RANK[level]
+
+
+class ConsolidationManifest:
+    """SQLite-backed manifest of source image -> validation result and destination."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sources ("
+            "src TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, "
+            "inode INTEGER NOT NULL, level TEXT NOT NULL, problem TEXT, dst TEXT NOT NULL, "
+            "grp TEXT NOT NULL)"
+        )
+        # Manifests written before duplicate detection lack the fingerprint columns
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(sources)")}
+        for column in ("content_hash", "dhash"):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE sources ADD COLUMN {column} TEXT")
+        # Fingerprints of an older dHash are not comparable; dropping them makes the next
+        # run fingerprint those sources again
+        (version,) = self._conn.execute("PRAGMA user_version").fetchone()
+        if version < DHASH_VERSION:
+            self._conn.execute("UPDATE sources SET content_hash = NULL, dhash = NULL")
+            self._conn.execute(f"PRAGMA user_version = {DHASH_VERSION}")
+        self._conn.commit()
+
+    def load(self) -> Dict[str, ManifestEntry]:
+        """All entries keyed by source path (one query, so lookups stay in memory)."""
+        rows = self._conn.execute(
+            "SELECT src, size, mtime_ns, inode, level, problem, dst, grp, content_hash, dhash "
+            "FROM sources"
+        )
+        # dHashes are stored as hex: SQLite integers are signed 64-bit
+        return {
+            src: ManifestEntry(
+                FileSignature(size, mtime_ns, inode),
+                level,
+                problem,
+                dst,
+                grp,
+                content_hash,
+                int(dhash, 16) if dhash is not None else None,
+            )
+            for src, size, mtime_ns, inode, level, problem, dst, grp, content_hash, dhash in rows
+        }
+
+    def record(self, entries: Iterable[Tuple[str, ManifestEntry]]) -> None:
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO sources "
+            "(src, size, mtime_ns, inode, level, problem, dst, grp, content_hash, dhash) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    src,
+                    *entry.signature,
+                    entry.level,
+                    entry.problem,
+                    entry.dst,
+                    entry.group,
+                    entry.content_hash,
+                    f"{entry.dhash:016x}" if entry.dhash is not None else None,
+                )
+                for src, entry in entries
+            ],
+        )
+        self._conn.commit()
+
+    def remove(self, sources: Iterable[str]) -> None:
+        self._conn.executemany("DELETE FROM sources WHERE src = ?", [(src,) for src in sources])
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+__all__ = [
+    "MANIFEST_NAME",
+    "FileSignature",
+    "ManifestEntry",
+    "ConsolidationManifest",
+    "file_signature",
+    "is_reusable",
+]
@@ -0,0 +1,363 @@
+"""Parallel, resumable fetching and extraction of the raw dataset zips.
+
+Each dataset goes through fetch -> verify -> extract in its own worker thread (downloads,
+file copies and zlib all release the GIL). Zips come from Kaggle or, with a mirror
+directory, from local disk as ``<mirror>/<owner>_<name>.zip`` so air-gapped machines can
+prepare data without the network.
+
+A lock file maps every dataset to the size and SHA-256 of the zip it was prepared from.
+An existing zip that does not match is treated as a partial download: mirror copies
+resume from where they stopped, Kaggle downloads start over. A freshly fetched zip that
+does not match means the upstream dataset changed, and is reported instead of used.
+Extraction goes to a temporary directory that is renamed into place when complete, so
+an interrupted extraction is never mistaken for a finished one.
+
+With an ExtractionFilter only the members consolidation will read are extracted (image
+files directly inside the mapped class folders), spread over several threads that each
+hold their own handle on the zip. The filter is stored next to the extracted files, and
+the dataset is extracted again when the class mapping changes.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+DEFAULT_LOCK_FILE = "datasets.lock.json"
+DEFAULT_FETCH_WORKERS = 4
+DEFAULT_EXTRACT_WORKERS = 4
+EXTRACTION_MARKER = ".extraction.json"
+COPY_CHUNK = 1 << 20
+
+
+def dataset_slug(dataset: str) -> str:
+    """Directory and zip name for a Kaggle dataset reference ("owner/name" -> "owner_name")."""
+    return dataset.replace("/", "_")
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(COPY_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DatasetLock:
+    """Thread-safe view of the lock file: dataset -> {"zip", "size", "sha256"}."""
+
+    def __init__(self, path: Optional[str]):
+        self.path = Path(path) if path else None
+        self._guard = threading.Lock()
+        self.entries: Dict[str, Dict] = {}
+        if self.path is not None and self.path.exists():
+            with open(self.path) as f:
+                self.entries = json.load(f).get("datasets", {})
+
+    def get(self, dataset: str) -> Optional[Dict]:
+        with self._guard:
+            return self.entries.get(dataset)
+
+    def record(self, dataset: str, zip_path: Path, sha256: str) -> None:
+        with self._guard:
+            self.entries[dataset] = {
+                "zip": zip_path.name,
+                "size": zip_path.stat().st_size,
+                "sha256": sha256,
+            }
+            if self.path is None:
+                return
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp, "w") as f:
+                json.dump({"datasets": dict(sorted(self.entries.items()))}, f, indent=2)
+                f.write("\n")
+            os.replace(tmp, self.path)
+
+
+def _matches(zip_path: Path, expected: Optional[Dict]) -> Optional[str]:
+    """SHA-256 of zip_path if it matches the lock entry (or is a readable zip without one)."""
+    if not zip_path.exists():
+        return None
+    if expected is not None:
+        if zip_path.stat().st_size != expected["size"]:
+            return None
+        sha256 = file_sha256(zip_path)
+        return sha256 if sha256 == expected["sha256"] else None
+    # No lock entry yet: a truncated zip has no central directory and fails to open
+    try:
+        with zipfile.ZipFile(zip_path) as zf:
+            zf.infolist()
+    except (zipfile.BadZipFile, OSError):
+        return None
+    return file_sha256(zip_path)
+
+
+def _copy_from_mirror(src: Path, dst: Path, resume: bool) -> bool:
+    """Copy a mirrored zip, appending to a partial copy if resume is set.
+
+    Returns:
+        True if an earlier partial copy was resumed
+    """
+    part = dst.with_name(dst.name + ".part")
+    total = src.stat().st_size
+    # A partial download at the final name (e.g. an interrupted run) becomes the .part
+    if dst.exists() and not part.exists():
+        os.replace(dst, part)
+    offset = part.stat().st_size if resume and part.exists() else 0
+    if offset > total:
+        offset = 0
+    if offset:
+        print(f"Resuming copy of {src.name} at {offset}/{total} bytes")
+    with open(src, "rb") as fin, open(part, "r+b" if offset else "wb") as fout:
+        fin.seek(offset)
+        fout.seek(offset)
+        fout.truncate()
+        shutil.copyfileobj(fin, fout, COPY_CHUNK)
+    os.replace(part, dst)
+    return offset > 0
+
+
+def _download_from_kaggle(dataset: str, dst: Path) -> None:
+    """Download a dataset zip through the Kaggle API into a staging directory."""
+    # Imported lazily: importing kaggle authenticates, which mirror-only runs must not need
+    from kaggle.api.kaggle_api_extended import KaggleApi
+
+    staging = dst.with_name(dst.name + ".download")
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+    api = KaggleApi()
+    api.authenticate()
+    api.dataset_download_files(dataset, path=str(staging), force=True, quiet=True, unzip=False)
+    zips = list(staging.glob("*.zip"))
+    if len(zips) != 1:
+        raise RuntimeError(f"Expected one zip from Kaggle for {dataset}, got {zips}")
+    os.replace(zips[0], dst)
+    shutil.rmtree(staging, ignore_errors=True)
+
+
+def fetch_zip(dataset: str, raw_dir: str, lock: DatasetLock, mirror: Optional[str] = None) -> Path:
+    """Make sure raw_dir holds a verified zip for the dataset.
+
+    Returns:
+        Path to the zip
+    """
+    zip_path = Path(raw_dir) / f"{dataset_slug(dataset)}.zip"
+    expected = lock.get(dataset)
+    sha256 = _matches(zip_path, expected)
+    if sha256 is not None:
+        print(f"[SKIP] Zip already verified: {zip_path}")
+    else:
+        if mirror:
+            src = Path(mirror) / zip_path.name
+            if not src.exists():
+                raise FileNotFoundError(f"{dataset} not found in mirror: {src}")
+            if expected is not None and src.stat().st_size != expected["size"]:
+                raise ValueError(
+                    f"Mirror zip {src} is {src.stat().st_size} bytes, "
+                    f"lock file expects {expected['size']}"
+                )
+            print(f"Copying {src} -> {zip_path} ...")
+            # Only resume when the lock file can tell whether the result is intact
+            resumed = _copy_from_mirror(src, zip_path, resume=expected is not None)
+            sha256 = file_sha256(zip_path)
+            if resumed and sha256 != expected["sha256"]:
+                print(f"[WARN] Resumed copy of {src.name} is corrupt, copying it again")
+                _copy_from_mirror(src, zip_path, resume=False)
+                sha256 = file_sha256(zip_path)
+        else:
+            print(f"Downloading {dataset} -> {zip_path} ...")
+            _download_from_kaggle(dataset, zip_path)
+            sha256 = file_sha256(zip_path)
+        if expected is not None and sha256 != expected["sha256"]:
+            raise ValueError(
+                f"Checksum mismatch for {dataset}: got {sha256}, lock file has "
+                f"{expected['sha256']}. Remove its entry from the lock file to accept it."
+            )
+    if expected is None:
+        lock.record(dataset, zip_path, sha256)
+    return zip_path
+
+
+class ExtractionFilter(NamedTuple):
+    """Zip members to extract: files directly inside one of the folders, by extension."""
+
+    folders: Sequence[str]  # Zip-relative folder paths using "/", without trailing slash
+    extensions: Sequence[str]  # Lowercase, with the leading dot
+
+    def matches(self, name: str) -> bool:
+        folder, _, filename = name.rpartition("/")
+        return folder in self.folders and os.path.splitext(filename)[1].lower() in self.extensions
+
+    def as_json(self) -> Dict:
+        return {"folders": sorted(self.folders), "extensions": sorted(self.extensions)}
+
+
+def _extraction_current(target_dir: Path, member_filter: Optional[ExtractionFilter]) -> bool:
+    """True if target_dir was extracted with a selection covering member_filter."""
+    marker = target_dir / EXTRACTION_MARKER
+    if not marker.exists():
+        return True  # Extracted in full (or by an older version that extracted everything)
+    if member_filter is None:
+        return False
+    with open(marker) as f:
+        return json.load(f) == member_filter.as_json()
+
+
+def _extract_members(zip_path: Path, members: List[zipfile.ZipInfo], dest: Path) -> None:
+    # ZipFile handles share one file position, so every thread opens its own
+    with zipfile.ZipFile(zip_path, "r") as zf:
+        for member in members:
+            zf.extract(member, dest)
+
+
+def extract_zip(
+    zip_path: Path,
+    target_dir: Path,
+    member_filter: Optional[ExtractionFilter] = None,
+    workers: Optional[int] = None,
+) -> None:
+    """Extract into a temporary directory and move it into place when complete.
+
+    Args:
+        zip_path: Archive to extract
+        target_dir: Final dataset directory (replaced if it exists)
+        member_filter: Only extract matching members (None extracts everything)
+        workers: Threads extracting members in parallel (default: DEFAULT_EXTRACT_WORKERS)
+    """
+    tmp_dir = target_dir.with_name(target_dir.name + ".extracting")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    with zipfile.ZipFile(zip_path, "r") as zf:
+        infos = zf.infolist()
+    members = [
+        info
+        for info in infos
+        if not info.is_dir() and (member_filter is None or member_filter.matches(info.filename))
+    ]
+    total_bytes = sum(info.file_size for info in infos)
+    selected_bytes = sum(info.file_size for info in members)
+    print(
+        f"Extracting {len(members)}/{len(infos)} members "
+        f"({selected_bytes / 1e6:.1f}/{total_bytes / 1e6:.1f} MB) from {zip_path} ..."
+    )
+
+    # Create directories up front; zipfile's makedirs is not safe across threads
+    for folder in {os.path.dirname(info.filename) for info in members}:
+        if folder:
+            (tmp_dir / folder).mkdir(parents=True, exist_ok=True)
+
+    # Deal members round-robin by size so every thread gets a similar amount of work
+    workers = max(1, min(workers or DEFAULT_EXTRACT_WORKERS, len(members) or 1))
+    chunks = [[] for _ in range(workers)]
+    for i, info in enumerate(sorted(members, key=lambda m: m.compress_size, reverse=True)):
+        chunks[i % workers].append(info)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for future in [pool.submit(_extract_members, zip_path, c, tmp_dir) for c in chunks]:
+            future.result()
+
+    if member_filter is not None:
+        with open(tmp_dir / EXTRACTION_MARKER, "w") as f:
+            json.dump(member_filter.as_json(), f, indent=2)
+    shutil.rmtree(target_dir, ignore_errors=True)
+    os.replace(tmp_dir, target_dir)
+
+
+def fetch_dataset(
+    dataset: str,
+    raw_dir: str,
+    lock: DatasetLock,
+    mirror: Optional[str] = None,
+    member_filter: Optional[ExtractionFilter] = None,
+    extract_workers: Optional[int] = None,
+    extract: bool = True,
+) -> str:
+    """Fetch, verify and (unless extract is False) extract one dataset.
+
+    Returns:
+        Path to the extracted dataset directory, or to the zip if extract is False
+    """
+    if not extract:
+        return str(fetch_zip(dataset, raw_dir, lock, mirror))
+    target_dir = Path(raw_dir) / dataset_slug(dataset)
+    if target_dir.exists():
+        if _extraction_current(target_dir, member_filter):
+            print(f"[SKIP] Already extracted: {target_dir}")
+            return str(target_dir)
+        print(f"Class mapping changed since {target_dir} was extracted, extracting again")
+    zip_path = fetch_zip(dataset, raw_dir, lock, mirror)
+    extract_zip(zip_path, target_dir, member_filter, extract_workers)
+    return str(target_dir)
+
+
+def fetch_datasets(
+    datasets: List[str],
+    raw_dir: str,
+    mirror: Optional[str] = None,
+    workers: Optional[int] = None,
+    lock_path: Optional[str] = DEFAULT_LOCK_FILE,
+    member_filters: Optional[Dict[str, ExtractionFilter]] = None,
+    extract_workers: Optional[int] = None,
+    extract: bool = True,
+) -> List[str]:
+    """Fetch and extract several datasets concurrently.
+
+    Args:
+        datasets: Kaggle dataset references ("owner/name")
+        raw_dir: Directory for zips and extracted datasets
+        mirror: Directory with pre-downloaded ``owner_name.zip`` files to use instead of Kaggle
+        workers: Datasets processed at the same time (default: DEFAULT_FETCH_WORKERS)
+        lock_path: Lock file with the expected zip checksums (None disables it)
+        member_filters: Per-dataset selection of members to extract; datasets without
+            one are extracted in full
+        extract_workers: Threads extracting the members of one zip
+        extract: Extract the zips; with False they are only fetched and verified
+
+    Returns:
+        Extracted dataset directories (or zips), in the order of datasets
+    """
+    os.makedirs(raw_dir, exist_ok=True)
+    lock = DatasetLock(lock_path)
+    workers = max(1, min(workers or DEFAULT_FETCH_WORKERS, len(datasets) or 1))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(
+                fetch_dataset,
+                ds,
+                raw_dir,
+                lock,
+                mirror,
+                (member_filters or {}).get(ds),
+                extract_workers,
+                extract,
+            )
+            for ds in datasets
+        ]
+        extracted, errors = [], []
+        for ds, future in zip(datasets, futures):
+            try:
+                extracted.append(future.result())
+            except Exception as e:
+                errors.append(f"{ds}: {e}")
+    if errors:
+        # Report every failure, not just the first; the other datasets are already done
+        raise RuntimeError("Failed to fetch datasets:\n  " + "\n  ".join(errors))
+    return extracted
+
+
+__all__ = [
+    "DEFAULT_LOCK_FILE",
+    "DatasetLock",
+    "ExtractionFilter",
+    "dataset_slug",
+    "fetch_zip",
+    "extract_zip",
+    "fetch_dataset",
+    "fetch_datasets",
+]
@@ -0,0 +1,451 @@
+#!/usr/bin/env python
+"""Class, source, dimension, file size and label statistics for merged_dataset.
+
+One parallel pass reads only image headers (dimensions, format, EXIF orientation) and
+the YOLO label files; no pixels are decoded. Per-file results are cached in
+<merged_dir>/.dataset_stats_cache.json keyed by the same signatures as resize_cache, so
+re-runs only scan new or changed files. The report is printed as tables and written as
+JSON for planning batch sizes, the resized cache (how many images exceed --max-side)
+and class balancing.
+
+Usage:
+    python dataset_stats.py merged_dataset --labels yolo/dataset/labels
+"""
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+from rich import print
+from rich.console import Console
+from rich.table import Table
+
+from dataset_utils import CANONICAL_CLASSES, DATASET_CONFIGS
+from resize_cache import DEFAULT_MAX_SIDE, list_dataset_images, source_signature
+from zip_dataset import open_image_file
+
+CACHE_NAME = ".dataset_stats_cache.json"
+REPORT_NAME = "dataset_stats.json"
+CACHE_VERSION = 1
+EXIF_ORIENTATION = 0x0112
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+LONG_SIDE_EDGES = [0, 320, 640, 1024, 1600, 2048, 3000, 4000]
+FILE_SIZE_EDGES_KB = [0, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096]
+ASPECT_EDGES = [0, 0.5, 0.75, 0.95, 1.05, 1.34, 2.0]
+BOXES_PER_IMAGE_EDGES = [0, 1, 2, 3, 5, 10, 20]
+BOX_AREA_EDGES = [0, 0.01, 0.05, 0.1, 0.25, 0.5, 0.75]
+
+
+def image_header_stats(path: str) -> Dict:
+    """Size on disk, format and displayed (EXIF-rotated) dimensions from the header only."""
+    with open_image_file(path) as f:
+        f.seek(0, os.SEEK_END)
+        file_size = f.tell()
+        f.seek(0)
+        with Image.open(f) as image:
+            width, height = image.size
+            fmt = image.format
+            if image.getexif().get(EXIF_ORIENTATION, 1) in TRANSPOSED_ORIENTATIONS:
+                width, height = height, width
+    return {"width": width, "height": height, "bytes": file_size, "format": fmt}
+
+
+def label_file_stats(path: str) -> Dict:
+    """Box count, boxes per class id and normalized box areas of a YOLO label file."""
+    classes: Dict[str, int] = {}
+    areas = []
+    with open(path) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) != 5:
+                continue
+            classes[parts[0]] = classes.get(parts[0], 0) + 1
+            areas.append(float(parts[3]) * float(parts[4]))
+    return {"boxes": len(areas), "classes": classes, "areas": [round(a, 5) for a in areas]}
+
+
+def _scan_task(args: Tuple[str, str]) -> Tuple[Optional[Dict], Optional[str]]:
+    """Scan one file in a worker process: (stats, None) or (None, error message)."""
+    kind, path = args
+    try:
+        return (image_header_stats(path) if kind == "image" else label_file_stats(path)), None
+    except Exception as e:
+        return None, str(e)
+
+
+def _iter_scanned(tasks: List[Tuple[str, str]], workers: int) -> Iterator[Tuple]:
+    """Run _scan_task over tasks in a process pool, yielding results in order."""
+    if workers <= 1 or len(tasks) < 2:
+        yield from map(_scan_task, tasks)
+        return
+    chunksize = max(1, min(256, len(tasks) // (workers * 4)))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(_scan_task, tasks, chunksize=chunksize)
+
+
+def _label_signature(path: str) -> List[int]:
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+
+def list_label_files(labels_dir: str) -> List[str]:
+    """The .txt files directly in labels_dir.
+
+    Subfolders are skipped: split_dataset copies every label into labels/train|val|test,
+    so a recursive walk would count each box twice. Point labels_dir at a split folder to
+    profile that split on its own.
+    """
+    with os.scandir(labels_dir) as entries:
+        paths = [e.path for e in entries if e.name.endswith(".txt") and e.is_file()]
+    return sorted(paths)
+
+
+def source_of(filename: str) -> str:
+    """Source dataset of a merged image, from its <slug>_<label>_<file> name."""
+    for config in sorted(DATASET_CONFIGS, key=lambda c: -len(c["slug"])):
+        if filename.startswith(config["slug"] + "_"):
+            return config["name"]
+    return "unknown"
+
+
+def scan_dataset(
+    merged_dir: str,
+    labels_dir: Optional[str] = None,
+    workers: Optional[int] = None,
+    use_cache: bool = True,
+) -> Tuple[Dict[str, Dict], Dict[str, Dict]]:
+    """Per-file statistics for merged_dir's images and labels_dir's label files.
+
+    Args:
+        merged_dir: Consolidated dataset (regular, virtual or a resized cache)
+        labels_dir: Optional directory of YOLO .txt labels (top level only, see
+            list_label_files)
+        workers: Scan processes (defaults to the CPU count)
+        use_cache: Reuse results of unchanged files from the previous scan
+
+    Returns:
+        Tuple of (image stats by path relative to merged_dir, label stats by path
+        relative to labels_dir)
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    cache_path = os.path.join(merged_dir, CACHE_NAME)
+    cache = {"images": {}, "labels": {}}
+    if use_cache and os.path.exists(cache_path):
+        try:
+            with open(cache_path) as f:
+                stored = json.load(f)
+            if stored.get("version") == CACHE_VERSION:
+                cache = stored
+        except ValueError:
+            pass  # Torn cache file, rescan everything
+    labels_key = os.path.abspath(labels_dir) if labels_dir else None
+    cached_labels = cache["labels"] if cache.get("labels_dir") == labels_key else {}
+
+    results = {"image": {}, "label": {}}
+    tasks, pending = [], []
+    sources = [("image", merged_dir, p, source_signature) for p in list_dataset_images(merged_dir)]
+    if labels_dir:
+        sources += [
+            ("label", labels_dir, p, _label_signature) for p in list_label_files(labels_dir)
+        ]
+    for kind, root, path, signature_of in sources:
+        rel = os.path.relpath(path, root)
+        signature = signature_of(path)
+        previous = (cache["images"] if kind == "image" else cached_labels).get(rel)
+        if previous is not None and previous["signature"] == signature:
+            results[kind][rel] = previous
+        else:
+            tasks.append((kind, path))
+            pending.append((kind, rel, signature))
+    reused = sum(len(r) for r in results.values())
+    print(f"Scanning {len(tasks)} files ({reused} cached)")
+
+    for (kind, rel, signature), (stats, error) in zip(pending, _iter_scanned(tasks, workers)):
+        if error is not None:
+            print(f"[yellow][WARN] Could not read {rel}: {error}[/yellow]")
+            continue
+        results[kind][rel] = dict(stats, signature=signature)
+
+    tmp = cache_path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(
+            {
+                "version": CACHE_VERSION,
+                "labels_dir": labels_key,
+                "images": results["image"],
+                "labels": results["label"],
+            },
+            f,
+        )
+    os.replace(tmp, cache_path)
+    return results["image"], results["label"]
+
+
+def _summary(values: Sequence[float]) -> Dict[str, float]:
+    if not len(values):
+        return {}
+    array = np.asarray(values, dtype=np.float64)
+    return {
+        "min": float(array.min()),
+        "p5": float(np.percentile(array, 5)),
+        "median": float(np.median(array)),
+        "mean": float(array.mean()),
+        "p95": float(np.percentile(array, 95)),
+        "max": float(array.max()),
+    }
+
+
+def _histogram(values: Iterable[float], edges: Sequence[float]) -> Dict[str, int]:
+    """Counts per [edge, next edge) bin; the last bin is open-ended."""
+    labels = [f"{lo}-{hi}" for lo, hi in zip(edges, edges[1:])] + [f">={edges[-1]}"]
+    counts = np.bincount(
+        np.searchsorted(edges, np.asarray(list(values), dtype=np.float64), side="right") - 1,
+        minlength=len(edges),
+    )
+    return {label: int(n) for label, n in zip(labels, counts)}
+
+
+def build_report(
+    images: Dict[str, Dict], labels: Dict[str, Dict], max_side: int = DEFAULT_MAX_SIDE
+) -> Dict:
+    """Aggregate per-file statistics into the report written as JSON."""
+    rows = sorted(images.items())
+    widths = [s["width"] for _, s in rows]
+    heights = [s["height"] for _, s in rows]
+    sizes = [s["bytes"] for _, s in rows]
+    long_sides = [max(w, h) for w, h in zip(widths, heights)]
+    megapixels = [w * h / 1e6 for w, h in zip(widths, heights)]
+
+    classes: Dict[str, Dict] = {}
+    sources: Dict[str, Dict] = {}
+    formats: Dict[str, int] = {}
+    for rel, stats in rows:
+        parts = rel.split(os.sep)
+        cls = parts[0] if len(parts) > 1 else "."
+        source = source_of(parts[-1])
+        entry = classes.setdefault(cls, {"images": 0, "bytes": 0, "sources": {}})
+        entry["images"] += 1
+        entry["bytes"] += stats["bytes"]
+        entry["sources"][source] = entry["sources"].get(source, 0) + 1
+        by_source = sources.setdefault(source, {"images": 0, "bytes": 0})
+        by_source["images"] += 1
+        by_source["bytes"] += stats["bytes"]
+        formats[stats["format"]] = formats.get(stats["format"], 0) + 1
+
+    report = {
+        "images": len(rows),
+        "bytes": int(sum(sizes)),
+        "formats": formats,
+        "classes": dict(sorted(classes.items())),
+        "sources": dict(sorted(sources.items())),
+        "width": _summary(widths),
+        "height": _summary(heights),
+        "megapixels": _summary(megapixels),
+        "file_kb": _summary([s / 1024 for s in sizes]),
+        "long_side_histogram": _histogram(long_sides, LONG_SIDE_EDGES),
+        "aspect_histogram": _histogram([w / h for w, h in zip(widths, heights)], ASPECT_EDGES),
+        "file_kb_histogram": _histogram([s / 1024 for s in sizes], FILE_SIZE_EDGES_KB),
+        "resize": {
+            "max_side": max_side,
+            "images_above": int(sum(side > max_side for side in long_sides)),
+            # Share of decoded pixels left after capping the long side at max_side
+            "pixel_share": (
+                sum(min(1.0, max_side / side) ** 2 * mp for side, mp in zip(long_sides, megapixels))
+                / sum(megapixels)
+                if megapixels
+                else 1.0
+            ),
+        },
+    }
+
+    if labels:
+        label_stems = {os.path.splitext(os.path.basename(rel))[0] for rel in labels}
+        image_stems = {os.path.splitext(os.path.basename(rel))[0] for rel in images}
+        box_counts = [s["boxes"] for s in labels.values()]
+        box_classes: Dict[str, int] = {}
+        for stats in labels.values():
+            for class_id, n in stats["classes"].items():
+                name = (
+                    CANONICAL_CLASSES[int(class_id)]
+                    if class_id.isdigit() and int(class_id) < len(CANONICAL_CLASSES)
+                    else class_id
+                )
+                box_classes[name] = box_classes.get(name, 0) + n
+        areas = [a for stats in labels.values() for a in stats["areas"]]
+        report["labels"] = {
+            "files": len(labels),
+            "empty_files": int(sum(n == 0 for n in box_counts)),
+            "images_without_labels": len(image_stems - label_stems),
+            "boxes": int(sum(box_counts)),
+            "boxes_per_class": dict(sorted(box_classes.items())),
+            "boxes_per_image": _summary(box_counts),
+            "boxes_per_image_histogram": _histogram(box_counts, BOXES_PER_IMAGE_EDGES),
+            "box_area": _summary(areas),
+            "box_area_histogram": _histogram(areas, BOX_AREA_EDGES),
+        }
+    return report
+
+
+def _table(title: str, columns: Sequence[str], rows: Iterable[Sequence]) -> Table:
+    table = Table(title=title)
+    for i, column in enumerate(columns):
+        table.add_column(column, justify="left" if i == 0 else "right")
+    for row in rows:
+        table.add_row(*(str(value) for value in row))
+    return table
+
+
+def print_report(report: Dict) -> None:
+    console = Console()
+    total = report["images"] or 1
+    console.print(
+        _table(
+            f"{report['images']} images, {report['bytes'] / 2**20:.1f} MB",
+            ["Class", "Images", "Share", "MB", *report["sources"]],
+            (
+                [
+                    cls,
+                    entry["images"],
+                    f"{entry['images'] / total:.1%}",
+                    f"{entry['bytes'] / 2**20:.1f}",
+                    *(entry["sources"].get(source, 0) for source in report["sources"]),
+                ]
+                for cls, entry in report["classes"].items()
+            ),
+        )
+    )
+    console.print(
+        _table(
+            "Dimensions",
+            ["", "min", "p5", "median", "mean", "p95", "max"],
+            (
+                [name, *(f"{v:.4g}" for v in report[key].values())]
+                for name, key in [
+                    ("width", "width"),
+                    ("height", "height"),
+                    ("megapixels", "megapixels"),
+                    ("file KB", "file_kb"),
+                ]
+                if report[key]
+            ),
+        )
+    )
+    console.print(
+        _table(
+            "Long side (px)",
+            ["Range", "Images"],
+            report["long_side_histogram"].items(),
+        )
+    )
+    resize = report["resize"]
+    print(
+        f"{resize['images_above']} images exceed {resize['max_side']}px; capping them keeps "
+        f"{resize['pixel_share']:.1%} of the decoded pixels"
+    )
+
+    labels = report.get("labels")
+    if labels:
+        console.print(
+            _table(
+                f"{labels['boxes']} boxes in {labels['files']} label files "
+                f"({labels['empty_files']} empty, {labels['images_without_labels']} images "
+                "without labels)",
+                ["Class", "Boxes", "Share"],
+                (
+                    [name, n, f"{n / (labels['boxes'] or 1):.1%}"]
+                    for name, n in labels["boxes_per_class"].items()
+                ),
+            )
+        )
+        console.print(
+            _table(
+                "Boxes per image",
+                ["Range", "Images"],
+                labels["boxes_per_image_histogram"].items(),
+            )
+        )
+        console.print(
+            _table(
+                "Box area (fraction of image)",
+                ["Range", "Boxes"],
+                labels["box_area_histogram"].items(),
+            )
+        )
+
+
+def dataset_stats(
+    merged_dir: str,
+    labels_dir: Optional[str] = None,
+    output: Optional[str] = None,
+    workers: Optional[int] = None,
+    max_side: int = DEFAULT_MAX_SIDE,
+    use_cache: bool = True,
+) -> Dict:
+    """Scan merged_dir (and labels_dir), print the report and write it as JSON.
+
+    Args:
+        merged_dir: Consolidated dataset to profile
+        labels_dir: Optional directory of YOLO .txt labels
+        output: JSON report path (defaults to merged_dir/dataset_stats.json)
+        workers: Scan processes (defaults to the CPU count)
+        max_side: Long side used for the resize estimate
+        use_cache: Reuse results of unchanged files from the previous scan
+
+    Returns:
+        The report
+    """
+    images, labels = scan_dataset(merged_dir, labels_dir, workers, use_cache)
+    report = build_report(images, labels, max_side)
+    report["root"] = os.path.abspath(merged_dir)
+    if labels_dir:
+        report["labels_dir"] = os.path.abspath(labels_dir)
+    if output is None:
+        output = os.path.join(merged_dir, REPORT_NAME)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print_report(report)
+    print(f"Report written to {output}")
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Header-only statistics for a merged dataset and its labels",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("merged_dir", help="Consolidated dataset, e.g. merged_dataset")
+    parser.add_argument("--labels", help="Directory of YOLO .txt label files")
+    parser.add_argument(
+        "--output", help="JSON report path (default: <merged_dir>/dataset_stats.json)"
+    )
+    parser.add_argument("--workers", type=int, default=None, help="Scan processes")
+    parser.add_argument(
+        "--max-side", type=int, default=DEFAULT_MAX_SIDE, help="Long side for the resize estimate"
+    )
+    parser.add_argument("--rescan", action="store_true", help="Ignore cached per-file results")
+    args = parser.parse_args()
+    dataset_stats(
+        args.merged_dir, args.labels, args.output, args.workers, args.max_side, not args.rescan
+    )
+
+
+__all__ = [
+    "CACHE_NAME",
+    "REPORT_NAME",
+    "image_header_stats",
+    "label_file_stats",
+    "scan_dataset",
+    "build_report",
+    "print_report",
+    "dataset_stats",
+]
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,38 @@
+import argparse
 import os
-import zipfile
+import shutil
 import json
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
-from typing import List, Dict
-from kaggle.api.kaggle_api_extended import KaggleApi
+from typing import Iterator, List, Dict, NamedTuple, Optional, Set, Tuple
+
+from consolidation_manifest import (
+    MANIFEST_NAME,
+    ConsolidationManifest,
+    FileSignature,
+    ManifestEntry,
+    file_signature,
+    is_reusable,
+)
+from dataset_fetch import DEFAULT_LOCK_FILE, ExtractionFilter, fetch_datasets
+from duplicate_index import (
+    DEFAULT_DEDUP_RADIUS,
+    REPORT_NAME as DUPLICATE_REPORT_NAME,
+    Fingerprint,
+    find_duplicate_clusters,
+    image_fingerprint,
+    write_duplicate_report,
+)
+from image_integrity import VALIDATION_LEVELS, IntegrityReport, IntegrityResult, check_image
+from resize_cache import DEFAULT_MAX_SIDE, build_resized_cache
+from zip_dataset import (
+    VIRTUAL_INDEX_NAME,
+    load_zip_index,
+    member_path,
+    split_member_path,
+    write_virtual_index,
+)
 
 # ---------------------------------------------------------------------------
 # Canonical Label System (German Waste-Sorting Alignment)
@@ -169,53 +198,66 @@ DATASET_CONFIGS = [
 ]
 
 
-def ensure_kaggle_download(datasets: List[str], raw_dir: str) -> list[str]:
-    os.makedirs(raw_dir, exist_ok=True)
-    api = KaggleApi()
-    api.authenticate()
-    extracted_dirs = []
-    for ds in datasets:
-        slug = ds.replace("/", "_")
-        zip_name = ds.split("/")[-1] + ".zip"
-        target_zip = Path(raw_dir) / zip_name
-        target_dir = Path(raw_dir) / slug
-        # If already extracted, skip everything
-        if target_dir.exists():
-            print(f"[SKIP] Already extracted: {target_dir}")
-            extracted_dirs.append(str(target_dir))
-            continue
-        # If zip exists, skip download
-        if not target_zip.exists():
-            print(f"Downloading {ds} -> {target_zip} ...")
-            api.dataset_download_files(ds, path=raw_dir, quiet=False, unzip=False)
-        else:
-            print(f"[SKIP] Zip already exists: {target_zip}")
-        print(f"Extracting {target_zip} ...")
-        with zipfile.ZipFile(target_zip, "r") as zf:
-            zf.extractall(target_dir)
-        extracted_dirs.append(str(target_dir))
-    return extracted_dirs
-
-
-def consolidate_datasets_explicit(raw_dir: str, merged_dir: str, datasets: List[str] = None) -> str:
-    """Consolidate datasets using explicit configurations for precise control.
+def ensure_kaggle_download(
+    datasets: List[str],
+    raw_dir: str,
+    mirror: Optional[str] = None,
+    workers: Optional[int] = None,
+    lock_path: Optional[str] = DEFAULT_LOCK_FILE,
+    extract_workers: Optional[int] = None,
+    extract: bool = True,
+) -> list[str]:
+    """Download (or copy from a mirror) and extract datasets in parallel.
+
+    See dataset_fetch.py for how partial downloads are detected with the lock file.
+    Datasets with an entry in DATASET_CONFIGS only get the images of their mapped class
+    folders extracted; the rest of the archive is never written to disk.
 
     Args:
-        raw_dir: Directory containing extracted datasets
-        merged_dir: Directory to consolidate images into
-        datasets: List of dataset names to process (defaults to all in DATASET_CONFIGS)
+        datasets: Kaggle dataset references ("owner/name")
+        raw_dir: Directory for zips and extracted datasets
+        mirror: Directory with pre-downloaded ``owner_name.zip`` files used instead of Kaggle
+        workers: Datasets fetched and extracted at the same time
+        lock_path: Lock file recording the zip checksums (None disables it)
+        extract_workers: Threads extracting the members of one zip
+        extract: Extract the zips; with False they are only fetched and verified
 
     Returns:
-        Path to merged directory
+        Extracted dataset directories (zip paths if extract is False)
     """
-    if datasets is None:
-        datasets = [config["name"] for config in DATASET_CONFIGS]
+    member_filters = {
+        config["name"]: consolidation_filter(config)
+        for config in DATASET_CONFIGS
+        if config["name"] in datasets
+    }
+    return fetch_datasets(
+        datasets, raw_dir, mirror, workers, lock_path, member_filters, extract_workers, extract
+    )
 
-    os.makedirs(merged_dir, exist_ok=True)
-    for cls in CANONICAL_CLASSES:
-        os.makedirs(os.path.join(merged_dir, cls), exist_ok=True)
 
-    count = 0
+def consolidation_filter(config: Dict) -> ExtractionFilter:
+    """Zip members consolidation reads for a dataset config: images in mapped class folders."""
+    folders = [f"{config['path']}/{label}".strip("/") for label in config["class_mappings"]]
+    return ExtractionFilter(frozenset(folders), frozenset(IMAGE_EXTS))
+
+
+class ConsolidationTask(NamedTuple):
+    src: str
+    dst: str
+    group: str  # "<dataset slug>/<original label>"
+    signature: FileSignature
+
+
+def _collect_consolidation_tasks(
+    raw_dir: str, merged_dir: str, datasets: List[str]
+) -> Tuple[List[ConsolidationTask], Set[str]]:
+    """List source images and their destinations for the configured class folders.
+
+    Returns:
+        Tuple of (tasks, groups of the class folders that were scanned)
+    """
+    tasks = []
+    scanned = set()
     for config in DATASET_CONFIGS:
         if config["name"] not in datasets:
             continue
@@ -239,46 +281,331 @@ def consolidate_datasets_explicit(raw_dir: str, merged_dir: str, datasets: List[
                 print(f"[WARN] Class directory not found: {class_dir}")
                 continue
 
-            for f in class_dir.iterdir():
-                if not f.is_file():
-                    continue
-                ext = f.suffix.lower()
-                if ext not in IMAGE_EXTS:
-                    continue
-
-                # Validate image
-                try:
-                    from PIL import Image
-
-                    with Image.open(f) as im:
-                        im.load()
-                        if im.format not in ("JPEG", "PNG"):
-                            print(f"[WARN] Skipping unsupported format: {f} ({im.format})")
-                            continue
-                except Exception:
-                    print(f"[WARN] Skipping invalid image: {f}")
+            group = f"{config['slug']}/{original_label}"
+            scanned.add(group)
+            # scandir hands back the stat info the manifest needs without extra calls
+            with os.scandir(class_dir) as entries:
+                files = sorted(
+                    (entry for entry in entries if entry.is_file()), key=lambda e: e.name
+                )
+            for entry in files:
+                if os.path.splitext(entry.name)[1].lower() not in IMAGE_EXTS:
                     continue
-
                 dst = os.path.join(
-                    merged_dir, canonical, f"{config['slug']}_{original_label}_{f.name}"
+                    merged_dir, canonical, f"{config['slug']}_{original_label}_{entry.name}"
+                )
+                tasks.append(
+                    ConsolidationTask(entry.path, dst, group, file_signature(entry.stat()))
                 )
-                if not os.path.exists(dst):
-                    try:
-                        os.link(str(f), dst)  # hard link to save space
-                    except OSError:
-                        import shutil
+    return tasks, scanned
+
 
-                        shutil.copy2(str(f), dst)
-                    count += 1
+def _collect_archive_tasks(
+    raw_dir: str, merged_dir: str, datasets: List[str]
+) -> Tuple[List[ConsolidationTask], Set[str]]:
+    """Like _collect_consolidation_tasks, but reading the dataset zips instead of folders.
+
+    Sources are zip member paths (see zip_dataset.py). The manifest signature of a
+    member is its uncompressed size, CRC-32 and offset in the archive.
+    """
+    tasks = []
+    scanned = set()
+    for config in DATASET_CONFIGS:
+        if config["name"] not in datasets:
+            continue
+
+        zip_path = os.path.abspath(os.path.join(raw_dir, f"{config['slug']}.zip"))
+        if not os.path.exists(zip_path):
+            print(f"[SKIP] Dataset zip not found: {zip_path}")
+            continue
+
+        print(f"Processing dataset: {config['name']} (from {os.path.basename(zip_path)})")
+
+        member_filter = consolidation_filter(config)
+        labels = {
+            f"{config['path']}/{label}".strip("/"): (label, canonical)
+            for label, canonical in config["class_mappings"].items()
+        }
+        members = sorted(
+            (m for m in load_zip_index(zip_path).values() if member_filter.matches(m.name)),
+            key=lambda m: m.name,
+        )
+        for member in members:
+            folder, _, filename = member.name.rpartition("/")
+            original_label, canonical = labels[folder]
+            group = f"{config['slug']}/{original_label}"
+            scanned.add(group)
+            dst = os.path.join(
+                merged_dir, canonical, f"{config['slug']}_{original_label}_{filename}"
+            )
+            signature = FileSignature(member.file_size, member.crc, member.header_offset)
+            tasks.append(
+                ConsolidationTask(member_path(zip_path, member.name), dst, group, signature)
+            )
+    return tasks, scanned
+
+
+def _check_source(
+    path: str, level: str, fingerprint: bool
+) -> Tuple[IntegrityResult, Optional[Fingerprint]]:
+    """Validate one source and, if it is valid and fingerprint is set, fingerprint it."""
+    result = check_image(path, level)
+    if result.problem is not None or not fingerprint:
+        return result, None
+    return result, image_fingerprint(path)
+
+
+def _iter_validated(
+    paths: List[str], workers: int, level: str, fingerprint: bool = False
+) -> Iterator[Tuple[IntegrityResult, Optional[Fingerprint]]]:
+    """Validate paths in a process pool, yielding results in input order as they finish."""
+    check = partial(_check_source, level=level, fingerprint=fingerprint)
+    if workers <= 1 or len(paths) < 2:
+        yield from map(check, paths)
+        return
+    # Small chunks keep results streaming back while amortizing IPC overhead
+    chunksize = max(1, min(64, len(paths) // (workers * 4)))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(check, paths, chunksize=chunksize)
+
+
+def _remove_destination(dst: str) -> None:
+    if os.path.exists(dst):
+        os.remove(dst)
+
+
+def _link_or_copy(src: str, dst: str) -> None:
+    try:
+        os.link(src, dst)  # hard link to save space
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def consolidate_datasets_explicit(
+    raw_dir: str,
+    merged_dir: str,
+    datasets: List[str] = None,
+    workers: Optional[int] = None,
+    validation: str = "structure",
+    incremental: bool = True,
+    from_zips: bool = False,
+    dedup_radius: Optional[int] = DEFAULT_DEDUP_RADIUS,
+) -> str:
+    """Consolidate datasets using explicit configurations for precise control.
 
-    print(f"Consolidated {count} images into {merged_dir} using explicit configs")
+    Images are validated (and fingerprinted for duplicate detection) in a pool of worker
+    processes, then every accepted image is linked (or copied) into merged_dir.
+    Validation is tiered (see image_integrity.py): files failing the header or
+    structure check are fully decoded before being rejected.
+
+    With incremental=True a manifest in merged_dir (see consolidation_manifest.py)
+    remembers every source's size, mtime, inode, validation result and fingerprint.
+    Unchanged sources skip validation, modified ones are re-validated and re-linked, and
+    images whose source disappeared from a scanned class folder are removed from merged_dir.
+
+    With from_zips=True images are validated straight from raw_dir/<slug>.zip and
+    nothing is extracted or linked: merged_dir gets a virtual index that maps merged
+    paths to zip members instead (see zip_dataset.py).
+
+    Unless dedup_radius is None, byte-identical images across all sources are collapsed
+    to one canonical image, and with a positive dedup_radius near duplicates of it too
+    (see duplicate_index.py); the clusters are written to merged_dir/duplicates.json.
+
+    Args:
+        raw_dir: Directory containing extracted datasets
+        merged_dir: Directory to consolidate images into
+        datasets: List of dataset names to process (defaults to all in DATASET_CONFIGS)
+        workers: Validation processes (defaults to the CPU count, 1 validates inline)
+        validation: Integrity level, one of "header", "structure" or "full"
+        incremental: Reuse and update the manifest instead of re-validating everything
+        from_zips: Read the dataset zips in place and build a virtual merged dataset
+        dedup_radius: Maximum perceptual-hash Hamming distance of near duplicates to
+            their canonical image (0 collapses byte-identical copies only, None keeps
+            duplicates)
+
+    Returns:
+        Path to merged directory
+    """
+    if datasets is None:
+        datasets = [config["name"] for config in DATASET_CONFIGS]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if validation not in VALIDATION_LEVELS:
+        raise ValueError(f"validation must be one of {VALIDATION_LEVELS}, got {validation!r}")
+    dedup = dedup_radius is not None
+
+    os.makedirs(merged_dir, exist_ok=True)
+    for cls in CANONICAL_CLASSES:
+        os.makedirs(os.path.join(merged_dir, cls), exist_ok=True)
+
+    collect = _collect_archive_tasks if from_zips else _collect_consolidation_tasks
+    tasks, scanned_groups = collect(raw_dir, merged_dir, datasets)
+
+    manifest = None
+    known = {}
+    if incremental:
+        manifest = ConsolidationManifest(os.path.join(merged_dir, MANIFEST_NAME))
+        known = manifest.load()
+
+    unchanged = 0
+    to_check = []
+    accepted: Dict[str, ManifestEntry] = {}
+    for task in tasks:
+        entry = known.get(task.src)
+        if not is_reusable(entry, task.signature, validation) or (
+            dedup and entry.problem is None and entry.content_hash is None
+        ):
+            to_check.append(task)
+            continue
+        unchanged += 1
+        if entry.problem is None:
+            accepted[task.src] = entry
+
+    if incremental:
+        print(f"{unchanged} images unchanged since the last run, {len(to_check)} to validate")
+    print(f"Validating {len(to_check)} images ({validation} check) with {workers} worker(s)")
+
+    report = IntegrityReport(validation)
+    results = []
+    sources = [task.src for task in to_check]
+    try:
+        checked = _iter_validated(sources, workers, validation, fingerprint=dedup)
+        for task, (result, fingerprint) in zip(to_check, checked):
+            report.add(result)
+            entry = ManifestEntry(
+                task.signature,
+                validation,
+                result.problem,
+                task.dst,
+                task.group,
+                *(fingerprint or (None, None)),
+            )
+            results.append((task.src, entry))
+            if manifest is not None and len(results) >= 1000:
+                manifest.record(results)
+                results = []
+            previous = known.get(task.src)
+            if result.problem is not None:
+                print(result.problem)
+                if previous is not None and previous.problem is None:
+                    # Accepted before, rejected now: drop the merged copy; the rejection
+                    # recorded above replaces its accepted manifest row
+                    _remove_destination(previous.dst)
+                continue
+            accepted[task.src] = entry
+            if previous is not None and previous.signature != task.signature:
+                # The source changed since it was linked; drop the stale copy
+                _remove_destination(task.dst)
+    finally:
+        if manifest is not None:
+            manifest.record(results)
+
+    for line in report.lines():
+        print(line)
+
+    if manifest is not None:
+        pruned = _prune_removed_sources(manifest, known, tasks, scanned_groups)
+        if pruned:
+            print(f"Removed {pruned} images whose source no longer exists")
+        # The manifest also covers datasets not scanned this run
+        accepted = {src: entry for src, entry in manifest.load().items() if entry.problem is None}
+        manifest.close()
+
+    duplicates = _collapse_duplicates(accepted, merged_dir, dedup_radius) if dedup else set()
+
+    count = 0
+    virtual = []
+    scanned_sources = {task.src for task in tasks}
+    for src, entry in accepted.items():
+        if src in duplicates:
+            continue
+        if split_member_path(src) is not None:
+            virtual.append((entry.dst, src))
+        elif src in scanned_sources and not os.path.exists(entry.dst):
+            _link_or_copy(src, entry.dst)
+            count += 1
+
+    if from_zips or virtual or os.path.exists(os.path.join(merged_dir, VIRTUAL_INDEX_NAME)):
+        indexed = write_virtual_index(merged_dir, virtual)
+        print(f"Indexed {indexed} archived images into {merged_dir} (virtual dataset)")
+    if not from_zips:
+        print(f"Consolidated {count} images into {merged_dir} using explicit configs")
     return merged_dir
 
 
+def _collapse_duplicates(
+    accepted: Dict[str, ManifestEntry], merged_dir: str, radius: int
+) -> Set[str]:
+    """Find duplicate clusters among accepted images and remove all but one of each.
+
+    Returns:
+        Sources left out of the merged dataset
+    """
+    images = {
+        src: (Fingerprint(entry.content_hash, entry.dhash), entry.signature.size)
+        for src, entry in accepted.items()
+        if entry.content_hash is not None
+    }
+    clusters = find_duplicate_clusters(images, radius)
+    report_path = os.path.join(merged_dir, DUPLICATE_REPORT_NAME)
+    destinations = {src: accepted[src].dst for src in images}
+    summary = write_duplicate_report(report_path, clusters, destinations, radius, merged_dir)
+
+    dropped = {src for cluster in clusters for src, _ in cluster.duplicates}
+    for src in dropped:
+        # Drop links made before the image was known to be a duplicate
+        if os.path.exists(accepted[src].dst):
+            os.remove(accepted[src].dst)
+    print(
+        f"Duplicates (radius {radius}): {summary['clusters']} clusters, "
+        f"{summary['removed']} images left out ({summary['exact']} exact, "
+        f"{summary['near']} near), {summary['cross_class_clusters']} clusters span "
+        f"several classes. Details: {report_path}"
+    )
+    return dropped
+
+
+def _prune_removed_sources(
+    manifest: ConsolidationManifest,
+    known: Dict[str, ManifestEntry],
+    tasks: List[ConsolidationTask],
+    scanned_groups: Set[str],
+) -> int:
+    """Delete merged images (and manifest rows) whose source left a scanned class folder.
+
+    Datasets or class folders that were not scanned this run (e.g. raw data deleted
+    after preparation) are left alone.
+
+    Returns:
+        Number of merged images removed
+    """
+    present = {task.src for task in tasks}
+    stale = [
+        src for src, entry in known.items() if entry.group in scanned_groups and src not in present
+    ]
+    removed = 0
+    for src in stale:
+        entry = known[src]
+        if entry.problem is None and os.path.exists(entry.dst):
+            os.remove(entry.dst)
+            removed += 1
+    manifest.remove(stale)
+    return removed
+
+
 def prepare_datasets(
     raw_dir: str = "raw_datasets",
     merged_dir: str = "merged_dataset",
     datasets: List[str] = None,
+    workers: Optional[int] = None,
+    validation: str = "structure",
+    incremental: bool = True,
+    mirror: Optional[str] = None,
+    fetch_workers: Optional[int] = None,
+    from_zips: bool = False,
+    dedup_radius: Optional[int] = DEFAULT_DEDUP_RADIUS,
+    resized_dir: Optional[str] = None,
+    max_side: int = DEFAULT_MAX_SIDE,
 ) -> str:
     """Prepare datasets by downloading and consolidating them.
 
@@ -286,6 +613,16 @@ def prepare_datasets(
         raw_dir: Directory for raw/extracted datasets
         merged_dir: Directory for consolidated dataset
         datasets: List of dataset names to process
+        workers: Image validation processes (defaults to the CPU count)
+        validation: Image integrity level ("header", "structure" or "full")
+        incremental: Only validate images that changed since the last consolidation
+        mirror: Directory with pre-downloaded dataset zips to use instead of Kaggle
+        fetch_workers: Datasets downloaded and extracted concurrently
+        from_zips: Skip extraction and build a virtual merged dataset over the zips
+        dedup_radius: Near-duplicate perceptual-hash distance (0 collapses exact copies
+            only, None keeps duplicates)
+        resized_dir: Also write a copy with the long side capped at max_side here
+        max_side: Maximum image side in resized_dir
 
     Returns:
         Path to merged dataset directory
@@ -298,18 +635,79 @@ def prepare_datasets(
     print(f"Merged directory: {merged_dir}")
 
     # Download and extract datasets
-    ensure_kaggle_download(datasets, raw_dir)
+    ensure_kaggle_download(datasets, raw_dir, mirror, fetch_workers, extract=not from_zips)
 
     # Consolidate datasets
-    return consolidate_datasets_explicit(raw_dir, merged_dir, datasets)
+    merged = consolidate_datasets_explicit(
+        raw_dir, merged_dir, datasets, workers, validation, incremental, from_zips, dedup_radius
+    )
+
+    if resized_dir is not None:
+        build_resized_cache(merged, resized_dir, max_side, workers)
+    return merged
 
 
 def get_canonical_classes() -> list[str]:
     return CANONICAL_CLASSES
 
 
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Download, validate and consolidate the waste datasets",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--raw-dir", default="raw_datasets", help="Raw/extracted datasets")
+    parser.add_argument("--merged-dir", default="merged_dataset", help="Consolidated dataset")
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Image validation processes (default: CPUs)"
+    )
+    parser.add_argument(
+        "--validation", choices=VALIDATION_LEVELS, default="structure", help="Integrity level"
+    )
+    parser.add_argument(
+        "--rescan", action="store_true", help="Ignore the manifest and re-validate every image"
+    )
+    parser.add_argument("--mirror", default=None, help="Directory with pre-downloaded zips")
+    parser.add_argument(
+        "--fetch-workers", type=int, default=None, help="Datasets fetched concurrently"
+    )
+    parser.add_argument(
+        "--from-zips", action="store_true", help="Build a virtual merged dataset over the zips"
+    )
+    parser.add_argument(
+        "--dedup-radius",
+        type=int,
+        default=DEFAULT_DEDUP_RADIUS,
+        help="Also collapse near duplicates within this perceptual-hash distance",
+    )
+    parser.add_argument(
+        "--keep-duplicates", action="store_true", help="Do not collapse duplicate images"
+    )
+    parser.add_argument("--resized-dir", default=None, help="Also write a capped-size copy here")
+    parser.add_argument(
+        "--max-side", type=int, default=DEFAULT_MAX_SIDE, help="Long side in --resized-dir"
+    )
+    args = parser.parse_args()
+    if args.dedup_radius < 0:
+        parser.error("--dedup-radius must be 0 or more")
+    prepare_datasets(
+        args.raw_dir,
+        args.merged_dir,
+        workers=args.workers,
+        validation=args.validation,
+        incremental=not args.rescan,
+        mirror=args.mirror,
+        fetch_workers=args.fetch_workers,
+        from_zips=args.from_zips,
+        dedup_radius=None if args.keep_duplicates else args.dedup_radius,
+        resized_dir=args.resized_dir,
+        max_side=args.max_side,
+    )
+
+
 __all__ = [
     "ensure_kaggle_download",
+    "consolidation_filter",
     "consolidate_datasets_explicit",
     "prepare_datasets",
     "get_canonical_classes",
@@ -317,3 +715,7 @@ __all__ = [
     "DATASET_SLUGS",
     "DATASET_CONFIGS",
 ]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""Exact and near-duplicate detection across the consolidated sources.
+
+Several Kaggle datasets redistribute the same base images. During consolidation every
+accepted image gets two fingerprints: a BLAKE2b content hash (byte-identical copies)
+and a 64-bit dHash of a 9x8 grayscale thumbnail (re-encodes, resizes, small edits).
+Images with the same content hash, or whose dHashes are within a Hamming radius of a
+cluster's canonical image, are grouped into clusters (a BK-tree of the canonical hashes
+answers the radius queries). Matches are not transitive: with single linkage, images on
+a plain background chain into huge clusters of unrelated objects. Each cluster keeps one
+canonical image and the rest are left out of the merged dataset, so they are not
+labeled, trained on or split across train/val/test. Near duplicates are only collapsed
+with a positive radius; the default collapses byte-identical copies only.
+"""
+
+import hashlib
+import io
+import json
+import os
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from PIL import Image
+
+from zip_dataset import read_image_bytes
+
+DEFAULT_DEDUP_RADIUS = 0  # Byte-identical copies only; near duplicates are opt-in
+REPORT_NAME = "duplicates.json"
+HASH_SIZE = 8  # dHash of (HASH_SIZE + 1) x HASH_SIZE pixels -> 64 bits
+DRAFT_SIZE = 256  # JPEG draft target, see dhash
+DHASH_VERSION = 2  # Bumped whenever dhash changes, so stored hashes get recomputed
+
+
+class Fingerprint(NamedTuple):
+    content_hash: str
+    dhash: int
+
+
+def dhash(image: Image.Image) -> int:
+    """Difference hash: one bit per horizontally adjacent pixel pair of a tiny thumbnail."""
+    # draft() lets the JPEG decoder downscale by up to 8x while decoding. The target is
+    # fixed and well above the thumbnail: drafting close to it would leave a rescaled copy
+    # at a very different intermediate size than its original, and their hashes would drift
+    image.draft("L", (DRAFT_SIZE, DRAFT_SIZE))
+    thumb = image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BOX)
+    pixels = list(thumb.getdata())
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def image_fingerprint(path: str) -> Optional[Fingerprint]:
+    """Content hash and dHash of an image (regular, zip member or virtual path).
+
+    Returns:
+        The fingerprint, or None if the image cannot be read
+    """
+    try:
+        data = read_image_bytes(path)
+        content_hash = hashlib.blake2b(data, digest_size=16).hexdigest()
+        with Image.open(io.BytesIO(data)) as image:
+            return Fingerprint(content_hash, dhash(image))
+    except Exception:
+        return None
+
+
+class BKTree:
+    """Burkhard-Keller tree over 64-bit hashes with Hamming distance.
+
+    Children are keyed by their distance to the parent, so by the triangle inequality a
+    radius-r query only descends into children whose key is within r of the query's
+    distance to the node.
+    """
+
+    def __init__(self):
+        self._root: Optional[Tuple[int, List[int], Dict[int, tuple]]] = None
+
+    def add(self, value: int, item: int) -> None:
+        """Insert value; item identifies it in query results (equal values share a node)."""
+        if self._root is None:
+            self._root = (value, [item], {})
+            return
+        node = self._root
+        while True:
+            distance = (value ^ node[0]).bit_count()
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (value, [item], {})
+                return
+            node = child
+
+    def query(self, value: int, radius: int) -> List[Tuple[int, int]]:
+        """(item, distance) for every stored value within radius of value."""
+        found = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node_value, items, children = stack.pop()
+            distance = (value ^ node_value).bit_count()
+            if distance <= radius:
+                found.extend((item, distance) for item in items)
+            for key, child in children.items():
+                if distance - radius <= key <= distance + radius:
+                    stack.append(child)
+        return found
+
+
+class DuplicateCluster(NamedTuple):
+    canonical: str
+    duplicates: List[Tuple[str, int]]  # (source, Hamming distance to canonical; 0 = exact)
+
+
+def find_duplicate_clusters(
+    images: Dict[str, Tuple[Fingerprint, int]], radius: int = DEFAULT_DEDUP_RADIUS
+) -> List[DuplicateCluster]:
+    """Group images that are byte-identical or whose dHashes are within radius.
+
+    Args:
+        images: source -> (fingerprint, file size)
+        radius: Maximum dHash Hamming distance between a near duplicate and its
+            canonical image (0: byte-identical copies only)
+
+    Returns:
+        Clusters with more than one image. The canonical image is the largest file
+        (ties broken by source path), on the assumption that it is the least recompressed.
+    """
+    # Preferred canonical first: the largest file, ties broken by source path
+    sources = sorted(images, key=lambda src: (-images[src][1], src))
+    centre_of: Dict[str, str] = {}
+
+    # Exact copies first; only the first source of each content hash is hashed further
+    representative: Dict[str, str] = {}
+    for src in sources:
+        content_hash = images[src][0].content_hash
+        if content_hash in representative:
+            centre_of[src] = representative[content_hash]
+        else:
+            representative[content_hash] = src
+
+    # Near duplicates: greedy centres. A representative joins the nearest existing centre
+    # within radius, otherwise it becomes a centre itself. Only centres enter the tree, so
+    # every member is within radius of its canonical and matches cannot chain
+    tree = BKTree()
+    centres = list(representative.values())
+    for i, src in enumerate(centres):
+        value = images[src][0].dhash
+        matches = tree.query(value, radius) if radius > 0 else []
+        if matches:
+            j, _ = min(matches, key=lambda match: (match[1], match[0]))
+            centre_of[src] = centres[j]
+        else:
+            tree.add(value, i)
+
+    members: Dict[str, List[str]] = {}
+    for src, centre in centre_of.items():
+        # Exact copies of a near duplicate belong to that duplicate's centre
+        members.setdefault(centre_of.get(centre, centre), []).append(src)
+
+    clusters = []
+    for canonical, group in members.items():
+        canonical_hash = images[canonical][0]
+        duplicates = []
+        for src in group:
+            fingerprint = images[src][0]
+            distance = (
+                0
+                if fingerprint.content_hash == canonical_hash.content_hash
+                else (fingerprint.dhash ^ canonical_hash.dhash).bit_count()
+            )
+            duplicates.append((src, distance))
+        clusters.append(DuplicateCluster(canonical, sorted(duplicates)))
+    return sorted(clusters)
+
+
+def write_duplicate_report(
+    path: str,
+    clusters: Iterable[DuplicateCluster],
+    destinations: Dict[str, str],
+    radius: int,
+    root: str,
+) -> Dict:
+    """Write the clusters as JSON, with merged paths relative to root.
+
+    Returns:
+        The summary section of the report
+    """
+    clusters = list(clusters)
+
+    def describe(src: str) -> Dict:
+        dst = destinations[src]
+        return {
+            "merged": os.path.relpath(dst, root),
+            "class": os.path.basename(os.path.dirname(dst)),
+            "source": src,
+        }
+
+    entries = []
+    cross_class = 0
+    for cluster in clusters:
+        canonical = describe(cluster.canonical)
+        duplicates = [dict(describe(src), distance=d) for src, d in cluster.duplicates]
+        classes = sorted({canonical["class"], *(d["class"] for d in duplicates)})
+        cross_class += len(classes) > 1
+        entries.append({"canonical": canonical, "duplicates": duplicates, "classes": classes})
+
+    duplicates = [d for cluster in clusters for _, d in cluster.duplicates]
+    summary = {
+        "radius": radius,
+        "clusters": len(clusters),
+        "removed": len(duplicates),
+        "exact": sum(d == 0 for d in duplicates),
+        "near": sum(d > 0 for d in duplicates),
+        "cross_class_clusters": cross_class,
+    }
+    with open(path, "w") as f:
+        json.dump({"summary": summary, "clusters": entries}, f, indent=2)
+    return summary
+
+
+__all__ = [
+    "DEFAULT_DEDUP_RADIUS",
+    "REPORT_NAME",
+    "DHASH_VERSION",
+    "Fingerprint",
+    "BKTree",
+    "DuplicateCluster",
+    "dhash",
+    "image_fingerprint",
+    "find_duplicate_clusters",
+    "write_duplicate_report",
+]
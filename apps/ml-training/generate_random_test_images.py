@@ -27,6 +27,8 @@ import json
 from PIL import Image
 import os
 
+from image_index import index_files
+
 IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
 
 
@@ -39,20 +41,11 @@ def collect_images(dataset_dir: Path):
     if not dataset_dir.exists():
         raise FileNotFoundError(f"Dataset directory not found: {dataset_dir}")
 
-    for child in sorted(dataset_dir.iterdir()):
-        if child.is_dir():
-            imgs = [p for p in child.rglob("*") if p.suffix.lower() in IMAGE_EXTENSIONS]
-            if imgs:
-                classes[child.name] = imgs
-    # Also include any images in root by using key '__root__'
-    root_imgs = [
-        p
-        for p in dataset_dir.rglob("*")
-        if p.parent == dataset_dir and p.suffix.lower() in IMAGE_EXTENSIONS
-    ]
-    if root_imgs:
-        classes.setdefault("__root__", []).extend(root_imgs)
-    return classes
+    for indexed in index_files(str(dataset_dir), IMAGE_EXTENSIONS):
+        top, sep, _ = indexed.relpath.partition(os.sep)
+        # Images directly in the root go under '__root__'
+        classes.setdefault(top if sep else "__root__", []).append(dataset_dir / indexed.relpath)
+    return {k: classes[k] for k in sorted(classes, key=lambda k: (k == "__root__", k))}
 
 
 def sample_images(classes_dict, num: int, per_class: bool, seed: int):
@@ -0,0 +1,155 @@
+"""Cached index of the files under a dataset directory.
+
+Labeling, conversion, splitting, visualization and test-image sampling all need the
+image files under a folder, and each used to walk the tree on its own (often once per
+extension). index_files walks a tree with os.scandir once and persists, per directory,
+its mtime, subdirectories and files (name, size, mtime). Later calls stat each
+directory and only re-list those whose mtime changed, i.e. where entries were added,
+removed or renamed; unchanged directories cost one stat instead of a listing.
+
+The index is stored next to the directory as ``.<name>.image_index.json``, so writing
+it does not touch the indexed directory's own mtime. If that location is not writable
+the index is kept in memory for the current process only.
+"""
+
+import json
+import os
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+INDEX_VERSION = 1
+# A directory modified this recently may change again within the same mtime tick
+RACY_WINDOW_NS = 2_000_000_000
+
+_memory: Dict[str, Dict[str, Dict]] = {}
+
+
+class IndexedFile(NamedTuple):
+    relpath: str  # Relative to the indexed root, os.sep separated
+    stem: str
+    size: int
+    mtime_ns: int
+
+
+def index_path(root: str) -> str:
+    """Location of root's persisted index (next to root, not inside it)."""
+    root = os.path.abspath(root)
+    return os.path.join(os.path.dirname(root), f".{os.path.basename(root)}.image_index.json")
+
+
+def _load(root: str) -> Dict[str, Dict]:
+    if root in _memory:
+        return _memory[root]
+    try:
+        with open(index_path(root)) as f:
+            stored = json.load(f)
+        if stored.get("version") == INDEX_VERSION and stored.get("root") == root:
+            return stored["dirs"]
+    except (OSError, ValueError):
+        pass
+    return {}
+
+
+def _save(root: str, dirs: Dict[str, Dict]) -> None:
+    _memory[root] = dirs
+    path = index_path(root)
+    tmp = path + ".tmp"
+    try:
+        with open(tmp, "w") as f:
+            json.dump({"version": INDEX_VERSION, "root": root, "dirs": dirs}, f)
+        os.replace(tmp, path)
+    except OSError:
+        pass  # Read-only parent: keep the in-memory index
+
+
+def _list_dir(path: str) -> Tuple[List[str], List[List]]:
+    """Subdirectory names and [name, size, mtime_ns] of the files in path."""
+    subdirs, files = [], []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+                elif entry.is_file():
+                    stat = entry.stat()
+                    files.append([entry.name, stat.st_size, stat.st_mtime_ns])
+            except OSError:
+                continue  # Vanished while listing
+    return sorted(subdirs), sorted(files)
+
+
+def refresh_index(root: str) -> Dict[str, Dict]:
+    """Bring root's index up to date and return it (relative dir -> directory entry).
+
+    Raises:
+        FileNotFoundError: If root does not exist
+    """
+    root = os.path.abspath(root)
+    cached = _load(root)
+    dirs: Dict[str, Dict] = {}
+    changed = False
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        path = os.path.join(root, rel_dir) if rel_dir else root
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            if not rel_dir:
+                raise
+            changed = True
+            continue
+        entry = cached.get(rel_dir)
+        if entry is None or entry["mtime_ns"] != mtime_ns:
+            subdirs, files = _list_dir(path)
+            if time.time_ns() - mtime_ns < RACY_WINDOW_NS:
+                mtime_ns = -1  # Never matches, so the next call lists it again
+            entry = {"mtime_ns": mtime_ns, "dirs": subdirs, "files": files}
+            changed = True
+        dirs[rel_dir] = entry
+        stack.extend(os.path.join(rel_dir, d) if rel_dir else d for d in entry["dirs"])
+    if changed or len(dirs) != len(cached):
+        _save(root, dirs)
+    else:
+        _memory[root] = dirs
+    return dirs
+
+
+def index_files(
+    root: str, extensions: Optional[Iterable[str]] = IMAGE_EXTENSIONS
+) -> List[IndexedFile]:
+    """Files under root with one of the (case-insensitive) extensions, sorted by path.
+
+    Args:
+        root: Directory to index
+        extensions: Extensions including the dot, or None for every file
+
+    Returns:
+        Indexed files with paths relative to root
+    """
+    if extensions is not None:
+        extensions = tuple(ext.lower() for ext in extensions)
+    found = []
+    for rel_dir, entry in refresh_index(root).items():
+        for name, size, mtime_ns in entry["files"]:
+            stem, ext = os.path.splitext(name)
+            if extensions is None or ext.lower() in extensions:
+                relpath = os.path.join(rel_dir, name) if rel_dir else name
+                found.append(IndexedFile(relpath, stem, size, mtime_ns))
+    return sorted(found)
+
+
+def image_paths(root: str, extensions: Iterable[str] = IMAGE_EXTENSIONS) -> List[str]:
+    """Full paths of the image files under root, sorted."""
+    return [os.path.join(root, f.relpath) for f in index_files(root, extensions)]
+
+
+__all__ = [
+    "IMAGE_EXTENSIONS",
+    "IndexedFile",
+    "index_path",
+    "refresh_index",
+    "index_files",
+    "image_paths",
+]
@@ -0,0 +1,212 @@
+"""Tiered image integrity checks used when consolidating datasets.
+
+Levels, cheapest first:
+    header     PIL lazy open: the file parses as JPEG/PNG and has a non-empty size
+    structure  header, plus JPEG marker segments and EOI, or PNG chunk CRCs and IEND,
+               checked on the raw bytes without decoding pixels
+    full       complete pixel decode
+
+A file that fails a cheaper level is re-checked with a full decode before it is
+rejected, so only suspicious files (or every file, with level="full") pay for decoding.
+Paths may also be zip members or virtual dataset paths (see zip_dataset.py).
+"""
+
+import time
+import zipfile
+import zlib
+from typing import List, NamedTuple, Optional, Tuple
+
+from PIL import Image
+
+from zip_dataset import open_image_file, read_image_bytes
+
+VALIDATION_LEVELS = ("header", "structure", "full")
+SUPPORTED_FORMATS = ("JPEG", "PNG")
+
+JPEG_SOI = b"\xff\xd8"
+JPEG_EOI = b"\xff\xd9"
+JPEG_SOS = 0xDA
+# Markers without a length field: TEM and RST0-7 (SOI/EOI are handled separately)
+JPEG_STANDALONE_MARKERS = {0x01, *range(0xD0, 0xD8)}
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+class IntegrityResult(NamedTuple):
+    """Outcome of check_image for one file."""
+
+    problem: Optional[str]  # None if the image is valid
+    times: Tuple[float, float, float]  # Seconds spent on the header, structure and full levels
+
+
+def check_header(path: str) -> Tuple[Optional[str], Optional[str]]:
+    """Parse only the image header.
+
+    Returns:
+        Tuple of (PIL format, problem or None)
+    """
+    try:
+        with open_image_file(path) as f, Image.open(f) as im:
+            fmt = im.format
+            width, height = im.size
+    except Exception as e:
+        return None, f"unreadable header ({e})"
+    if fmt not in SUPPORTED_FORMATS:
+        return fmt, f"unsupported format ({fmt})"
+    if width <= 0 or height <= 0:
+        return fmt, f"empty image ({width}x{height})"
+    return fmt, None
+
+
+def check_jpeg_structure(data: bytes) -> Optional[str]:
+    """Walk the JPEG marker segments up to the first scan and look for EOI after it."""
+    if not data.startswith(JPEG_SOI):
+        return "missing JPEG SOI marker"
+
+    pos = len(JPEG_SOI)
+    while True:
+        if pos + 4 > len(data):
+            return "truncated before the first scan"
+        if data[pos] != 0xFF:
+            return f"bad marker at byte {pos}"
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            pos += 1  # Fill byte
+            continue
+        if marker in JPEG_STANDALONE_MARKERS:
+            pos += 2
+            continue
+        if marker == JPEG_EOI[1]:
+            return "EOI before the first scan"
+        length = int.from_bytes(data[pos + 2 : pos + 4], "big")
+        if length < 2 or pos + 2 + length > len(data):
+            return f"truncated segment 0x{marker:02X} at byte {pos}"
+        pos += 2 + length
+        if marker == JPEG_SOS:
+            break
+
+    # Entropy-coded data byte-stuffs 0xFF, so FF D9 after the scan header can only be EOI
+    if data.find(JPEG_EOI, pos) == -1:
+        return "missing JPEG EOI marker (truncated scan data)"
+    return None
+
+
+def check_png_structure(data: bytes) -> Optional[str]:
+    """Verify every PNG chunk's length and CRC and that the stream ends with IEND."""
+    if not data.startswith(PNG_SIGNATURE):
+        return "missing PNG signature"
+
+    pos = len(PNG_SIGNATURE)
+    first = True
+    while pos + 12 <= len(data):
+        length = int.from_bytes(data[pos : pos + 4], "big")
+        chunk_type = data[pos + 4 : pos + 8]
+        end = pos + 12 + length
+        if end > len(data):
+            return f"truncated {chunk_type.decode('latin-1')} chunk at byte {pos}"
+        if first and chunk_type != b"IHDR":
+            return "first chunk is not IHDR"
+        crc = int.from_bytes(data[end - 4 : end], "big")
+        if zlib.crc32(data[pos + 4 : end - 4]) != crc:
+            return f"CRC mismatch in {chunk_type.decode('latin-1')} chunk at byte {pos}"
+        if chunk_type == b"IEND":
+            return None
+        first = False
+        pos = end
+    return "missing PNG IEND chunk"
+
+
+def check_structure(path: str, fmt: str) -> Optional[str]:
+    """Structural check for a file whose header reported fmt."""
+    data = read_image_bytes(path)
+    if fmt == "JPEG":
+        return check_jpeg_structure(data)
+    return check_png_structure(data)
+
+
+def check_full(path: str) -> Optional[str]:
+    """Decode every pixel."""
+    try:
+        with open_image_file(path) as f, Image.open(f) as im:
+            im.load()
+            if im.format not in SUPPORTED_FORMATS:
+                return f"unsupported format ({im.format})"
+    except Exception as e:
+        return f"decode failed ({e})"
+    return None
+
+
+def check_image(path: str, level: str = "structure") -> IntegrityResult:
+    """Check one image at the given level, escalating failures to a full decode.
+
+    Module-level so it can run in worker processes.
+    """
+    if level not in VALIDATION_LEVELS:
+        raise ValueError(f"level must be one of {VALIDATION_LEVELS}, got {level!r}")
+
+    times = [0.0, 0.0, 0.0]
+    start = time.perf_counter()
+    fmt, problem = check_header(path)
+    times[0] = time.perf_counter() - start
+    if fmt is not None and fmt not in SUPPORTED_FORMATS:
+        # A full decode cannot make an unsupported format acceptable
+        return IntegrityResult(f"[WARN] Skipping unsupported format: {path} ({fmt})", tuple(times))
+
+    if problem is None and level == "structure":
+        start = time.perf_counter()
+        try:
+            problem = check_structure(path, fmt)
+        except (OSError, zipfile.BadZipFile) as e:
+            problem = f"unreadable ({e})"
+        times[1] = time.perf_counter() - start
+
+    if problem is not None or level == "full":
+        start = time.perf_counter()
+        problem = check_full(path)
+        times[2] = time.perf_counter() - start
+
+    if problem is not None:
+        return IntegrityResult(f"[WARN] Skipping invalid image: {path} ({problem})", tuple(times))
+    return IntegrityResult(None, tuple(times))
+
+
+class IntegrityReport:
+    """Accumulates per-level timings and outcomes of check_image results."""
+
+    def __init__(self, level: str):
+        self.level = level
+        self.checked = 0
+        self.rejected = 0
+        self.times = [0.0, 0.0, 0.0]
+        self.counts = [0, 0, 0]
+
+    def add(self, result: IntegrityResult) -> None:
+        self.checked += 1
+        self.rejected += result.problem is not None
+        for i, seconds in enumerate(result.times):
+            self.times[i] += seconds
+            self.counts[i] += seconds > 0
+
+    def lines(self) -> List[str]:
+        lines = [
+            f"Integrity check ({self.level}): {self.checked} files, "
+            f"{self.rejected} rejected (time summed across workers)"
+        ]
+        for name, count, seconds in zip(VALIDATION_LEVELS, self.counts, self.times):
+            if count:
+                lines.append(
+                    f"  {name:<9} {count:>8} files {seconds:>8.2f}s "
+                    f"({1000 * seconds / count:.2f} ms/file)"
+                )
+        return lines
+
+
+__all__ = [
+    "VALIDATION_LEVELS",
+    "IntegrityResult",
+    "IntegrityReport",
+    "check_header",
+    "check_jpeg_structure",
+    "check_png_structure",
+    "check_full",
+    "check_image",
+]
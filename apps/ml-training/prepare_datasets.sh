@@ -5,13 +5,25 @@
 #
 # Options:
 #   --clean    Delete existing datasets with confirmation before preparing
-#   --clear    Delete raw datasets after successful preparation
+#   --clear    Delete raw datasets after successful preparation (not with --from-zips)
+#   --workers N  Image validation processes (default: number of CPUs)
+#   --validation LEVEL  Image integrity check: header, structure (default) or full
+#   --rescan   Ignore the consolidation manifest and re-validate every image
+#   --mirror DIR  Copy dataset zips (owner_name.zip) from DIR instead of downloading from Kaggle
+#   --fetch-workers N  Datasets downloaded and extracted concurrently (default: 4)
+#   --from-zips  Do not extract; index the zips into a virtual merged_dataset
+#   --dedup-radius N  Also collapse near duplicates within this perceptual-hash distance (e.g. 3; default: 0, exact copies only)
+#   --keep-duplicates  Do not collapse duplicate images across datasets
+#   --resized-dir DIR  Also write a copy capped at --max-side pixels to DIR (e.g. merged_dataset_640)
+#   --max-side N  Long side of the images in --resized-dir (default: 640)
 
 set -e  # Exit on any error
 
-# Parse command line arguments
+# Parse command line arguments; options of dataset_utils.py are collected and checked there
 CLEAN=false
 CLEAR=false
+FROM_ZIPS=false
+PREPARE_ARGS=()
 
 while [[ $# -gt 0 ]]; do
     case $1 in
@@ -23,12 +35,39 @@ while [[ $# -gt 0 ]]; do
             CLEAR=true
             shift
             ;;
+        --workers|--validation|--mirror|--fetch-workers|--dedup-radius|--resized-dir|--max-side)
+            if [[ $# -lt 2 ]]; then
+                echo "Missing value for $1"
+                exit 1
+            fi
+            PREPARE_ARGS+=("$1" "$2")
+            shift 2
+            ;;
+        --rescan|--keep-duplicates)
+            PREPARE_ARGS+=("$1")
+            shift
+            ;;
+        --from-zips)
+            FROM_ZIPS=true
+            PREPARE_ARGS+=("$1")
+            shift
+            ;;
         --help)
             echo "Usage: $0 [options]"
             echo ""
             echo "Options:"
             echo "  --clean    Delete existing datasets with confirmation before preparing"
-            echo "  --clear    Delete raw datasets after successful preparation"
+            echo "  --clear    Delete raw datasets after successful preparation (not with --from-zips)"
+            echo "  --workers N  Image validation processes (default: number of CPUs)"
+            echo "  --validation LEVEL  Image integrity check: header, structure (default) or full"
+            echo "  --rescan   Ignore the consolidation manifest and re-validate every image"
+            echo "  --mirror DIR  Copy dataset zips (owner_name.zip) from DIR instead of downloading from Kaggle"
+            echo "  --fetch-workers N  Datasets downloaded and extracted concurrently (default: 4)"
+            echo "  --from-zips  Do not extract; index the zips into a virtual merged_dataset"
+            echo "  --dedup-radius N  Also collapse near duplicates within this perceptual-hash distance (e.g. 3; default: 0, exact copies only)"
+            echo "  --keep-duplicates  Do not collapse duplicate images across datasets"
+            echo "  --resized-dir DIR  Also write a copy capped at --max-side pixels to DIR (e.g. merged_dataset_640)"
+            echo "  --max-side N  Long side of the images in --resized-dir (default: 640)"
             echo "  --help     Show this help message"
             exit 0
             ;;
@@ -40,6 +79,12 @@ while [[ $# -gt 0 ]]; do
     esac
 done
 
+# A virtual merged dataset reads its images from the zips in raw_datasets
+if [ "$CLEAR" = true ] && [ "$FROM_ZIPS" = true ]; then
+    echo "Error: --clear cannot be combined with --from-zips (the merged dataset reads the zips in raw_datasets)"
+    exit 1
+fi
+
 echo "=== ReUseIt Dataset Preparation Script ==="
 
 # Handle --clean flag
@@ -86,8 +131,8 @@ source .venv/bin/activate
 echo "Virtual environment activated: $VIRTUAL_ENV"
 echo "Preparing datasets..."
 
-# Run dataset preparation
-python -c "from dataset_utils import prepare_datasets; prepare_datasets()"
+# Run dataset preparation; values are passed as arguments, never pasted into Python source
+python dataset_utils.py "${PREPARE_ARGS[@]}"
 
 echo "Dataset preparation completed successfully!"
 
@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+"""Build a bounded-resolution copy of merged_dataset for training and labeling.
+
+Source images go up to several megapixels while YOLO works at imgsz (640), so every
+epoch and labeling pass decodes pixels it throws away. This writes each image again
+with its long side capped at --max-side, under the same relative path, so CSV filenames
+and YOLO labels (normalized coordinates) carry over unchanged.
+
+JPEGs are decoded in draft mode, letting libjpeg downscale by up to 8x while decoding.
+EXIF orientation is applied before saving, so the copies decode the same way the
+originals do. Images already within the limit are hard-linked (or copied out of the
+zip for virtual datasets). Work is spread over worker processes.
+
+The cache directory holds resize_map.json, which maps every cached image back to its
+original and records the source signature. Re-runs only process new or changed images
+and delete copies whose original is gone, e.g. after duplicates were collapsed.
+
+Usage:
+    python resize_cache.py merged_dataset merged_dataset_640 --max-side 640
+"""
+
+import argparse
+import io
+import json
+import math
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+from zip_dataset import (
+    list_virtual_images,
+    load_zip_index,
+    read_image_bytes,
+    resolve_image_path,
+    split_member_path,
+)
+
+MAP_NAME = "resize_map.json"
+DEFAULT_MAX_SIDE = 640
+DEFAULT_QUALITY = 90
+IMAGE_EXTS = {".jpg", ".jpeg", ".png"}
+EXIF_ORIENTATION = 0x0112
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+def list_dataset_images(root: str) -> List[str]:
+    """Image files under root, plus the images of a virtual dataset rooted there."""
+    paths = []
+    for folder, _, files in os.walk(root):
+        paths.extend(
+            os.path.join(folder, f) for f in files if os.path.splitext(f)[1].lower() in IMAGE_EXTS
+        )
+    on_disk = set(map(os.path.abspath, paths))
+    paths.extend(p for p in list_virtual_images(root) if p not in on_disk)
+    return sorted(paths)
+
+
+def source_signature(path: str) -> List[int]:
+    """Change detector for an image: stat fields, or size/CRC/offset of a zip member."""
+    member = split_member_path(resolve_image_path(path))
+    if member is not None:
+        info = load_zip_index(member[0])[member[1]]
+        return [info.file_size, info.crc, info.header_offset]
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+
+def resize_image(
+    src: str, dst: str, max_side: int, quality: int = DEFAULT_QUALITY
+) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+    """Write src to dst with its long side capped at max_side.
+
+    Returns:
+        ((width, height) of the original as decoded, (width, height) written)
+    """
+    data = read_image_bytes(src)
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    tmp = dst + ".tmp"
+    with Image.open(io.BytesIO(data)) as image:
+        fmt = image.format
+        width, height = image.size
+        orientation = image.getexif().get(EXIF_ORIENTATION, 1)
+        if orientation in TRANSPOSED_ORIENTATIONS:
+            width, height = height, width
+        scale = min(1.0, max_side / max(width, height))
+
+        if scale == 1.0 and orientation == 1:
+            # Small enough and upright: the original bytes are already what we want
+            if split_member_path(resolve_image_path(src)) is None:
+                _replace_with_link(src, dst)
+            else:
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, dst)
+            return (width, height), (width, height)
+
+        target = (max(1, round(width * scale)), max(1, round(height * scale)))
+        if scale < 1.0:
+            stored = target[::-1] if orientation in TRANSPOSED_ORIENTATIONS else target
+            image.draft(None, stored)
+        image = ImageOps.exif_transpose(image)
+        if image.size != target:
+            image = image.resize(target, Image.Resampling.LANCZOS)
+        if fmt == "JPEG":
+            if image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            image.save(tmp, format="JPEG", quality=quality)
+        else:
+            image.save(tmp, format=fmt)
+    os.replace(tmp, dst)
+    return (width, height), target
+
+
+def _replace_with_link(src: str, dst: str) -> None:
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _resize_task(args: Tuple[str, str, int, int]) -> Tuple[Optional[Tuple], Optional[str]]:
+    """resize_image for a worker process: (sizes, None) or (None, error message)."""
+    try:
+        return resize_image(*args), None
+    except Exception as e:
+        return None, str(e)
+
+
+def _iter_resized(args: List[Tuple[str, str, int, int]], workers: int) -> Iterator[Tuple]:
+    """Run _resize_task over args in a process pool, yielding results in order."""
+    if workers <= 1 or len(args) < 2:
+        yield from map(_resize_task, args)
+        return
+    chunksize = max(1, min(64, len(args) // (workers * 4)))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(_resize_task, args, chunksize=chunksize)
+
+
+def build_resized_cache(
+    merged_dir: str,
+    cache_dir: str,
+    max_side: int = DEFAULT_MAX_SIDE,
+    workers: Optional[int] = None,
+    quality: int = DEFAULT_QUALITY,
+) -> Dict:
+    """Create or update the bounded-resolution copy of merged_dir in cache_dir.
+
+    Args:
+        merged_dir: Consolidated dataset (regular or virtual)
+        cache_dir: Output directory, mirroring merged_dir's layout
+        max_side: Maximum width and height of the cached images
+        workers: Resize processes (defaults to the CPU count, 1 resizes inline)
+        quality: JPEG quality of resized images
+
+    Returns:
+        The mapping written to cache_dir/resize_map.json
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    os.makedirs(cache_dir, exist_ok=True)
+    map_path = os.path.join(cache_dir, MAP_NAME)
+
+    previous = {}
+    if os.path.exists(map_path):
+        with open(map_path) as f:
+            stored = json.load(f)
+        # A different size or quality invalidates every cached image
+        if stored.get("max_side") == max_side and stored.get("quality") == quality:
+            previous = stored["images"]
+
+    images = {}
+    todo = []
+    for src in list_dataset_images(merged_dir):
+        rel = os.path.relpath(src, merged_dir)
+        signature = source_signature(src)
+        record = previous.get(rel)
+        dst = os.path.join(cache_dir, rel)
+        if record is not None and record["signature"] == signature and os.path.exists(dst):
+            images[rel] = record
+        else:
+            todo.append((rel, src, dst, signature))
+    reused = len(images)
+    print(f"Resizing {len(todo)} images to at most {max_side}px ({reused} up to date)")
+
+    args = [(src, dst, max_side, quality) for _, src, dst, _ in todo]
+    for (rel, src, _, signature), (sizes, error) in zip(todo, _iter_resized(args, workers)):
+        if error is not None:
+            print(f"[WARN] Could not resize {src}: {error}")
+            continue
+        original_size, size = sizes
+        images[rel] = {
+            "original": os.path.abspath(src),
+            "signature": signature,
+            "original_size": list(original_size),
+            "size": list(size),
+        }
+
+    # Drop copies whose original left the merged dataset
+    removed = 0
+    for path in list_dataset_images(cache_dir):
+        if os.path.relpath(path, cache_dir) not in images:
+            os.remove(path)
+            removed += 1
+
+    mapping = {
+        "source_root": os.path.abspath(merged_dir),
+        "max_side": max_side,
+        "quality": quality,
+        "images": dict(sorted(images.items())),
+    }
+    tmp = map_path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(mapping, f, indent=1)
+    os.replace(tmp, map_path)
+
+    original_pixels = sum(math.prod(r["original_size"]) for r in images.values())
+    cached_pixels = sum(math.prod(r["size"]) for r in images.values())
+    share = cached_pixels / original_pixels if original_pixels else 1.0
+    print(
+        f"Resized cache: {len(images)} images in {cache_dir} ({len(todo)} written, "
+        f"{reused} reused, {removed} removed); {share:.1%} of the original pixels"
+    )
+    return mapping
+
+
+def original_path(cache_dir: str, cached_image: str) -> Optional[str]:
+    """Original image a cached image was made from, or None if it is not in the map."""
+    with open(os.path.join(cache_dir, MAP_NAME)) as f:
+        images = json.load(f)["images"]
+    record = images.get(os.path.relpath(cached_image, cache_dir))
+    return record["original"] if record else None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Write a bounded-resolution copy of a merged dataset",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("merged_dir", help="Consolidated dataset, e.g. merged_dataset")
+    parser.add_argument("cache_dir", help="Output directory, e.g. merged_dataset_640")
+    parser.add_argument("--max-side", type=int, default=DEFAULT_MAX_SIDE, help="Long side cap")
+    parser.add_argument("--quality", type=int, default=DEFAULT_QUALITY, help="JPEG quality")
+    parser.add_argument("--workers", type=int, default=None, help="Resize processes")
+    args = parser.parse_args()
+    build_resized_cache(args.merged_dir, args.cache_dir, args.max_side, args.workers, args.quality)
+
+
+__all__ = [
+    "MAP_NAME",
+    "DEFAULT_MAX_SIDE",
+    "list_dataset_images",
+    "source_signature",
+    "resize_image",
+    "build_resized_cache",
+    "original_path",
+]
+
+
+if __name__ == "__main__":
+    main()
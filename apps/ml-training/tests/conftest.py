@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# The training scripts import their siblings directly, as when run from their folders
+ROOT = Path(__file__).parent.parent
+sys.path[:0] = [str(ROOT), str(ROOT / "yolo")]
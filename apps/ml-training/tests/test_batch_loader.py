@@ -0,0 +1,19 @@
+import pytest
+from PIL import Image
+
+from batch_loader import iter_prepared_batches
+
+
+@pytest.mark.parametrize("decode_workers", [0, 2])
+def test_unreadable_images_are_skipped(tmp_path, decode_workers):
+    good = tmp_path / "good.jpg"
+    Image.new("RGB", (80, 60), (200, 30, 30)).save(good)
+    empty = tmp_path / "empty.jpg"
+    empty.write_bytes(b"")
+    paths = [str(empty), str(good), str(tmp_path / "missing.jpg")]
+
+    batches = list(
+        iter_prepared_batches(paths, imgsz=64, batch_size=4, decode_workers=decode_workers)
+    )
+
+    assert [[item.path for item in batch] for batch in batches] == [[str(good)]]
@@ -0,0 +1,37 @@
+from types import SimpleNamespace
+
+import numpy as np
+from PIL import Image
+
+import auto_label_yolo
+
+
+def test_failed_second_stage_keeps_first_pass(tmp_path, monkeypatch):
+    images_dir = tmp_path / "images" / "glass"
+    images_dir.mkdir(parents=True)
+    Image.new("RGB", (64, 48), (90, 120, 30)).save(images_dir / "a.jpg")
+
+    def load_model(name):
+        return SimpleNamespace(name=name, model=SimpleNamespace())
+
+    def predict(model, items, imgsz, conf_floor):
+        if model.name == "large.pt":
+            raise RuntimeError("out of memory")
+        # Best confidence inside the cascade band, so every image escalates
+        return [np.array([[0.5, 0.5, 0.2, 0.2, 0.6, 0.0]]) for _ in items]
+
+    monkeypatch.setattr(auto_label_yolo, "load_yolo_model", load_model)
+    monkeypatch.setattr(auto_label_yolo, "predict_raw_detections", predict)
+    labels_dir = tmp_path / "labels"
+
+    auto_label_yolo.run_yolo_autolabel(
+        str(tmp_path / "images"),
+        str(tmp_path / "out.csv"),
+        "small.pt",
+        labels_dir=str(labels_dir),
+        decode_workers=0,
+        cascade_model="large.pt",
+        cascade_band=(0.5, 0.9),
+    )
+
+    assert (labels_dir / "a.txt").read_text().split()[1:] == ["0.500000"] * 2 + ["0.200000"] * 2
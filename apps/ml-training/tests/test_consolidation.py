@@ -0,0 +1,63 @@
+import os
+
+from PIL import Image
+
+from consolidation_manifest import (
+    MANIFEST_NAME,
+    ConsolidationManifest,
+    FileSignature,
+    ManifestEntry,
+)
+from dataset_utils import DATASET_CONFIGS, consolidate_datasets_explicit
+
+CONFIG = DATASET_CONFIGS[0]
+
+
+def _make_source(raw_dir, names):
+    class_dir = raw_dir / CONFIG["slug"] / CONFIG["path"] / "glass"
+    class_dir.mkdir(parents=True)
+    for i, name in enumerate(names):
+        Image.new("RGB", (64, 48), (40 * i, 80, 120)).save(class_dir / name, quality=90)
+    return class_dir
+
+
+def _consolidate(raw_dir, merged_dir):
+    consolidate_datasets_explicit(
+        str(raw_dir), str(merged_dir), [CONFIG["name"]], workers=1, dedup_radius=None
+    )
+
+
+def test_accepted_then_corrupt_source_is_removed(tmp_path):
+    raw_dir, merged_dir = tmp_path / "raw", tmp_path / "merged"
+    class_dir = _make_source(raw_dir, ["a.jpg", "b.jpg"])
+    _consolidate(raw_dir, merged_dir)
+    dst = merged_dir / "glass" / f"{CONFIG['slug']}_glass_a.jpg"
+    assert dst.exists()
+
+    # Replace the source with a truncated copy (a new file, so the hard link is not shared)
+    src = class_dir / "a.jpg"
+    data = src.read_bytes()
+    src.unlink()
+    src.write_bytes(data[: len(data) // 2])
+    _consolidate(raw_dir, merged_dir)
+
+    assert not dst.exists()
+    assert (merged_dir / "glass" / f"{CONFIG['slug']}_glass_b.jpg").exists()
+    manifest = ConsolidationManifest(os.path.join(merged_dir, MANIFEST_NAME))
+    entry = manifest.load()[str(src)]
+    manifest.close()
+    assert entry.problem is not None
+
+
+def test_fingerprints_of_an_older_dhash_are_dropped(tmp_path):
+    path = str(tmp_path / MANIFEST_NAME)
+    manifest = ConsolidationManifest(path)
+    signature = FileSignature(1, 2, 3)
+    manifest.record([("a.jpg", ManifestEntry(signature, "header", None, "d", "g", "c0", 7))])
+    manifest._conn.execute("PRAGMA user_version = 0")
+    manifest.close()
+
+    manifest = ConsolidationManifest(path)
+    entry = manifest.load()["a.jpg"]
+    manifest.close()
+    assert (entry.signature, entry.content_hash, entry.dhash) == (signature, None, None)
@@ -0,0 +1,17 @@
+from PIL import Image
+
+from dataset_stats import scan_dataset
+
+
+def test_split_label_copies_are_not_counted(tmp_path):
+    merged_dir, labels_dir = tmp_path / "merged", tmp_path / "labels"
+    (merged_dir / "glass").mkdir(parents=True)
+    Image.new("RGB", (64, 48)).save(merged_dir / "glass" / "a.jpg")
+    (labels_dir / "train").mkdir(parents=True)
+    for folder in (labels_dir, labels_dir / "train"):
+        (folder / "a.txt").write_text("1 0.5 0.5 0.2 0.2\n")
+
+    _, labels = scan_dataset(str(merged_dir), str(labels_dir), workers=1, use_cache=False)
+
+    assert list(labels) == ["a.txt"]
+    assert labels["a.txt"]["boxes"] == 1
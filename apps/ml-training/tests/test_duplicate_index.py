@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from PIL import Image, ImageFilter
+
+from duplicate_index import Fingerprint, find_duplicate_clusters, image_fingerprint
+
+NEAR_RADIUS = 3
+
+
+@pytest.mark.parametrize("scale", [0.75, 0.5, 0.33, 0.25])
+def test_dhash_survives_rescaling(tmp_path, scale):
+    rng = np.random.default_rng(0)
+    noise = rng.integers(0, 256, (48, 64, 3), dtype=np.uint8)
+    image = Image.fromarray(noise).resize((1280, 960), Image.Resampling.BICUBIC)
+    image = image.filter(ImageFilter.GaussianBlur(8))
+    original = tmp_path / "original.jpg"
+    image.save(original, quality=90)
+    rescaled = tmp_path / "rescaled.jpg"
+    size = (round(image.width * scale), round(image.height * scale))
+    image.resize(size, Image.Resampling.LANCZOS).save(rescaled, quality=90)
+
+    distance = image_fingerprint(str(original)).dhash ^ image_fingerprint(str(rescaled)).dhash
+    assert distance.bit_count() <= NEAR_RADIUS
+
+
+def test_near_duplicates_do_not_chain():
+    # a~b and b~c are within the radius, a and c are not
+    images = {
+        "a.jpg": (Fingerprint("ha", 0b000000), 300),
+        "b.jpg": (Fingerprint("hb", 0b000111), 200),
+        "c.jpg": (Fingerprint("hc", 0b111111), 100),
+        "c_copy.jpg": (Fingerprint("hc", 0b111111), 100),
+    }
+
+    clusters = find_duplicate_clusters(images, radius=3)
+
+    assert [(c.canonical, c.duplicates) for c in clusters] == [
+        ("a.jpg", [("b.jpg", 3)]),
+        ("c.jpg", [("c_copy.jpg", 0)]),
+    ]
+    for cluster in clusters:
+        canonical = images[cluster.canonical][0].dhash
+        for src, _ in cluster.duplicates:
+            assert (images[src][0].dhash ^ canonical).bit_count() <= 3
+
+
+def test_default_radius_only_collapses_exact_copies():
+    images = {
+        "a.jpg": (Fingerprint("ha", 0), 100),
+        "b.jpg": (Fingerprint("hb", 0), 100),
+    }
+    assert find_duplicate_clusters(images) == []
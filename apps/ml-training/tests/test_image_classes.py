@@ -0,0 +1,14 @@
+import numpy as np
+
+from image_classes import ImageClasses, load_label_classes
+
+
+def test_known_classes_skip_the_labels_folder(tmp_path):
+    (tmp_path / "a.txt").write_text("0 0.5 0.5 0.1 0.1\n")
+    (tmp_path / "b.txt").write_text("2 0.5 0.5 0.1 0.1\n")
+    known = ImageClasses(["a"], np.array([[0, 3]], dtype=np.uint32))
+
+    assert load_label_classes(str(tmp_path), ["a"], known).counts.tolist() == [[0, 3]]
+    # Stems missing from known are still read from their label files
+    classes = load_label_classes(str(tmp_path), ["a", "b"], known)
+    assert classes.counts.tolist() == [[0, 3, 0], [0, 0, 1]]
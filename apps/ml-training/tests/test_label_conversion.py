@@ -0,0 +1,49 @@
+import pytest
+
+from label_conversion import convert_detections_to_labels
+
+HEADER = "filename,x_center,y_center,width,height,confidence,class_id\n"
+
+
+def _write_csv(path, rows):
+    path.write_text(HEADER + "".join(f"{name},0.5,0.5,0.2,0.2,{conf},0\n" for name, conf in rows))
+
+
+def test_missing_images_fail_loudly(tmp_path):
+    csv_file = tmp_path / "labels.csv"
+    _write_csv(csv_file, [("glass/a.jpg", 0.9), ("glass/b.jpg", 0.8)])
+    with pytest.raises(FileNotFoundError):
+        convert_detections_to_labels(
+            str(csv_file), str(tmp_path / "labels"), lambda name: 1, image_files=set()
+        )
+
+
+def test_chunked_conversion_matches_single_chunk(tmp_path):
+    # Rows of an image span chunk boundaries and images reappear in later chunks
+    names = ["a", "b", "b", "c", "a", "b", "d", "d", "d", "c", "e"]
+    rows = [(f"glass/{name}.jpg", 0.3 if i == 4 else 0.9) for i, name in enumerate(names)]
+    csv_file = tmp_path / "labels.csv"
+    _write_csv(csv_file, rows)
+
+    results = {}
+    for chunk_rows in (3, 1000):
+        labels_dir = tmp_path / f"labels_{chunk_rows}"
+        classes = convert_detections_to_labels(
+            str(csv_file), str(labels_dir), lambda name: 1, chunk_rows=chunk_rows, writers=2
+        )
+        files = {path.name: path.read_text() for path in labels_dir.glob("*.txt")}
+        results[chunk_rows] = (files, classes.lookup())
+
+    files, lookup = results[3]
+    assert files == results[1000][0]
+    assert {stem: row.tolist() for stem, row in lookup.items()} == {
+        "a": [0, 1],
+        "b": [0, 3],
+        "c": [0, 2],
+        "d": [0, 3],
+        "e": [0, 1],
+    }
+    assert {stem: row.tolist() for stem, row in results[1000][1].items()} == {
+        stem: row.tolist() for stem, row in lookup.items()
+    }
+    assert files["b.txt"].count("\n") == 3
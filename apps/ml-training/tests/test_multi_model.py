@@ -0,0 +1,52 @@
+from types import SimpleNamespace
+
+from PIL import Image
+
+import auto_label_yolo
+
+
+class _Boxes:
+    data = None
+
+    def __len__(self):
+        return 0
+
+
+class _FakeModel:
+    def __init__(self):
+        self.model = SimpleNamespace()
+        self.inputs = []
+
+    def predict(self, tensor, **kwargs):
+        self.inputs.append(tensor)
+        return [SimpleNamespace(boxes=_Boxes()) for _ in range(len(tensor))]
+
+
+def test_batch_tensor_is_built_once_for_all_models(tmp_path, monkeypatch):
+    images_dir = tmp_path / "images" / "glass"
+    images_dir.mkdir(parents=True)
+    for i in range(3):
+        Image.new("RGB", (64, 48), (40 * i, 90, 30)).save(images_dir / f"{i}.jpg")
+    models = {}
+    monkeypatch.setattr(
+        auto_label_yolo, "load_yolo_model", lambda name: models.setdefault(name, _FakeModel())
+    )
+    built = []
+    batch_inputs = auto_label_yolo.batch_inputs
+    monkeypatch.setattr(
+        auto_label_yolo, "batch_inputs", lambda items: built.append(1) or batch_inputs(items)
+    )
+
+    auto_label_yolo.run_multi_model_autolabel(
+        str(tmp_path / "images"),
+        str(tmp_path / "out.csv"),
+        ["small.pt", "large.pt"],
+        batch_size=4,
+        decode_workers=0,
+        imgsz=64,
+    )
+
+    assert len(built) == 1
+    small, large = models["small.pt"].inputs, models["large.pt"].inputs
+    assert len(small) == len(large) == 1
+    assert small[0] is large[0]
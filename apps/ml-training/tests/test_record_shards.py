@@ -0,0 +1,56 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from auto_label_yolo import split_dataset
+from record_shards import ShardedSplit, _bounded_map, pack_dataset
+
+
+def test_reads_in_flight_are_bounded():
+    lock = threading.Lock()
+    state = {"active": 0, "peak": 0}
+
+    def read(i):
+        with lock:
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+        return i
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = []
+        for i in _bounded_map(executor, read, range(50), window=4):
+            results.append(i)
+            with lock:
+                state["active"] -= 1
+
+    assert results == list(range(50))
+    assert state["peak"] <= 5
+
+
+def test_listfile_split_is_packed(tmp_path):
+    images_dir, labels_dir = tmp_path / "images", tmp_path / "labels"
+    (images_dir / "glass").mkdir(parents=True)
+    labels_dir.mkdir()
+    for name in ("a", "b"):
+        Image.new("RGB", (40, 30)).save(images_dir / "glass" / f"{name}.jpg")
+        (labels_dir / f"{name}.txt").write_text("1 0.5 0.5 0.2 0.2\n")
+    dataset_dir = tmp_path / "dataset"
+    split_dataset(
+        str(images_dir),
+        str(labels_dir),
+        str(dataset_dir),
+        1.0,
+        0.0,
+        0.0,
+        materialize="listfile",
+        method="hash",
+    )
+
+    pack_dataset(str(dataset_dir), str(tmp_path / "shards"), workers=2)
+
+    records = list(ShardedSplit(str(tmp_path / "shards" / "train")))
+    assert sorted(r.name for r in records) == ["glass/a.jpg", "glass/b.jpg"]
+    assert all(np.allclose(r.labels, [[1, 0.5, 0.5, 0.2, 0.2]]) for r in records)
+    assert records[0].shape == (30, 40)
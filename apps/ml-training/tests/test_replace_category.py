@@ -0,0 +1,25 @@
+import os
+
+import numpy as np
+
+from detection_store import DetectionStoreWriter, load_detection_table
+from replace_category import replace_residual_waste_with_battery
+
+
+def test_store_rename_only_rewrites_the_dictionary(tmp_path):
+    store = str(tmp_path / "labels.dets")
+    writer = DetectionStoreWriter(store)
+    box = np.array([[0.5, 0.5, 0.2, 0.2]])
+    writer.add("residual_waste/battery_1.jpg", np.repeat(box, 2, axis=0), [0.9, 0.8], 5)
+    writer.add("residual_waste/cup.jpg", box, [0.7], 5)
+    writer.close()
+    columns = {name: os.stat(os.path.join(store, name)).st_mtime_ns for name in os.listdir(store)}
+    columns = {name: mtime for name, mtime in columns.items() if name.endswith(".bin")}
+
+    assert replace_residual_waste_with_battery(store) == 2
+
+    table = load_detection_table(store)
+    assert table.filenames == ["battery/battery_1.jpg", "residual_waste/cup.jpg"]
+    assert table.file_id.tolist() == [0, 0, 1]
+    for name, mtime in columns.items():
+        assert os.stat(os.path.join(store, name)).st_mtime_ns == mtime
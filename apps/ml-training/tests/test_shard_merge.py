@@ -0,0 +1,35 @@
+import csv
+
+from auto_label_yolo import merge_shard_csvs
+
+HEADER = ["filename", "x_center", "y_center", "width", "height", "confidence", "class_id"]
+
+
+def _write_shard(path, filenames):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        for i, name in enumerate(filenames):
+            # Two rows per image, tagged so their order can be checked
+            writer.writerow([name, 0.5, 0.5, 0.1, 0.1, 0.9, i * 2])
+            writer.writerow([name, 0.5, 0.5, 0.1, 0.1, 0.9, i * 2 + 1])
+
+
+def test_merge_sorts_rect_ordered_shards(tmp_path):
+    # --rect writes each shard in aspect-ratio order, not filename order
+    shards = [tmp_path / "a.shard00-of-02.csv", tmp_path / "a.shard01-of-02.csv"]
+    _write_shard(shards[0], ["glass/d.jpg", "glass/a.jpg", "glass/c.jpg"])
+    _write_shard(shards[1], ["paper/e.jpg", "glass/b.jpg"])
+    output = tmp_path / "a.csv"
+
+    rows = merge_shard_csvs([str(p) for p in shards], str(output))
+
+    with open(output, newline="") as f:
+        merged = list(csv.reader(f))
+    assert merged[0] == HEADER
+    assert rows == len(merged) - 1 == 10
+    names = [row[0] for row in merged[1:]]
+    assert names == sorted(names)
+    # Rows of one image stay together and in their original order
+    a_rows = [int(row[6]) for row in merged[1:] if row[0] == "glass/a.jpg"]
+    assert a_rows == [2, 3]
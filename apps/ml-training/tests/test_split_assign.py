@@ -0,0 +1,29 @@
+from collections import Counter
+
+from split_assign import hash_split
+
+
+def test_stratified_hash_split_never_moves_existing_images():
+    keys = [f"glass/img{i}.jpg" for i in range(100)]
+    before = {key: hash_split(key, 0.7, 0.2, 0.1, class_id=1) for key in keys}
+
+    grown = keys + [f"glass/img{i}.jpg" for i in range(100, 103)]
+    after = {key: hash_split(key, 0.7, 0.2, 0.1, class_id=1) for key in grown}
+
+    assert {key: after[key] for key in keys} == before
+
+
+def test_stratified_hash_split_keeps_per_class_ratios_on_average():
+    for class_id in (0, 1, 2):
+        keys = [f"class{class_id}/img{i}.jpg" for i in range(2000)]
+        counts = Counter(hash_split(key, 0.7, 0.2, 0.1, class_id) for key in keys)
+        assert abs(counts["train"] - 1400) < 100
+        assert abs(counts["val"] - 400) < 80
+        assert abs(counts["test"] - 200) < 60
+
+
+def test_class_salt_changes_the_assignment():
+    keys = [f"img{i}.jpg" for i in range(200)]
+    plain = [hash_split(key) for key in keys]
+    salted = [hash_split(key, class_id=3) for key in keys]
+    assert plain != salted
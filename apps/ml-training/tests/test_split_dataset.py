@@ -0,0 +1,43 @@
+from PIL import Image
+
+from auto_label_yolo import split_dataset
+
+
+def test_labels_of_an_earlier_split_are_ignored(tmp_path):
+    images_dir, labels_dir = tmp_path / "images", tmp_path / "labels"
+    images_dir.mkdir()
+    (labels_dir / "train").mkdir(parents=True)
+    for name in ("a", "b"):
+        Image.new("RGB", (32, 32)).save(images_dir / f"{name}.jpg")
+    (labels_dir / "a.txt").write_text("1 0.5 0.5 0.2 0.2\n")
+    # Left behind by a split into the labels folder; b has no label of its own
+    (labels_dir / "train" / "b.txt").write_text("1 0.5 0.5 0.2 0.2\n")
+    output_dir = tmp_path / "split"
+
+    split_dataset(str(images_dir), str(labels_dir), str(output_dir), 1.0, 0.0, 0.0, method="hash")
+
+    assert [p.name for p in (output_dir / "images" / "train").iterdir()] == ["a.jpg"]
+
+
+def test_listfile_labels_are_copies(tmp_path):
+    images_dir, labels_dir = tmp_path / "images", tmp_path / "labels"
+    images_dir.mkdir()
+    labels_dir.mkdir()
+    Image.new("RGB", (32, 32)).save(images_dir / "a.jpg")
+    (labels_dir / "a.txt").write_text("1 0.5 0.5 0.2 0.2\n")
+    output_dir = tmp_path / "split"
+
+    split_dataset(
+        str(images_dir),
+        str(labels_dir),
+        str(output_dir),
+        1.0,
+        0.0,
+        0.0,
+        materialize="listfile",
+        method="hash",
+    )
+
+    label = output_dir / "source" / "labels" / "a.txt"
+    assert label.read_text() == "1 0.5 0.5 0.2 0.2\n"
+    assert not label.samefile(labels_dir / "a.txt")
@@ -11,6 +11,10 @@ import csv
 import random
 import logging
 import json
+import time
+import heapq
+import subprocess
+import zlib
 from pathlib import Path
 import sys
 from typing import List, Dict, Optional, Tuple
@@ -18,11 +22,46 @@ from contextlib import contextmanager
 import shutil
 from sklearn.model_selection import train_test_split
 from collections import defaultdict
+import numpy as np
 import torch
 import torch.serialization
 
 # Import from local utils
 from dataset_utils_yolo import CANONICAL_CLASSES, CLASS_TO_ID, validate_yolo_labels
+from batch_loader import (
+    DEFAULT_STRIDE,
+    iter_prepared_batches,
+    load_letterboxed,
+    stack_batch,
+    unletterbox_xywhn,
+)
+from detection_cache import DetectionCache, file_digest
+from detection_store import (
+    STORE_SUFFIX,
+    DetectionStoreWriter,
+    is_detection_store,
+    merge_detection_stores,
+    open_detection_writer,
+)
+from materialize_labels import write_yolo_label_files
+from label_conversion import convert_detections_to_labels
+from split_materialize import (
+    DEFAULT_COPY_WORKERS,
+    MATERIALIZE_MODES,
+    label_path,
+    materialize_split,
+    place_files,
+    prune_splits,
+)
+from split_assign import HASH_KEYS, hash_split, image_key
+from image_classes import (
+    ImageClasses,
+    dominant_class,
+    iterative_stratification,
+    load_label_classes,
+)
+from image_index import image_paths, index_files
+from zip_dataset import list_virtual_images
 
 # Import ultralytics
 from ultralytics import YOLO
@@ -46,6 +85,13 @@ def map_folder_to_waste_class(folder_name: str) -> int:
     return FOLDER_TO_WASTE_CLASS.get(folder_name, 7)  # Default to residual_waste (7)
 
 
+# Ultralytics' default predict confidence; detections below it are never produced
+DEFAULT_CONF_FLOOR = 0.25
+# Floor used by --raw, low enough that any threshold worth trying can be materialized later
+RAW_CONF_FLOOR = 0.01
+# Best-confidence band in which the cascade's first model is considered unsure
+DEFAULT_CASCADE_BAND = (0.25, 0.6)
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
@@ -68,23 +114,237 @@ def allow_unsafe_torch_load():
 
 
 def collect_image_paths(input_folder: str) -> List[str]:
-    """Collect all image file paths from input folder."""
+    """Collect all image file paths from input folder.
+
+    Images of a virtual (zip-backed) dataset are included with their merged paths.
+    """
     if not os.path.exists(input_folder):
         raise FileNotFoundError(f"Input folder not found: {input_folder}")
 
-    image_paths = []
-    valid_extensions = (".jpg", ".jpeg", ".png")
+    paths = image_paths(input_folder)
 
-    for root, _, files in os.walk(input_folder):
-        for file in files:
-            if file.lower().endswith(valid_extensions):
-                image_paths.append(os.path.join(root, file))
+    on_disk = set(map(os.path.abspath, paths))
+    paths.extend(p for p in list_virtual_images(input_folder) if p not in on_disk)
 
     # Shuffle to get better distribution across categories
-    random.shuffle(image_paths)
+    random.shuffle(paths)
+    return paths
+
+
+def collect_run_images(
+    input_folder: str, shards: int = 1, shard_index: int = 0
+) -> Optional[List[str]]:
+    """Image paths a labeling run works on: all images, or this worker's shard.
+
+    Returns:
+        List of image paths, or None (after reporting why) if there is nothing to label
+    """
+    try:
+        image_paths = collect_image_paths(input_folder)
+    except FileNotFoundError as e:
+        logger.error(str(e))
+        print(f"[red]{e}[/red]")
+        return None
+
+    if not image_paths:
+        logger.warning(f"No images found in {input_folder}")
+        print(f"[yellow]No images found in {input_folder}[/yellow]")
+        return None
+
+    if shards > 1:
+        image_paths = select_shard(image_paths, input_folder, shards, shard_index)
     return image_paths
 
 
+def limit_images(
+    image_paths: List[str], limit: int, shards: int = 1, shard_index: int = 0
+) -> List[str]:
+    """Apply --limit to a run's images (a seeded sample per shard when sharded)."""
+    if limit and limit > 0 and len(image_paths) > limit:
+        if shards > 1:
+            # Seeded sample keeps the class mix while staying reproducible per shard
+            image_paths = sorted(random.Random(shard_index).sample(image_paths, limit))
+        else:
+            # Apply limit if requested
+            image_paths = image_paths[:limit]
+    if shards > 1:
+        print(f"[cyan]Shard {shard_index + 1}/{shards}: {len(image_paths)} images[/cyan]")
+    return image_paths
+
+
+def select_shard(
+    image_paths: List[str], input_folder: str, shards: int, shard_index: int
+) -> List[str]:
+    """Return the disjoint, sorted slice of image_paths owned by one shard.
+
+    Images are assigned by a CRC32 of their path relative to input_folder, so every
+    worker computes the same partition regardless of walk order or shuffling.
+    """
+    if not 0 <= shard_index < shards:
+        raise ValueError(f"shard_index must be in [0, {shards}), got {shard_index}")
+
+    selected = [
+        path
+        for path in image_paths
+        if zlib.crc32(os.path.relpath(path, input_folder).encode()) % shards == shard_index
+    ]
+    # Sorted output lets merge_shard_csvs stream-merge the shard files
+    return sorted(selected)
+
+
+def shard_csv_path(output_csv: str, shard_index: int, shards: int) -> str:
+    """Per-worker CSV path next to output_csv, e.g. yolo_labels.shard01-of-04.csv."""
+    base, ext = os.path.splitext(output_csv)
+    return f"{base}.shard{shard_index:02d}-of-{shards:02d}{ext or '.csv'}"
+
+
+def sort_shard_csv(path: str) -> None:
+    """Sort a shard CSV by filename in place, unless it already is.
+
+    Shards follow their image order, which --rect changes to aspect-ratio order. The sort
+    is stable, so an image's rows keep their order.
+    """
+    with open(path, "r", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        rows = list(reader)
+    if all(rows[i][0] <= rows[i + 1][0] for i in range(len(rows) - 1)):
+        return
+    rows.sort(key=lambda r: r[0])
+    tmp = path + ".tmp"
+    with open(tmp, "w", newline="") as f:
+        writer = csv.writer(f)
+        if header:
+            writer.writerow(header)
+        writer.writerows(rows)
+    os.replace(tmp, path)
+
+
+def merge_shard_csvs(shard_files: List[str], output_csv: str) -> int:
+    """Stream-merge per-shard CSVs into output_csv ordered by filename.
+
+    Shards are sorted first (one at a time) if they are not sorted already.
+
+    Returns:
+        Number of detection rows written
+    """
+    for path in shard_files:
+        sort_shard_csv(path)
+    handles = [open(path, "r", newline="") for path in shard_files]
+    rows_written = 0
+    try:
+        readers = [csv.reader(handle) for handle in handles]
+        header = None
+        for reader in readers:
+            header = next(reader, None) or header
+
+        with open(output_csv, "w", newline="") as out:
+            writer = csv.writer(out)
+            if header:
+                writer.writerow(header)
+            # All rows of an image live in one shard, so a filename merge keeps them together
+            for row in heapq.merge(*readers, key=lambda r: r[0]):
+                writer.writerow(row)
+                rows_written += 1
+    finally:
+        for handle in handles:
+            handle.close()
+    return rows_written
+
+
+def run_sharded_autolabel(
+    input_folder: str,
+    output_csv: str,
+    shards: int,
+    worker_args: List[str],
+    labels_dir: Optional[str] = None,
+    torch_threads: Optional[int] = None,
+    model_names: Optional[List[str]] = None,
+) -> Optional[int]:
+    """Label input_folder with `shards` worker processes and merge their outputs.
+
+    Each worker is this script re-invoked with --shard-index, so it loads its own YOLO
+    instance and labels a disjoint slice of the images.
+
+    Args:
+        input_folder: Folder containing images
+        output_csv: Merged CSV path (ignored when labels_dir is set)
+        shards: Number of worker processes
+        worker_args: Extra CLI arguments forwarded to every worker
+        labels_dir: If set, workers write YOLO .txt files there directly and no merge is needed
+        torch_threads: Torch threads per worker (defaults to cpu_count // shards)
+        model_names: For multi-model runs, merge one output per model
+            (see model_output_path) instead of output_csv itself
+
+    Returns:
+        Number of merged CSV rows (or 0 when writing labels directly), None if a worker failed
+    """
+    if torch_threads is None:
+        torch_threads = max(1, (os.cpu_count() or 1) // shards)
+
+    env = dict(os.environ)
+    env["OMP_NUM_THREADS"] = str(torch_threads)
+    env["MKL_NUM_THREADS"] = str(torch_threads)
+
+    shard_files = [shard_csv_path(output_csv, i, shards) for i in range(shards)]
+    print(f"[cyan]Starting {shards} labeling workers ({torch_threads} torch threads each)[/cyan]")
+
+    start = time.perf_counter()
+    procs = []
+    for shard_index in range(shards):
+        cmd = [
+            sys.executable,
+            os.path.abspath(__file__),
+            "--input",
+            input_folder,
+            "--output-csv",
+            shard_files[shard_index],
+            "--shards",
+            str(shards),
+            "--shard-index",
+            str(shard_index),
+            "--torch-threads",
+            str(torch_threads),
+            *worker_args,
+        ]
+        procs.append(subprocess.Popen(cmd, env=env))
+
+    failed = [i for i, proc in enumerate(procs) if proc.wait() != 0]
+    if failed:
+        print(f"[red]Labeling workers failed: shards {failed}[/red]")
+        return None
+
+    print(f"[green]All {shards} workers finished in {time.perf_counter() - start:.1f}s[/green]")
+    if labels_dir is not None:
+        return 0
+
+    if model_names and len(model_names) > 1:
+        outputs = [
+            (model_output_path(output_csv, name), [model_output_path(f, name) for f in shard_files])
+            for name in model_names
+        ]
+    else:
+        outputs = [(output_csv, shard_files)]
+
+    total_rows = 0
+    for merged_path, paths in outputs:
+        if is_detection_store(merged_path):
+            rows = merge_detection_stores(paths, merged_path)
+        else:
+            rows = merge_shard_csvs(paths, merged_path)
+        for path in paths:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+            # Multi-model runs keep no journal
+            if os.path.exists(progress_journal_path(path)):
+                os.remove(progress_journal_path(path))
+        print(f"[green]Merged {rows} detections from {shards} shards into {merged_path}[/green]")
+        total_rows += rows
+    return total_rows
+
+
 def convert_csv_to_yolo_txt(
     csv_file: str,
     images_dir: str,
@@ -92,12 +352,15 @@ def convert_csv_to_yolo_txt(
     confidence_threshold: float = 0.5,
     max_images_per_class: Optional[int] = None,
     balance_classes: bool = False,
-) -> Dict[str, List[Dict]]:
+) -> ImageClasses:
     """
     Convert CSV annotations to YOLO .txt format files.
 
+    Detections are processed in bounded chunks (see label_conversion), so memory does not
+    grow with the size of the CSV. Every box gets the waste class of its image's folder.
+
     Args:
-        csv_file: Path to CSV file with detections
+        csv_file: Path to CSV file or columnar .dets store with detections
         images_dir: Directory containing images
         output_labels_dir: Directory to save .txt label files
         confidence_threshold: Minimum confidence to include detection
@@ -105,93 +368,24 @@ def convert_csv_to_yolo_txt(
         balance_classes: If True, balance by limiting to min class count across classes
 
     Returns:
-        Dictionary mapping image filenames to their annotations
+        Boxes per class of the labeled images; pass it to split_dataset as image_classes
     """
-    os.makedirs(output_labels_dir, exist_ok=True)
-
-    # Collect all image files with relative paths from images_dir
-    image_files = set()
-    images_path = Path(images_dir)
-    for ext in [".jpg", ".jpeg", ".png"]:
-        for img_path in images_path.glob(f"**/*{ext}"):
-            try:
-                rel_path = img_path.relative_to(images_path)
-                image_files.add(str(rel_path))
-            except ValueError:
-                # If relative_to fails, use the full path as fallback
-                image_files.add(str(img_path))
-
-    annotations = {}
-    with open(csv_file, "r") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            filename = row["filename"]
-            confidence = float(row["confidence"])
-
-            if confidence < confidence_threshold:
-                continue
-
-            # Extract folder name from filename (e.g., "glass/image.jpg" -> "glass")
-            folder_name = Path(filename).parent.name if Path(filename).parent.name else ""
-            waste_class_id = map_folder_to_waste_class(folder_name)
-
-            if filename not in annotations:
-                annotations[filename] = []
-
-            annotations[filename].append(
-                {
-                    "class_id": waste_class_id,
-                    "x_center": float(row["x_center"]),
-                    "y_center": float(row["y_center"]),
-                    "width": float(row["width"]),
-                    "height": float(row["height"]),
-                    "confidence": confidence,
-                }
-            )
-
-    # Group images by class and apply limiting/balancing
-    class_to_images = defaultdict(list)
-    for filename, anns in annotations.items():
-        if anns:
-            class_id = anns[0]["class_id"]  # Assumes all anns in image share class (per folder)
-            class_to_images[class_id].append(filename)
-
-    selected_images = set()
-    if balance_classes:
-        # Balance by undersampling to min class count
-        min_count = min(len(imgs) for imgs in class_to_images.values()) if class_to_images else 0
-        effective_max = min_count
-        print(f"Balancing classes: limiting to {min_count} images per class")
-    else:
-        effective_max = max_images_per_class
-
-    for class_id, imgs in class_to_images.items():
-        if effective_max:
-            selected = random.sample(imgs, min(effective_max, len(imgs)))
-        else:
-            selected = imgs
-        selected_images.update(selected)
-        print(f"Class {class_id}: selected {len(selected)}/{len(imgs)} images")
-
-    # Filter annotations to selected images
-    annotations = {
-        filename: anns for filename, anns in annotations.items() if filename in selected_images
-    }
-
-    # Create .txt files for images that have annotations
-    for filename, anns in annotations.items():
-        if filename in image_files:
-            # filename is already like "paper_cardboard/image.jpg", so stem is "paper_cardboard/image"
-            # But we want just "image" for the .txt filename
-            image_stem = Path(filename).stem  # This gives "image" from "paper_cardboard/image.jpg"
-            txt_file = Path(output_labels_dir) / f"{image_stem}.txt"
-            with open(txt_file, "w") as f:
-                for ann in anns:
-                    line = f"{ann['class_id']} {ann['x_center']:.6f} {ann['y_center']:.6f} {ann['width']:.6f} {ann['height']:.6f}\n"
-                    f.write(line)
-
-    print(f"Converted {len(annotations)} images with annotations to YOLO format")
-    return annotations
+    # Relative paths of all image files under images_dir, from the shared image index,
+    # plus the images of a virtual (zip-backed) dataset
+    image_files = {f.relpath for f in index_files(images_dir)}
+    root = os.path.abspath(images_dir)
+    image_files.update(os.path.relpath(p, root) for p in list_virtual_images(images_dir))
+
+    # filename is like "glass/image.jpg": the folder gives the class, the stem the .txt name
+    return convert_detections_to_labels(
+        csv_file,
+        output_labels_dir,
+        lambda filename: map_folder_to_waste_class(Path(filename).parent.name),
+        image_files,
+        confidence_threshold,
+        max_images_per_class,
+        balance_classes,
+    )
 
 
 def convert_json_to_yolo_txt(
@@ -210,17 +404,11 @@ def convert_json_to_yolo_txt(
     """
     os.makedirs(output_labels_dir, exist_ok=True)
 
-    # Collect all image files with relative paths from images_dir
-    image_files = set()
-    images_path = Path(images_dir)
-    for ext in [".jpg", ".jpeg", ".png"]:
-        for img_path in images_path.glob(f"**/*{ext}"):
-            try:
-                rel_path = img_path.relative_to(images_path)
-                image_files.add(str(rel_path))
-            except ValueError:
-                # If relative_to fails, use the full path as fallback
-                image_files.add(str(img_path))
+    # Relative paths of all image files under images_dir, from the shared image index,
+    # plus the images of a virtual (zip-backed) dataset
+    image_files = {f.relpath for f in index_files(images_dir)}
+    root = os.path.abspath(images_dir)
+    image_files.update(os.path.relpath(p, root) for p in list_virtual_images(images_dir))
 
     with open(json_file, "r") as f:
         data = json.load(f)
@@ -282,6 +470,11 @@ def split_dataset(
     val_ratio: float = 0.2,
     test_ratio: float = 0.1,
     balanced: bool = False,
+    materialize: str = "copy",
+    workers: int = DEFAULT_COPY_WORKERS,
+    method: str = "random",
+    hash_key: str = "path",
+    image_classes: Optional[ImageClasses] = None,
 ):
     """
     Split dataset into train/val/test sets.
@@ -293,95 +486,266 @@ def split_dataset(
         train_ratio: Ratio for training set
         val_ratio: Ratio for validation set
         test_ratio: Ratio for test set
+        balanced: Split each class proportionally (hash splits only on average, see
+            split_assign)
+        materialize: How split images are laid out (copy, hardlink, symlink, reflink or
+            listfile, see split_materialize)
+        workers: Threads copying or linking files
+        method: "random" (train_test_split over all images) or "hash" (stable per-image
+            assignment, see split_assign; adding images never moves existing ones)
+        hash_key: What hash assignment hashes: "path" (relative path) or "content"
+        image_classes: Classes of the labeled images, as returned by
+            convert_csv_to_yolo_txt. Balanced splits otherwise use the index saved next to
+            the labels and only read label files that are not in it (see image_classes).
     """
-    output_path = Path(output_dir)
-    images_out = output_path / "images"
-    labels_out = output_path / "labels"
-
-    # Get all image files
-    image_files = []
-    for ext in [".jpg", ".jpeg", ".png"]:
-        image_files.extend(list(Path(images_dir).glob(f"**/*{ext}")))
-
-    # Filter to images that have corresponding label files
-    labeled_images = []
-    for img_path in image_files:
-        label_path = Path(labels_dir) / f"{img_path.stem}.txt"
-        if label_path.exists():
-            labeled_images.append(img_path)
-
-    if not labeled_images:
-        print("[yellow]No labeled images found for splitting[/yellow]")
-        return
-
-    if balanced:
-        # Balanced split: group by class and split proportionally
-        class_images = defaultdict(list)
-        for img_path in labeled_images:
-            label_path = Path(labels_dir) / f"{img_path.stem}.txt"
-            try:
-                with open(label_path, "r") as f:
-                    first_line = f.readline().strip()
-                    if first_line:
-                        class_id = int(first_line.split()[0])
-                        class_images[class_id].append(img_path)
-            except (ValueError, IndexError, FileNotFoundError):
+    # Images that have a corresponding label file; both listings come from the image index.
+    # Only top-level labels count: labels/train|val|test of an earlier split are copies
+    label_stems = set()
+    if os.path.isdir(labels_dir):
+        label_stems = {f.stem for f in index_files(labels_dir, [".txt"]) if os.sep not in f.relpath}
+
+    if method == "hash":
+        if balanced:
+            # Class per label file, from memory or the saved index rather than the files
+            stems = sorted(label_stems)
+            counts = load_label_classes(labels_dir, stems, image_classes).counts
+            label_class = dict(zip(stems, dominant_class(counts).tolist()))
+
+        # One streaming pass: every image is assigned on its own
+        splits = {"train": [], "val": [], "test": []}
+        for indexed in index_files(images_dir):
+            if indexed.stem not in label_stems:
                 continue
-
-        train_files, val_files, test_files = [], [], []
-        for class_id, imgs in class_images.items():
-            if len(imgs) < 3:  # Need at least one for each split
-                # If too few, put all in train
-                train_files.extend(imgs)
+            class_id = label_class[indexed.stem] if balanced else None
+            if balanced and class_id < 0:
                 continue
-            # Split this class
-            class_train, temp = train_test_split(
-                imgs, test_size=(val_ratio + test_ratio), random_state=42
+            key = image_key(images_dir, indexed.relpath, hash_key)
+            split = hash_split(key, train_ratio, val_ratio, test_ratio, class_id)
+            splits[split].append(indexed.relpath)
+        if not any(splits.values()):
+            print("[yellow]No labeled images found for splitting[/yellow]")
+            return
+        train_files, val_files, test_files = splits["train"], splits["val"], splits["test"]
+    else:
+        labeled_images = [
+            Path(images_dir) / f.relpath for f in index_files(images_dir) if f.stem in label_stems
+        ]
+
+        if not labeled_images:
+            print("[yellow]No labeled images found for splitting[/yellow]")
+            return
+
+        if balanced:
+            # Stratified split; images with several classes are balanced for each of them
+            image_stems = [img_path.stem for img_path in labeled_images]
+            counts = load_label_classes(labels_dir, image_stems, image_classes).counts
+            has_class = counts.any(axis=1)
+            labeled_images = [p for p, keep in zip(labeled_images, has_class.tolist()) if keep]
+            assignment = iterative_stratification(
+                counts[has_class], [train_ratio, val_ratio, test_ratio]
+            ).tolist()
+            train_files, val_files, test_files = (
+                [p for p, split in zip(labeled_images, assignment) if split == i] for i in range(3)
             )
-            class_val, class_test = train_test_split(
-                temp, test_size=(test_ratio / (val_ratio + test_ratio)), random_state=42
+        else:
+            # Original random split
+            train_files, temp_files = train_test_split(
+                labeled_images, test_size=(val_ratio + test_ratio), random_state=42
             )
-            train_files.extend(class_train)
-            val_files.extend(class_val)
-            test_files.extend(class_test)
-    else:
-        # Original random split
-        train_files, temp_files = train_test_split(
-            labeled_images, test_size=(val_ratio + test_ratio), random_state=42
-        )
-        val_files, test_files = train_test_split(
-            temp_files, test_size=(test_ratio / (val_ratio + test_ratio)), random_state=42
+            val_files, test_files = train_test_split(
+                temp_files, test_size=(test_ratio / (val_ratio + test_ratio)), random_state=42
+            )
+        splits = {
+            "train": [os.path.relpath(p, images_dir) for p in train_files],
+            "val": [os.path.relpath(p, images_dir) for p in val_files],
+            "test": [os.path.relpath(p, images_dir) for p in test_files],
+        }
+
+    # Drop files that left their split, then place labels and images; files that stay
+    # in place and are up to date are skipped
+    prune_splits(output_dir, splits, materialize)
+    label_pairs = [
+        (
+            os.path.join(labels_dir, f"{Path(rel).stem}.txt"),
+            label_path(output_dir, split, rel, materialize),
         )
-
-    # Copy files
-    for split_name, files in [("train", train_files), ("val", val_files), ("test", test_files)]:
-        img_dest = images_out / split_name
-        label_dest = labels_out / split_name
-        img_dest.mkdir(parents=True, exist_ok=True)
-        label_dest.mkdir(parents=True, exist_ok=True)
-
-        for img_path in files:
-            # Copy image
-            shutil.copy2(img_path, img_dest / img_path.name)
-            # Copy label
-            label_path = Path(labels_dir) / f"{img_path.stem}.txt"
-            if label_path.exists():
-                shutil.copy2(label_path, label_dest / label_path.name)
-
+        for split, relpaths in splits.items()
+        for rel in relpaths
+    ]
+    # Labels are tiny, so listfile copies them: links would keep pointing at the old inode
+    # once materialize_labels replaces the source files, while copies of rewritten labels
+    # fail the size/mtime check and are refreshed by the next split
+    place_files(label_pairs, "copy" if materialize == "listfile" else materialize, workers)
+    data_yaml = materialize_split(images_dir, output_dir, splits, materialize, workers)
+
+    kind = ("balanced " if balanced else "") + method
     print(
-        f"Split dataset ({'balanced' if balanced else 'random'}): {len(train_files)} train, {len(val_files)} val, {len(test_files)} test images"
+        f"Split dataset ({kind}): {len(train_files)} train, {len(val_files)} val, "
+        f"{len(test_files)} test images ({materialize}, {data_yaml})"
     )
 
 
-def run_yolo_autolabel(
-    input_folder: str,
-    output_csv: str,
-    model_name: str = "yolov8n.pt",
-    limit: int = 0,
-    confidence_threshold: float = 0.5,
-    labels_dir: Optional[str] = None,
-) -> Optional[int]:
-    """Run YOLO auto-labeling on images and save results to CSV."""
+JOURNAL_COMMIT = "#commit"
+
+
+def progress_journal_path(output_csv: str, labels_dir: Optional[str] = None) -> str:
+    """Progress journal location for a labeling run."""
+    if labels_dir is None:
+        return f"{output_csv}.progress"
+    # Keyed by output_csv so shard workers sharing labels_dir keep separate journals
+    return os.path.join(labels_dir, f".{Path(output_csv).stem}.progress")
+
+
+def load_progress_journal(journal_path: str) -> Tuple[set, Optional[int]]:
+    """Read a progress journal.
+
+    The journal lists finished image filenames, each batch closed by a
+    "#commit <csv byte offset>" line. Names after the last commit belong to a batch
+    that may not have been fully written and are ignored.
+
+    Returns:
+        Tuple of (committed filenames, CSV byte offset of the last commit or None)
+    """
+    done, pending, offset = set(), [], None
+    if not os.path.exists(journal_path):
+        return done, offset
+
+    with open(journal_path, "r") as f:
+        for line in f:
+            if not line.endswith("\n"):
+                break  # Torn final line from a killed process
+            line = line[:-1]
+            if line.startswith(JOURNAL_COMMIT):
+                done.update(pending)
+                pending = []
+                offset = int(line.split()[1])
+            elif line:
+                pending.append(line)
+    return done, offset
+
+
+def open_progress_journal(journal_path: str, done: set, csv_offset: Optional[int]):
+    """Open the journal for appending, keeping only the commits being resumed from."""
+    os.makedirs(os.path.dirname(journal_path) or ".", exist_ok=True)
+    if not done:
+        return open(journal_path, "w")
+
+    # Rewrite without the uncommitted tail so later commits cannot adopt it
+    tmp_path = f"{journal_path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.writelines(f"{name}\n" for name in sorted(done))
+        f.write(f"{JOURNAL_COMMIT} {csv_offset or 0}\n")
+    os.replace(tmp_path, journal_path)
+    return open(journal_path, "a")
+
+
+def commit_progress(journal, filenames: List[str], csv_offset: int) -> None:
+    """Append one finished batch to the journal."""
+    journal.writelines(f"{name}\n" for name in filenames)
+    journal.write(f"{JOURNAL_COMMIT} {csv_offset}\n")
+    journal.flush()
+
+
+def extract_raw_detections(result, prepared) -> np.ndarray:
+    """Convert one image's boxes to rows of [x, y, w, h, conf, cls] normalized to the original.
+
+    The whole box tensor is moved to NumPy once instead of per box.
+    """
+    boxes = result.boxes
+    if boxes is None or not len(boxes):
+        return np.zeros((0, 6), dtype=np.float32)
+    data = boxes.data.cpu().numpy()  # xyxy, [track id,] conf, cls
+    xywhn = unletterbox_xywhn(data[:, :4], prepared.ratio, prepared.pad, prepared.orig_shape)
+    return np.column_stack([xywhn, data[:, -2], data[:, -1]]).astype(np.float32, copy=False)
+
+
+def select_detections(raw: np.ndarray, confidence_threshold: float) -> np.ndarray:
+    """Keep rows at or above the threshold with a single vectorized mask."""
+    return raw[raw[:, 4] >= confidence_threshold]
+
+
+def batch_inputs(items) -> List[Tuple[List[int], torch.Tensor]]:
+    """Model inputs for prepared images: (item indices, float NCHW tensor) per input shape.
+
+    Items are stacked into one tensor per input shape (a rectangular batch plus square
+    re-decoded images can meet here during a cascade). Ultralytics neither letterboxes
+    nor modifies tensor inputs, so the same inputs can be fed to several models.
+    """
+    by_shape = defaultdict(list)
+    for i, item in enumerate(items):
+        by_shape[item.image.shape].append(i)
+    # uint8 NCHW -> float [0, 1]
+    return [
+        (indices, torch.from_numpy(stack_batch([items[i] for i in indices])).float().div_(255.0))
+        for indices in by_shape.values()
+    ]
+
+
+def predict_raw_detections(
+    model,
+    items,
+    imgsz: int,
+    conf_floor: float,
+    inputs: Optional[List[Tuple[List[int], torch.Tensor]]] = None,
+) -> List[np.ndarray]:
+    """Run the model over prepared images and return raw detections in item order.
+
+    Args:
+        model: Loaded YOLO model
+        items: Prepared images
+        imgsz: Inference size
+        conf_floor: Confidence passed to the model
+        inputs: batch_inputs(items), when already built for another model
+    """
+    if inputs is None:
+        inputs = batch_inputs(items)
+    detections = [None] * len(items)
+    for indices, tensor in inputs:
+        results = model.predict(tensor, save=False, verbose=False, imgsz=imgsz, conf=conf_floor)
+        for i, result in zip(indices, results):
+            detections[i] = extract_raw_detections(result, items[i])
+    return detections
+
+
+def needs_escalation(
+    raw: np.ndarray, confidence_threshold: float, band: Tuple[float, float]
+) -> bool:
+    """True if an image has no detection above the threshold or its best one is in band."""
+    if not len(raw):
+        return True
+    best = float(raw[:, 4].max())
+    return best < confidence_threshold or band[0] <= best < band[1]
+
+
+def _weights_digest(model, model_name: str) -> str:
+    """Hash of the loaded weights file, falling back to the model name."""
+    weights_path = getattr(model, "ckpt_path", None) or model_name
+    if os.path.isfile(weights_path):
+        return file_digest(weights_path)
+    return model_name
+
+
+def _model_stride(model) -> int:
+    """Largest stride of the loaded network; rectangular inputs must be multiples of it."""
+    stride = getattr(model.model, "stride", None)
+    return int(stride.max()) if stride is not None else DEFAULT_STRIDE
+
+
+def _relative_name(image_path: str, input_folder: str) -> str:
+    """Filename recorded for an image: its path relative to the input folder."""
+    try:
+        return os.path.relpath(image_path, input_folder)
+    except ValueError:
+        # Fallback to basename if relpath fails
+        return os.path.basename(image_path)
+
+
+def load_yolo_model(model_name: str) -> Optional[YOLO]:
+    """Load a YOLO model, retrying with safe globals for PyTorch 2.6+ weights_only loading.
+
+    Returns:
+        The model, or None if it could not be loaded
+    """
     print(f"[cyan]Loading YOLO model: {model_name}[/cyan]")
 
     try:
@@ -393,7 +757,6 @@ def run_yolo_autolabel(
             print("[yellow]PyTorch 2.6+ detected, attempting to load with safe globals...[/yellow]")
             try:
                 # Handle PyTorch 2.6+ weights_only issue by allowing comprehensive set of classes
-                import torch.serialization
                 import torch.nn as nn
 
                 # Add comprehensive list of PyTorch classes
@@ -426,137 +789,548 @@ def run_yolo_autolabel(
             print(f"[red]Failed to load YOLO model: {e}[/red]")
             return None
 
-    print(f"[cyan]Running auto-labeling on {input_folder}[/cyan]")
+    return model
 
-    # Collect all image paths
-    try:
-        image_paths = collect_image_paths(input_folder)
-    except FileNotFoundError as e:
-        logger.error(str(e))
-        print(f"[red]{e}[/red]")
+
+def run_yolo_autolabel(
+    input_folder: str,
+    output_csv: str,
+    model_name: str = "yolov8n.pt",
+    limit: int = 0,
+    confidence_threshold: float = 0.5,
+    labels_dir: Optional[str] = None,
+    batch_size: int = 16,
+    decode_workers: int = 4,
+    imgsz: int = 640,
+    shards: int = 1,
+    shard_index: int = 0,
+    torch_threads: Optional[int] = None,
+    resume: bool = False,
+    cache_path: Optional[str] = None,
+    cache_max_mb: int = 1024,
+    conf_floor: float = DEFAULT_CONF_FLOOR,
+    rect: bool = False,
+    cascade_model: Optional[str] = None,
+    cascade_band: Tuple[float, float] = DEFAULT_CASCADE_BAND,
+) -> Optional[int]:
+    """Run YOLO auto-labeling on images and save results to CSV.
+
+    If output_csv is a columnar store path (*.dets, see detection_store.py) detections
+    are written there as typed columns instead.
+
+    Images are decoded and letterboxed by a pool of decode_workers threads while the
+    previous batch of batch_size images runs through the model. With shards > 1 only
+    the slice selected by select_shard is labeled (see run_sharded_autolabel).
+
+    Output is flushed after every batch and the batch is then committed to an
+    append-only progress journal; with resume=True images committed by an earlier,
+    interrupted run are skipped.
+
+    If cache_path is set, raw detections are looked up by image content hash (plus
+    weights hash, imgsz and confidence floor) before decoding, and stored after inference.
+
+    conf_floor is the confidence passed to the model; set confidence_threshold to the
+    same value to keep every candidate box for materialize_labels.py.
+
+    With rect=True images are batched by aspect ratio (from file headers) and each batch
+    is letterboxed to a stride-aligned rectangle instead of an imgsz square, so far less
+    compute goes into padding. Boxes are still normalized to the original images.
+
+    With cascade_model set, model_name acts as a fast first pass. Images with no
+    detection above confidence_threshold, or whose best confidence falls inside
+    cascade_band, are re-run with cascade_model and take its detections instead.
+    """
+    if torch_threads:
+        torch.set_num_threads(torch_threads)
+
+    model = load_yolo_model(model_name)
+    if model is None:
         return None
+    escalation_model = None
+    if cascade_model:
+        escalation_model = load_yolo_model(cascade_model)
+        if escalation_model is None:
+            return None
 
-    if not image_paths:
-        logger.warning(f"No images found in {input_folder}")
-        print(f"[yellow]No images found in {input_folder}[/yellow]")
+    print(f"[cyan]Running auto-labeling on {input_folder}[/cyan]")
+    image_paths = collect_run_images(input_folder, shards, shard_index)
+    if image_paths is None:
         return None
 
-    # Apply limit if requested
-    if limit and limit > 0:
-        image_paths = image_paths[:limit]
+    journal_path = progress_journal_path(output_csv, labels_dir)
+    done, csv_offset = load_progress_journal(journal_path) if resume else (set(), None)
+    if labels_dir is None and (csv_offset is None or not os.path.exists(output_csv)):
+        # Without a committed CSV offset there is nothing trustworthy to resume from
+        done = set()
+    if done:
+        image_paths = [p for p in image_paths if _relative_name(p, input_folder) not in done]
+        print(
+            f"[cyan]Resuming: {len(done)} images already labeled, "
+            f"{len(image_paths)} remaining[/cyan]"
+        )
 
+    image_paths = limit_images(image_paths, limit, shards, shard_index)
     print(f"[cyan]Processing {len(image_paths)} images with {model_name}[/cyan]")
 
-    # Prepare CSV file or labels dir
-    if labels_dir is None:
+    # Prepare CSV file, columnar store or labels dir
+    fieldnames = ["filename", "x_center", "y_center", "width", "height", "confidence", "class_id"]
+    store_writer = None
+    if labels_dir is None and is_detection_store(output_csv):
+        # For stores the journal offset is a row count rather than a byte offset
+        store_writer = DetectionStoreWriter(output_csv, csv_offset if done else None)
+    elif labels_dir is None:
         os.makedirs(os.path.dirname(output_csv) or ".", exist_ok=True)
         try:
-            csvfile = open(output_csv, "w", newline="")
-            csv_writer = csv.DictWriter(
-                csvfile,
-                fieldnames=[
-                    "filename",
-                    "x_center",
-                    "y_center",
-                    "width",
-                    "height",
-                    "confidence",
-                    "class_id",
-                ],
-            )
-            csv_writer.writeheader()
+            if done:
+                # Drop rows of a batch that was written but never committed
+                with open(output_csv, "r+b") as f:
+                    f.truncate(csv_offset)
+                csvfile = open(output_csv, "a", newline="")
+                csv_writer = csv.writer(csvfile)
+            else:
+                csvfile = open(output_csv, "w", newline="")
+                csv_writer = csv.writer(csvfile)
+                csv_writer.writerow(fieldnames)
         except IOError as e:
             logger.error(f"Failed to open CSV file: {e}")
             return None
     else:
         os.makedirs(labels_dir, exist_ok=True)
-        detections = []  # List to collect detections
+
+    journal = open_progress_journal(journal_path, done, csv_offset)
 
     processed_count = 0
-    CHUNK_SIZE = 50
+    labeled_images = 0
+    decode_wait = 0.0
+    infer_time = 0.0
+    inferred = 0
+    input_pixels = 0
+    escalated = 0
+    escalation_inferred = 0  # Escalated images the second model actually ran on
+    escalation_time = 0.0
+    next_report = 1000
+    run_start = time.perf_counter()
+
+    cache = None
+    lookup = None
+    if cache_path:
+        cache = DetectionCache(cache_path, cache_max_mb * 1024 * 1024)
+        weights_digest = _weights_digest(model, model_name)
+        # Rectangular inputs give slightly different detections than square ones
+        cache_size = f"{imgsz}rect" if rect else imgsz
+        if escalation_model is not None:
+            escalation_digest = _weights_digest(escalation_model, cascade_model)
+
+        def cache_key(image_digest: str, weights: Optional[str] = None) -> str:
+            return DetectionCache.make_key(
+                image_digest, weights or weights_digest, cache_size, conf_floor
+            )
+
+        def lookup(image_digest: str):
+            return cache.get(cache_key(image_digest))
 
     try:
-        for chunk_start in range(0, len(image_paths), CHUNK_SIZE):
-            chunk_paths = image_paths[chunk_start : chunk_start + CHUNK_SIZE]
-            try:
-                results_iterator = model.predict(
-                    chunk_paths,
-                    save=False,
-                    save_conf=True,
-                    verbose=False,
-                    stream=True,
-                    workers=0,
-                    batch=1,
-                )
-            except Exception as e:
-                logger.error(f"YOLO prediction failed for chunk: {e}")
+        batches = iter_prepared_batches(
+            image_paths,
+            imgsz,
+            batch_size,
+            decode_workers,
+            lookup=lookup,
+            rect=rect,
+            stride=_model_stride(model),
+        )
+        while True:
+            wait_start = time.perf_counter()
+            batch = next(batches, None)
+            decode_wait += time.perf_counter() - wait_start
+            if batch is None:
+                break
+            if not batch:
                 continue
 
-            for result in results_iterator:
-                image_path = str(result.path)
-                # Store relative path from input folder instead of just basename
+            # Cache hits arrive without pixels; only the misses go through the model
+            raw_detections = {item.path: item.cached for item in batch if item.cached is not None}
+            to_infer = [item for item in batch if item.cached is None]
+            if to_infer:
+                infer_start = time.perf_counter()
                 try:
-                    filename = os.path.relpath(image_path, input_folder)
-                except ValueError:
-                    # Fallback to basename if relpath fails
-                    filename = os.path.basename(image_path)
-
-                if result.boxes is not None:
-                    for box in result.boxes:
-                        bbox = box.xywhn[0].cpu().numpy()
-                        confidence = float(box.conf[0].cpu().numpy())
-                        class_id = int(box.cls[0].cpu().numpy())
-
-                        if confidence >= confidence_threshold:
-                            # Extract folder name from filename (e.g., "glass/image.jpg" -> "glass")
-                            folder_name = (
-                                Path(filename).parent.name if Path(filename).parent.name else ""
-                            )
-                            waste_class_id = map_folder_to_waste_class(folder_name)
-                            detection = {
-                                "filename": filename,
-                                "x_center": float(bbox[0]),
-                                "y_center": float(bbox[1]),
-                                "width": float(bbox[2]),
-                                "height": float(bbox[3]),
-                                "confidence": confidence,
-                                "class_id": waste_class_id,
-                            }
-                            if labels_dir is None:
-                                csv_writer.writerow(detection)
-                            else:
-                                detections.append(detection)
-
+                    detections = predict_raw_detections(model, to_infer, imgsz, conf_floor)
+                except Exception as e:
+                    logger.error(f"YOLO prediction failed for batch: {e}")
+                    continue
+                infer_time += time.perf_counter() - infer_start
+                inferred += len(to_infer)
+                input_pixels += sum(item.image.shape[1] * item.image.shape[2] for item in to_infer)
+
+                raw_detections.update(zip((item.path for item in to_infer), detections))
+                if cache is not None:
+                    cache.put_many(
+                        (cache_key(item.digest), raw_detections[item.path]) for item in to_infer
+                    )
+
+            if escalation_model is not None:
+                uncertain = [
+                    item
+                    for item in batch
+                    if needs_escalation(
+                        raw_detections[item.path], confidence_threshold, cascade_band
+                    )
+                ]
+                if uncertain:
+                    escalation_start = time.perf_counter()
+                    try:
+                        second_stage, second_inferred = _escalate(
+                            escalation_model,
+                            uncertain,
+                            imgsz,
+                            conf_floor,
+                            cache,
+                            lambda digest: cache_key(digest, escalation_digest),
+                        )
+                    except Exception as e:
+                        # The first model's detections still stand for this batch
+                        logger.error(
+                            f"Cascade prediction failed for batch, keeping first pass: {e}"
+                        )
+                    else:
+                        raw_detections.update(second_stage)
+                        escalation_time += time.perf_counter() - escalation_start
+                        escalated += len(uncertain)
+                        escalation_inferred += second_inferred
+
+            batch_filenames = []
+            csv_rows = []
+            label_blocks = []
+            for prepared in batch:
+                filename = _relative_name(prepared.path, input_folder)
+                batch_filenames.append(filename)
                 processed_count += 1
 
-            if processed_count % 1000 == 0:
-                print(f"[cyan]Processed {processed_count}/{len(image_paths)} images...[/cyan]")
+                kept = select_detections(raw_detections[prepared.path], confidence_threshold)
+                if not len(kept):
+                    continue
+
+                # Extract folder name from filename (e.g., "glass/image.jpg" -> "glass")
+                waste_class_id = map_folder_to_waste_class(
+                    os.path.basename(os.path.dirname(filename))
+                )
+                if store_writer is not None:
+                    store_writer.add(filename, kept[:, :4], kept[:, 4], waste_class_id)
+                elif labels_dir is None:
+                    csv_rows.extend(
+                        (filename, x, y, w, h, conf, waste_class_id)
+                        for x, y, w, h, conf in kept[:, :5].tolist()
+                    )
+                else:
+                    label_blocks.append((filename, waste_class_id, kept[:, :4]))
+
+            # Flush this batch's output before committing it to the journal
+            if store_writer is not None:
+                commit_progress(journal, batch_filenames, store_writer.flush())
+            elif labels_dir is None:
+                csv_writer.writerows(csv_rows)
+                csvfile.flush()
+                commit_progress(journal, batch_filenames, csvfile.tell())
+            else:
+                labeled_images += write_yolo_label_files(labels_dir, label_blocks)
+                commit_progress(journal, batch_filenames, 0)
+
+            if processed_count >= next_report:
+                elapsed = time.perf_counter() - run_start
+                print(
+                    f"[cyan]Processed {processed_count}/{len(image_paths)} images "
+                    f"({processed_count / elapsed:.1f} img/s)...[/cyan]"
+                )
+                next_report += 1000
 
     finally:
-        if labels_dir is None:
+        journal.close()
+        if store_writer is not None:
+            store_writer.close()
+        elif labels_dir is None:
             csvfile.close()
+        if cache is not None:
+            print(f"[cyan]Detection cache: {cache.summary()}[/cyan]")
+            cache.close()
 
-    # If writing to labels_dir, create .txt files
     if labels_dir is not None:
-        annotations = defaultdict(list)
-        for det in detections:
-            annotations[det["filename"]].append(det)
-
-        for filename, anns in annotations.items():
-            image_stem = Path(filename).stem
-            txt_file = Path(labels_dir) / f"{image_stem}.txt"
-            with open(txt_file, "w") as f:
-                for ann in anns:
-                    line = f"{ann['class_id']} {ann['x_center']:.6f} {ann['y_center']:.6f} {ann['width']:.6f} {ann['height']:.6f}\n"
-                    f.write(line)
-        print(f"Created YOLO .txt files for {len(annotations)} images directly")
+        print(f"Created YOLO .txt files for {labeled_images} images directly")
 
     print(
         f"[green]Auto-labeling complete! {'Saved detections to ' + output_csv if labels_dir is None else 'Created YOLO labels directly'}[/green]"
     )
+    print_throughput_report(
+        processed_count,
+        inferred,
+        time.perf_counter() - run_start,
+        decode_wait,
+        infer_time,
+        batch_size,
+        decode_workers,
+    )
+    if escalation_model is not None:
+        print_cascade_report(
+            processed_count,
+            escalated,
+            inferred,
+            escalation_inferred,
+            infer_time,
+            escalation_time,
+            model_name,
+            cascade_model,
+        )
+    if rect and inferred:
+        area = 100.0 * input_pixels / (inferred * imgsz * imgsz)
+        print(
+            f"[cyan]  Rectangular batches: input area {area:.0f}% of "
+            f"{imgsz}x{imgsz} letterboxing[/cyan]"
+        )
+    return processed_count
+
+
+def model_output_path(output_csv: str, model_name: str) -> str:
+    """Per-model detection output next to output_csv, e.g. yolo_labels.yolov8s.csv.
+
+    Trained weights are named after their run, e.g. training_results/waste_detector/
+    weights/best.pt -> yolo_labels.waste_detector-best.csv.
+    """
+    weights = Path(model_name)
+    tag = weights.stem
+    if weights.parent.name == "weights" and weights.parent.parent.name:
+        tag = f"{weights.parent.parent.name}-{tag}"
+    base, ext = os.path.splitext(output_csv)
+    return f"{base}.{tag}{ext or '.csv'}"
+
+
+def run_multi_model_autolabel(
+    input_folder: str,
+    output_csv: str,
+    model_names: List[str],
+    limit: int = 0,
+    confidence_threshold: float = 0.5,
+    batch_size: int = 16,
+    decode_workers: int = 4,
+    imgsz: int = 640,
+    shards: int = 1,
+    shard_index: int = 0,
+    torch_threads: Optional[int] = None,
+    conf_floor: float = DEFAULT_CONF_FLOOR,
+    rect: bool = False,
+) -> Optional[int]:
+    """Label images with several models, decoding and letterboxing each image once.
+
+    Every batch is prepared by the same decode pipeline as run_yolo_autolabel and the
+    same input tensor is fed to each model in turn. Detections go to one CSV or store
+    per model (see model_output_path), so candidate labelers can be compared.
+
+    Returns:
+        Number of images processed, or None if a model or the images could not be loaded
+    """
+    if torch_threads:
+        torch.set_num_threads(torch_threads)
+
+    models = []
+    for model_name in model_names:
+        model = load_yolo_model(model_name)
+        if model is None:
+            return None
+        models.append(model)
+
+    print(f"[cyan]Running auto-labeling on {input_folder}[/cyan]")
+    image_paths = collect_run_images(input_folder, shards, shard_index)
+    if image_paths is None:
+        return None
+    image_paths = limit_images(image_paths, limit, shards, shard_index)
+    print(f"[cyan]Processing {len(image_paths)} images with {len(models)} models[/cyan]")
+
+    output_paths = [model_output_path(output_csv, name) for name in model_names]
+    if len(set(output_paths)) != len(output_paths):
+        print(f"[red]Models map to the same output file: {output_paths}[/red]")
+        return None
+    writers = [open_detection_writer(path) for path in output_paths]
+
+    processed_count = 0
+    decode_wait = 0.0
+    prep_time = 0.0
+    infer_times = [0.0] * len(models)
+    detection_counts = [0] * len(models)
+    labeled_counts = [0] * len(models)
+    next_report = 1000
+    run_start = time.perf_counter()
+
+    try:
+        batches = iter_prepared_batches(
+            image_paths,
+            imgsz,
+            batch_size,
+            decode_workers,
+            rect=rect,
+            stride=max(_model_stride(model) for model in models),
+        )
+        while True:
+            wait_start = time.perf_counter()
+            batch = next(batches, None)
+            decode_wait += time.perf_counter() - wait_start
+            if batch is None:
+                break
+            if not batch:
+                continue
+
+            filenames = [_relative_name(item.path, input_folder) for item in batch]
+            waste_class_ids = [
+                map_folder_to_waste_class(os.path.basename(os.path.dirname(filename)))
+                for filename in filenames
+            ]
+            # Stacked and converted to float once, then fed to every model
+            prep_start = time.perf_counter()
+            inputs = batch_inputs(batch)
+            prep_time += time.perf_counter() - prep_start
+            for m, model in enumerate(models):
+                infer_start = time.perf_counter()
+                try:
+                    detections = predict_raw_detections(model, batch, imgsz, conf_floor, inputs)
+                except Exception as e:
+                    logger.error(f"YOLO prediction failed for batch with {model_names[m]}: {e}")
+                    detections = [np.zeros((0, 6), dtype=np.float32)] * len(batch)
+                infer_times[m] += time.perf_counter() - infer_start
+
+                for filename, class_id, raw in zip(filenames, waste_class_ids, detections):
+                    kept = select_detections(raw, confidence_threshold)
+                    if len(kept):
+                        writers[m].add(filename, kept[:, :4], kept[:, 4], class_id)
+                        detection_counts[m] += len(kept)
+                        labeled_counts[m] += 1
+                writers[m].flush()
+
+            processed_count += len(batch)
+            if processed_count >= next_report:
+                elapsed = time.perf_counter() - run_start
+                print(
+                    f"[cyan]Processed {processed_count}/{len(image_paths)} images "
+                    f"({processed_count / elapsed:.1f} img/s)...[/cyan]"
+                )
+                next_report += 1000
+    finally:
+        for writer in writers:
+            writer.close()
+
+    elapsed = time.perf_counter() - run_start
+    print(
+        f"[green]Labeled {processed_count} images with {len(models)} models in {elapsed:.1f}s; "
+        f"each image was decoded once (decode wait {decode_wait:.1f}s, "
+        f"batch tensors {prep_time:.1f}s)[/green]"
+    )
+    for name, path, infer_time, labeled, detections in zip(
+        model_names, output_paths, infer_times, labeled_counts, detection_counts
+    ):
+        rate = processed_count / infer_time if infer_time > 0 else 0.0
+        print(
+            f"[cyan]  {name}: {detections} detections on {labeled}/{processed_count} images, "
+            f"inference {infer_time:.1f}s ({rate:.1f} img/s) -> {path}[/cyan]"
+        )
     return processed_count
 
 
+def print_throughput_report(
+    processed: int,
+    inferred: int,
+    elapsed: float,
+    decode_wait: float,
+    infer_time: float,
+    batch_size: int,
+    decode_workers: int,
+) -> None:
+    """Print images/sec and where the time went, to help size --batch per machine."""
+    if processed == 0 or elapsed <= 0:
+        return
+    print(
+        f"[cyan]Throughput: {processed / elapsed:.1f} img/s over {elapsed:.1f}s "
+        f"(batch={batch_size}, decode workers={decode_workers})[/cyan]"
+    )
+    # Cache hits never reach the model, so the inference rate only counts inferred images
+    infer_rate = f"{inferred / infer_time:.1f} img/s" if infer_time > 0 else "all cached"
+    print(
+        f"[cyan]  inference {infer_time:.1f}s ({infer_rate}), "
+        f"waiting on decode {decode_wait:.1f}s[/cyan]"
+    )
+    if 0 < infer_time < decode_wait:
+        print("[yellow]  Decoding is the bottleneck - consider raising --decode-workers[/yellow]")
+
+
+def _escalate(
+    model, items, imgsz, conf_floor, cache, cache_key
+) -> Tuple[Dict[str, np.ndarray], int]:
+    """Raw detections of the cascade's second model for the given prepared images.
+
+    Images that came from the first model's cache have no pixels and are decoded again
+    (square letterbox) unless the second model's detections are cached as well.
+
+    Returns:
+        Detections per image path, and the number of images the model ran on
+    """
+    detections = {}
+    to_infer = []
+    for item in items:
+        if item.image is None:
+            cached = cache.get(cache_key(item.digest)) if cache is not None else None
+            if cached is not None:
+                detections[item.path] = cached
+                continue
+            decoded = load_letterboxed(item.path, imgsz)
+            if decoded is None:
+                continue
+            item = decoded._replace(digest=item.digest)
+        to_infer.append(item)
+
+    if to_infer:
+        results = predict_raw_detections(model, to_infer, imgsz, conf_floor)
+        detections.update(zip((item.path for item in to_infer), results))
+        if cache is not None:
+            cache.put_many(
+                (cache_key(item.digest), detections[item.path])
+                for item in to_infer
+                if item.digest is not None
+            )
+    return detections, len(to_infer)
+
+
+def print_cascade_report(
+    processed: int,
+    escalated: int,
+    inferred: int,
+    escalation_inferred: int,
+    first_time: float,
+    escalation_time: float,
+    model_name: str,
+    cascade_model: str,
+) -> None:
+    """Print how many images were escalated and the time saved over the large model alone.
+
+    The comparison only counts inference: the large model's time per image it actually
+    ran on, extrapolated to the images the first model ran on. Cache hits cost neither.
+    """
+    if processed == 0:
+        return
+    print(
+        f"[cyan]Cascade: {escalated}/{processed} images ({100.0 * escalated / processed:.1f}%) "
+        f"escalated from {model_name} to {cascade_model}[/cyan]"
+    )
+    if escalation_inferred == 0:
+        return
+    # Extrapolate the large model's per-image cost to every image inferred this run
+    large_only = escalation_time / escalation_inferred * inferred
+    spent = first_time + escalation_time
+    print(
+        f"[cyan]  inference {spent:.1f}s vs ~{large_only:.1f}s for {cascade_model} on every "
+        f"image (saved ~{large_only - spent:.1f}s)[/cyan]"
+    )
+    if spent > large_only:
+        print(
+            "[yellow]  Too many images escalate to pay off - "
+            "consider narrowing --cascade-band[/yellow]"
+        )
+
+
 def validate_labels(labels_dir: str) -> bool:
     """Validate YOLO label files."""
     print("[cyan]Validating YOLO labels...[/cyan]")
@@ -568,6 +1342,44 @@ def validate_labels(labels_dir: str) -> bool:
     return valid
 
 
+def _shard_worker_args(args: argparse.Namespace) -> List[str]:
+    """CLI arguments forwarded from the orchestrator to each shard worker."""
+    # Spread --limit across workers so the total stays close to what was asked for
+    limit = -(-args.limit // args.shards) if args.limit else 0
+    worker_args = [
+        "--model",
+        *args.models,
+        "--limit",
+        str(limit),
+        "--confidence-threshold",
+        str(args.confidence_threshold),
+        "--batch",
+        str(args.batch),
+        "--decode-workers",
+        str(args.decode_workers),
+        "--imgsz",
+        str(args.imgsz),
+        "--conf-floor",
+        str(args.conf_floor),
+        "--output-dataset",
+        args.output_dataset,
+    ]
+    if args.rect:
+        worker_args.append("--rect")
+    if args.cascade_model:
+        worker_args += ["--cascade-model", args.cascade_model, "--cascade-band"]
+        worker_args += [str(value) for value in args.cascade_band]
+    if args.no_csv:
+        worker_args.append("--no-csv")
+    if args.resume:
+        worker_args.append("--resume")
+    if args.cache:
+        worker_args += ["--cache", args.cache, "--cache-max-mb", str(args.cache_max_mb)]
+    if args.verbose:
+        worker_args.append("--verbose")
+    return worker_args
+
+
 def main() -> None:
     """Main entry point for auto-labeling script."""
     parser = argparse.ArgumentParser(
@@ -583,6 +1395,12 @@ def main() -> None:
         default="yolo_labels.csv",
         help="Output CSV file for bounding box labels",
     )
+    parser.add_argument(
+        "--output-format",
+        choices=["csv", "columnar"],
+        default="csv",
+        help="Detection output format; columnar writes a typed .dets store next to --output-csv",
+    )
     parser.add_argument(
         "--output-dataset",
         type=str,
@@ -592,13 +1410,15 @@ def main() -> None:
     parser.add_argument(
         "--model",
         type=str,
-        default="yolov8n.pt",
-        help="YOLO model to use",
+        nargs="+",
+        default=["yolov8n.pt"],
+        help="YOLO model to use; several models label every image from one decode pass "
+        "and write one output per model",
     )
     parser.add_argument(
         "--convert-csv",
         type=str,
-        help="Convert existing CSV to YOLO format instead of running auto-labeling",
+        help="Convert existing CSV (or .dets store) to YOLO format instead of auto-labeling",
     )
     parser.add_argument(
         "--convert-json",
@@ -636,6 +1456,86 @@ def main() -> None:
         default=0,
         help="Limit images processed (0 means all)",
     )
+    parser.add_argument(
+        "--batch",
+        type=int,
+        default=16,
+        help="Images per inference batch",
+    )
+    parser.add_argument(
+        "--decode-workers",
+        type=int,
+        default=4,
+        help="Threads decoding and letterboxing the next batch (0 decodes inline)",
+    )
+    parser.add_argument(
+        "--imgsz",
+        type=int,
+        default=640,
+        help="Inference image size",
+    )
+    parser.add_argument(
+        "--rect",
+        action="store_true",
+        help="Batch images by aspect ratio and letterbox to rectangles instead of squares",
+    )
+    parser.add_argument(
+        "--cascade-model",
+        type=str,
+        help="Larger model that re-labels images --model is unsure about (e.g. yolov8x.pt)",
+    )
+    parser.add_argument(
+        "--cascade-band",
+        type=float,
+        nargs=2,
+        metavar=("LOW", "HIGH"),
+        default=list(DEFAULT_CASCADE_BAND),
+        help="Escalate images whose best confidence is in [LOW, HIGH) or that have no detection",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=1,
+        help="Split labeling across N worker processes, each with its own model",
+    )
+    parser.add_argument(
+        "--shard-index",
+        type=int,
+        help="Label only this shard and exit (set by the orchestrator for each worker)",
+    )
+    parser.add_argument(
+        "--torch-threads",
+        type=int,
+        help="Torch intra-op threads per process (defaults to cpu_count / shards)",
+    )
+    parser.add_argument(
+        "--cache",
+        type=str,
+        help="SQLite detection cache keyed by image/weights hash (e.g. .cache/detections.db)",
+    )
+    parser.add_argument(
+        "--cache-max-mb",
+        type=int,
+        default=1024,
+        help="Evict least recently used cache entries beyond this size",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip images committed to the progress journal by an interrupted run",
+    )
+    parser.add_argument(
+        "--raw",
+        action="store_true",
+        help="Keep every box down to --conf-floor and stop after labeling; "
+        "pick thresholds later with materialize_labels.py",
+    )
+    parser.add_argument(
+        "--conf-floor",
+        type=float,
+        help=f"Confidence passed to the model (default {DEFAULT_CONF_FLOOR}, "
+        f"or {RAW_CONF_FLOOR} with --raw)",
+    )
     parser.add_argument(
         "--no-csv",
         action="store_true",
@@ -646,6 +1546,32 @@ def main() -> None:
         action="store_true",
         help="Create balanced dataset by ensuring proportional class distribution in train/val/test splits",
     )
+    parser.add_argument(
+        "--split-method",
+        choices=["random", "hash"],
+        default="random",
+        help="random: train_test_split over all images; hash: stable per-image assignment "
+        "from a hash, so adding images never moves existing ones",
+    )
+    parser.add_argument(
+        "--hash-key",
+        choices=HASH_KEYS,
+        default="path",
+        help="What --split-method hash hashes: relative path, or image content",
+    )
+    parser.add_argument(
+        "--materialize",
+        choices=MATERIALIZE_MODES,
+        default="copy",
+        help="How split images are laid out: copies, hard/symbolic links, reflinks, or "
+        "listfile (train.txt/val.txt/test.txt path lists, no per-image files)",
+    )
+    parser.add_argument(
+        "--copy-workers",
+        type=int,
+        default=DEFAULT_COPY_WORKERS,
+        help="Threads copying or linking files into the splits",
+    )
     parser.add_argument(
         "--max-images-per-class",
         type=int,
@@ -662,6 +1588,38 @@ def main() -> None:
     if args.verbose:
         logger.setLevel(logging.DEBUG)
 
+    if args.output_format == "columnar" and not is_detection_store(args.output_csv):
+        args.output_csv = os.path.splitext(args.output_csv)[0] + STORE_SUFFIX
+
+    args.models = args.model
+    args.model = args.models[0]
+    multi_model = len(args.models) > 1
+    if multi_model:
+        unsupported = [
+            flag
+            for flag, value in (
+                ("--resume", args.resume),
+                ("--cache", args.cache),
+                ("--cascade-model", args.cascade_model),
+                ("--no-csv", args.no_csv),
+            )
+            if value
+        ]
+        if unsupported:
+            logger.error(f"Several --model values cannot be combined with {', '.join(unsupported)}")
+            return
+
+    if args.conf_floor is None:
+        args.conf_floor = RAW_CONF_FLOOR if args.raw else DEFAULT_CONF_FLOOR
+    if args.raw:
+        if args.no_csv:
+            logger.error(
+                "--raw stores candidate boxes in --output-csv and cannot be used with --no-csv"
+            )
+            return
+        # Nothing is dropped at labeling time; thresholds are applied when materializing
+        args.confidence_threshold = args.conf_floor
+
     # Validate inputs
     if not os.path.exists(args.input):
         logger.error(f"Input folder does not exist: {args.input}")
@@ -670,7 +1628,7 @@ def main() -> None:
     # Either run auto-labeling or convert existing annotations
     if args.convert_csv:
         print(f"[cyan]Converting CSV {args.convert_csv} to YOLO format[/cyan]")
-        annotations = convert_csv_to_yolo_txt(
+        image_classes = convert_csv_to_yolo_txt(
             args.convert_csv,
             args.input,
             f"{args.output_dataset}/labels",
@@ -686,6 +1644,11 @@ def main() -> None:
             args.val_ratio,
             args.test_ratio,
             args.balanced,
+            args.materialize,
+            args.copy_workers,
+            args.split_method,
+            args.hash_key,
+            image_classes,
         )
     elif args.convert_json:
         print(f"[cyan]Converting JSON {args.convert_json} to YOLO format[/cyan]")
@@ -700,9 +1663,30 @@ def main() -> None:
             args.val_ratio,
             args.test_ratio,
             args.balanced,
+            args.materialize,
+            args.copy_workers,
+            args.split_method,
+            args.hash_key,
         )
-    else:
-        # Run auto-labeling
+    elif args.shard_index is not None and multi_model:
+        results = run_multi_model_autolabel(
+            args.input,
+            args.output_csv,
+            args.models,
+            args.limit,
+            args.confidence_threshold,
+            args.batch,
+            args.decode_workers,
+            args.imgsz,
+            args.shards,
+            args.shard_index,
+            args.torch_threads,
+            args.conf_floor,
+            args.rect,
+        )
+        sys.exit(0 if results is not None else 1)
+    elif args.shard_index is not None:
+        # Worker mode: label one shard and leave conversion to the orchestrator
         labels_output_dir = f"{args.output_dataset}/labels" if args.no_csv else None
         results = run_yolo_autolabel(
             args.input,
@@ -711,11 +1695,102 @@ def main() -> None:
             args.limit,
             args.confidence_threshold,
             labels_output_dir,
+            args.batch,
+            args.decode_workers,
+            args.imgsz,
+            args.shards,
+            args.shard_index,
+            args.torch_threads,
+            args.resume,
+            args.cache,
+            args.cache_max_mb,
+            args.conf_floor,
+            args.rect,
+            args.cascade_model,
+            tuple(args.cascade_band),
         )
-        if results:
+        sys.exit(0 if results is not None else 1)
+    elif multi_model:
+        # Comparing labelers: write one detection output per model and stop there
+        if args.shards > 1:
+            results = run_sharded_autolabel(
+                args.input,
+                args.output_csv,
+                args.shards,
+                _shard_worker_args(args),
+                torch_threads=args.torch_threads,
+                model_names=args.models,
+            )
+        else:
+            results = run_multi_model_autolabel(
+                args.input,
+                args.output_csv,
+                args.models,
+                args.limit,
+                args.confidence_threshold,
+                args.batch,
+                args.decode_workers,
+                args.imgsz,
+                torch_threads=args.torch_threads,
+                conf_floor=args.conf_floor,
+                rect=args.rect,
+            )
+        if results is not None:
+            print("[cyan]Build a dataset from the chosen model's detections with:[/cyan]")
+            print(
+                f"python auto_label_yolo.py --input {args.input} "
+                f"--convert-csv {model_output_path(args.output_csv, args.models[0])} "
+                f"--output-dataset {args.output_dataset}"
+            )
+        return
+    else:
+        # Run auto-labeling
+        labels_output_dir = f"{args.output_dataset}/labels" if args.no_csv else None
+        if args.shards > 1:
+            results = run_sharded_autolabel(
+                args.input,
+                args.output_csv,
+                args.shards,
+                _shard_worker_args(args),
+                labels_output_dir,
+                args.torch_threads,
+            )
+        else:
+            results = run_yolo_autolabel(
+                args.input,
+                args.output_csv,
+                args.model,
+                args.limit,
+                args.confidence_threshold,
+                labels_output_dir,
+                args.batch,
+                args.decode_workers,
+                args.imgsz,
+                torch_threads=args.torch_threads,
+                resume=args.resume,
+                cache_path=args.cache,
+                cache_max_mb=args.cache_max_mb,
+                conf_floor=args.conf_floor,
+                rect=args.rect,
+                cascade_model=args.cascade_model,
+                cascade_band=tuple(args.cascade_band),
+            )
+        if results is not None and args.raw:
+            print(
+                f"[green]Raw detections (conf >= {args.conf_floor}) "
+                f"saved to {args.output_csv}[/green]"
+            )
+            print("[cyan]Create labels for any threshold with:[/cyan]")
+            print(
+                f"python materialize_labels.py {args.output_csv} "
+                f"--output {args.output_dataset}/labels --threshold 0.5"
+            )
+            return
+        if results is not None:
+            image_classes = None
             if not args.no_csv:
                 # Convert the generated CSV to YOLO format
-                annotations = convert_csv_to_yolo_txt(
+                image_classes = convert_csv_to_yolo_txt(
                     args.output_csv,
                     args.input,
                     f"{args.output_dataset}/labels",
@@ -731,6 +1806,11 @@ def main() -> None:
                 args.val_ratio,
                 args.test_ratio,
                 args.balanced,
+                args.materialize,
+                args.copy_workers,
+                args.split_method,
+                args.hash_key,
+                image_classes,
             )
 
     # Validate labels
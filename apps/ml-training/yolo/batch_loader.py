@@ -0,0 +1,295 @@
+"""Threaded image decoding and letterboxing for batched YOLO inference.
+
+Decoding (cv2.imdecode) and resizing release the GIL, so a small thread pool keeps
+the next batch ready while the current one runs through the network.
+
+With rect=True images are grouped by aspect ratio (read from file headers only) and each
+batch is letterboxed to the smallest stride-aligned rectangle that fits its images,
+instead of a full imgsz x imgsz square.
+
+Images are read through zip_dataset, so paths of a virtual (zip-backed) dataset work too.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from typing import Callable, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
+import logging
+import math
+import sys
+from pathlib import Path
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from detection_cache import bytes_digest
+
+sys.path.append(str(Path(__file__).parent.parent))
+from zip_dataset import open_image_file, read_image_bytes
+
+logger = logging.getLogger(__name__)
+
+LETTERBOX_COLOR = (114, 114, 114)  # Same gray padding as Ultralytics
+DEFAULT_STRIDE = 32
+EXIF_ORIENTATION = 0x0112
+# EXIF orientations that rotate by 90 degrees; cv2.imdecode applies them, swapping h and w
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+class PreparedImage(NamedTuple):
+    """A decoded, letterboxed image ready to be stacked into a batch.
+
+    When a cache lookup hits, image is None and cached holds the stored detections.
+    """
+
+    path: str
+    image: Optional[np.ndarray]  # CHW, RGB, uint8
+    orig_shape: Tuple[int, int]  # (height, width) of the source image
+    ratio: float  # Resize gain applied before padding
+    pad: Tuple[float, float]  # (left, top) padding in pixels
+    digest: Optional[str] = None  # Content hash, set when a cache lookup is used
+    cached: Optional[np.ndarray] = None
+
+
+def letterbox(
+    image: np.ndarray, new_shape: Tuple[int, int], color=LETTERBOX_COLOR
+) -> Tuple[np.ndarray, float, Tuple[float, float]]:
+    """Resize image keeping aspect ratio and pad it to new_shape (height, width).
+
+    Returns:
+        Tuple of (padded image, resize ratio, (left, top) padding)
+    """
+    h, w = image.shape[:2]
+    new_h, new_w = new_shape
+    ratio = min(new_h / h, new_w / w)
+    unpad_w, unpad_h = int(round(w * ratio)), int(round(h * ratio))
+    dw, dh = (new_w - unpad_w) / 2, (new_h - unpad_h) / 2
+
+    if (w, h) != (unpad_w, unpad_h):
+        image = cv2.resize(image, (unpad_w, unpad_h), interpolation=cv2.INTER_LINEAR)
+
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    image = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)
+    return image, ratio, (left, top)
+
+
+def read_image_size(path: str) -> Optional[Tuple[int, int]]:
+    """(height, width) of an image as cv2 will decode it, read from the header only.
+
+    Returns:
+        The size, or None if the header cannot be parsed
+    """
+    try:
+        with open_image_file(path) as f, Image.open(f) as img:
+            width, height = img.size
+            if img.getexif().get(EXIF_ORIENTATION) in TRANSPOSED_ORIENTATIONS:
+                width, height = height, width
+    except Exception as e:
+        logger.debug(f"Could not read image size of {path}: {e}")
+        return None
+    return height, width
+
+
+def rect_batch_shape(
+    aspect_ratios: Sequence[float], imgsz: int, stride: int = DEFAULT_STRIDE
+) -> Tuple[int, int]:
+    """Smallest stride-aligned (height, width) within imgsz that fits every h/w ratio."""
+    lo, hi = min(aspect_ratios), max(aspect_ratios)
+    if hi < 1:
+        # All landscape: full width, height of the tallest image
+        scale = (hi, 1.0)
+    elif lo > 1:
+        # All portrait: full height, width of the widest image
+        scale = (1.0, 1.0 / lo)
+    else:
+        scale = (1.0, 1.0)
+    return tuple(int(math.ceil(s * imgsz / stride)) * stride for s in scale)
+
+
+def plan_rect_batches(
+    image_paths: Sequence[str],
+    imgsz: int = 640,
+    batch_size: int = 16,
+    stride: int = DEFAULT_STRIDE,
+    workers: int = 4,
+) -> List[Tuple[List[str], Tuple[int, int]]]:
+    """Group images into batches of similar aspect ratio.
+
+    Images are ordered by h/w ratio (ties by path) and cut into batches, so each batch
+    needs little padding. Images whose header cannot be read go into square batches and
+    fail later at decode time as usual.
+
+    Returns:
+        List of (paths, (height, width) input shape) pairs
+    """
+    if workers > 0:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="header") as executor:
+            sizes = list(executor.map(read_image_size, image_paths))
+    else:
+        sizes = [read_image_size(p) for p in image_paths]
+
+    ratios = [h / w if w else 1.0 for h, w in (size or (1, 1) for size in sizes)]
+    order = sorted(range(len(image_paths)), key=lambda i: (ratios[i], image_paths[i]))
+
+    batch_size = max(1, batch_size)
+    plan = []
+    for start in range(0, len(order), batch_size):
+        members = order[start : start + batch_size]
+        shape = rect_batch_shape([ratios[i] for i in members], imgsz, stride)
+        plan.append(([image_paths[i] for i in members], shape))
+    return plan
+
+
+def load_letterboxed(
+    path: str,
+    imgsz: Union[int, Tuple[int, int]],
+    lookup: Optional[Callable[[str], Optional[np.ndarray]]] = None,
+) -> Optional[PreparedImage]:
+    """Decode an image from disk and letterbox it to imgsz (a square size or (h, w)).
+
+    If lookup is given, the file's content hash is passed to it first; a non-None
+    result is returned as cached detections and the image is never decoded.
+    """
+    data = np.frombuffer(read_image_bytes(path), dtype=np.uint8)
+    digest = None
+    if lookup is not None:
+        digest = bytes_digest(data)
+        cached = lookup(digest)
+        if cached is not None:
+            return PreparedImage(path, None, (0, 0), 1.0, (0.0, 0.0), digest, cached)
+
+    image = cv2.imdecode(data, cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+
+    orig_shape = image.shape[:2]
+    shape = (imgsz, imgsz) if isinstance(imgsz, int) else imgsz
+    boxed, ratio, pad = letterbox(image, shape)
+    # BGR HWC -> RGB CHW, done here so the copy happens on the worker thread
+    chw = np.ascontiguousarray(boxed[..., ::-1].transpose(2, 0, 1))
+    return PreparedImage(path, chw, orig_shape, ratio, pad, digest)
+
+
+def unletterbox_xywhn(
+    xyxy: np.ndarray, ratio: float, pad: Tuple[float, float], orig_shape: Tuple[int, int]
+) -> np.ndarray:
+    """Map letterboxed pixel xyxy boxes back to xywh normalized to the original image."""
+    h, w = orig_shape
+    boxes = xyxy.astype(np.float32, copy=True)
+    boxes[:, [0, 2]] = ((boxes[:, [0, 2]] - pad[0]) / ratio).clip(0, w)
+    boxes[:, [1, 3]] = ((boxes[:, [1, 3]] - pad[1]) / ratio).clip(0, h)
+
+    xywhn = np.empty_like(boxes)
+    xywhn[:, 0] = (boxes[:, 0] + boxes[:, 2]) / 2 / w
+    xywhn[:, 1] = (boxes[:, 1] + boxes[:, 3]) / 2 / h
+    xywhn[:, 2] = (boxes[:, 2] - boxes[:, 0]) / w
+    xywhn[:, 3] = (boxes[:, 3] - boxes[:, 1]) / h
+    return xywhn
+
+
+def iter_prepared_batches(
+    image_paths: Sequence[str],
+    imgsz: int = 640,
+    batch_size: int = 16,
+    decode_workers: int = 4,
+    prefetch: int = 2,
+    lookup: Optional[Callable[[str], Optional[np.ndarray]]] = None,
+    rect: bool = False,
+    stride: int = DEFAULT_STRIDE,
+) -> Iterator[List[PreparedImage]]:
+    """Yield batches of letterboxed images, decoding upcoming batches in the background.
+
+    Args:
+        image_paths: Image files to load, in output order
+        imgsz: Square inference size
+        batch_size: Number of images per yielded batch
+        decode_workers: Decoder threads (0 decodes inline on the calling thread)
+        prefetch: Number of batches kept in flight ahead of the consumer
+        lookup: Optional content-hash lookup that lets cached images skip decoding
+        rect: Batch images by aspect ratio into stride-aligned rectangles (see
+            plan_rect_batches); batches then follow aspect-ratio order, not input order
+        stride: Model stride that rectangular shapes are rounded up to
+
+    Yields:
+        Lists of PreparedImage; images that fail to decode are logged and dropped
+    """
+    batch_size = max(1, batch_size)
+    if rect:
+        chunks = plan_rect_batches(image_paths, imgsz, batch_size, stride, decode_workers)
+    else:
+        chunks = [
+            (image_paths[i : i + batch_size], (imgsz, imgsz))
+            for i in range(0, len(image_paths), batch_size)
+        ]
+
+    if decode_workers <= 0:
+        for chunk, shape in chunks:
+            yield _collect(chunk, [_load_or_none(p, shape, lookup) for p in chunk])
+        return
+
+    executor = ThreadPoolExecutor(max_workers=decode_workers, thread_name_prefix="decode")
+    pending = deque()
+    try:
+        next_chunk = 0
+        while next_chunk < len(chunks) or pending:
+            while next_chunk < len(chunks) and len(pending) <= prefetch:
+                chunk, shape = chunks[next_chunk]
+                pending.append(
+                    (chunk, [executor.submit(load_letterboxed, p, shape, lookup) for p in chunk])
+                )
+                next_chunk += 1
+
+            chunk, futures = pending.popleft()
+            yield _collect(chunk, [_result_or_none(f) for f in futures])
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def stack_batch(batch: Sequence[PreparedImage]) -> np.ndarray:
+    """Stack prepared images into an NCHW uint8 array."""
+    return np.stack([item.image for item in batch])
+
+
+def _result_or_none(future) -> Optional[PreparedImage]:
+    try:
+        return future.result()
+    except Exception as e:
+        logger.warning(f"Image decode failed: {e}")
+        return None
+
+
+def _load_or_none(
+    path: str,
+    shape: Union[int, Tuple[int, int]],
+    lookup: Optional[Callable[[str], Optional[np.ndarray]]],
+) -> Optional[PreparedImage]:
+    """load_letterboxed on the calling thread, failing like the threaded path does."""
+    try:
+        return load_letterboxed(path, shape, lookup)
+    except Exception as e:
+        logger.warning(f"Image decode failed: {e}")
+        return None
+
+
+def _collect(chunk: Sequence[str], loaded: List[Optional[PreparedImage]]) -> List[PreparedImage]:
+    batch = []
+    for path, item in zip(chunk, loaded):
+        if item is None:
+            logger.warning(f"Skipping unreadable image: {path}")
+            continue
+        batch.append(item)
+    return batch
+
+
+__all__ = [
+    "PreparedImage",
+    "letterbox",
+    "read_image_size",
+    "rect_batch_shape",
+    "plan_rect_batches",
+    "load_letterboxed",
+    "unletterbox_xywhn",
+    "iter_prepared_batches",
+    "stack_batch",
+]
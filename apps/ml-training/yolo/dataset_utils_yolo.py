@@ -1,6 +1,4 @@
 import os
-import shutil
-import csv
 import random
 from pathlib import Path
 from typing import List, Dict, Tuple
@@ -11,6 +9,9 @@ import sys
 
 sys.path.append(str(Path(__file__).parent.parent))
 from dataset_utils import CANONICAL_CLASSES, normalize_label
+from detection_store import iter_detection_rows
+from image_index import index_files
+from split_materialize import DEFAULT_COPY_WORKERS, label_path, materialize_split, prune_splits
 
 # Class mapping for YOLO (0-7)
 CLASS_TO_ID = {cls: idx for idx, cls in enumerate(CANONICAL_CLASSES)}
@@ -23,6 +24,8 @@ def prepare_yolo_dataset(
     val_ratio: float = 0.2,
     test_ratio: float = 0.1,
     csv_file: str = None,
+    materialize: str = "copy",
+    workers: int = DEFAULT_COPY_WORKERS,
 ) -> str:
     """
     Prepare YOLO-format dataset from classification dataset or CSV annotations.
@@ -33,30 +36,31 @@ def prepare_yolo_dataset(
         train_ratio: Ratio of data for training
         val_ratio: Ratio of data for validation
         test_ratio: Ratio of data for testing
-        csv_file: Path to CSV file with annotations (filename, x_center, y_center, width, height, confidence, class_id)
+        csv_file: Path to CSV file (or columnar .dets store) with annotations (filename, x_center, y_center, width, height, confidence, class_id)
                   If None, assumes classification dataset and creates full-image bounding boxes
+        materialize: How split images are laid out (copy, hardlink, symlink, reflink or
+                     listfile, see split_materialize)
+        workers: Threads copying or linking images
 
     Returns:
         Path to the prepared dataset directory
     """
-    output_path = Path(output_dir)
-    images_dir = output_path / "images"
-    labels_dir = output_path / "labels"
-
-    # Create directories
-    for split in ["train", "val", "test"]:
-        (images_dir / split).mkdir(parents=True, exist_ok=True)
-        (labels_dir / split).mkdir(parents=True, exist_ok=True)
-
     if csv_file and Path(csv_file).exists():
-        # Use CSV annotations
+        # Use CSV annotations (or a columnar detection store)
         return _prepare_from_csv(
-            csv_file, input_dir, output_dir, train_ratio, val_ratio, test_ratio
+            csv_file,
+            input_dir,
+            output_dir,
+            train_ratio,
+            val_ratio,
+            test_ratio,
+            materialize,
+            workers,
         )
     else:
         # Assume classification dataset, create full-image bounding boxes
         return _prepare_from_classification(
-            input_dir, output_dir, train_ratio, val_ratio, test_ratio
+            input_dir, output_dir, train_ratio, val_ratio, test_ratio, materialize, workers
         )
 
 
@@ -67,35 +71,21 @@ def _prepare_from_csv(
     train_ratio: float,
     val_ratio: float,
     test_ratio: float,
+    materialize: str,
+    workers: int,
 ) -> str:
     """Prepare dataset from CSV annotations file."""
-    output_path = Path(output_dir)
-    images_out_dir = output_path / "images"
-    labels_out_dir = output_path / "labels"
 
-    # Read CSV and group by filename
+    # Read CSV (or columnar store) and group by filename
     annotations = {}
-    with open(csv_file, "r") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            filename = row["filename"]
-            if filename not in annotations:
-                annotations[filename] = []
-            annotations[filename].append(
-                {
-                    "class_id": int(row["class_id"]),
-                    "x_center": float(row["x_center"]),
-                    "y_center": float(row["y_center"]),
-                    "width": float(row["width"]),
-                    "height": float(row["height"]),
-                    "confidence": float(row["confidence"]),
-                }
-            )
+    for row in iter_detection_rows(csv_file):
+        filename = row.pop("filename")
+        if filename not in annotations:
+            annotations[filename] = []
+        annotations[filename].append(row)
 
     # Get all image files
-    image_files = []
-    for ext in [".jpg", ".jpeg", ".png"]:
-        image_files.extend(Path(images_dir).rglob(f"*{ext}"))
+    image_files = [Path(images_dir) / f.relpath for f in index_files(images_dir)]
 
     # Filter to only images that have annotations
     annotated_images = []
@@ -112,42 +102,36 @@ def _prepare_from_csv(
         temp_files, test_size=(test_ratio / (val_ratio + test_ratio)), random_state=42
     )
 
-    # Copy images and create label files
-    _copy_images_and_labels(
-        train_files, annotations, images_out_dir / "train", labels_out_dir / "train"
-    )
-    _copy_images_and_labels(val_files, annotations, images_out_dir / "val", labels_out_dir / "val")
-    _copy_images_and_labels(
-        test_files, annotations, images_out_dir / "test", labels_out_dir / "test"
-    )
+    # Create label files, then copy or link the images
+    splits = _relpaths({"train": train_files, "val": val_files, "test": test_files}, images_dir)
+    prune_splits(output_dir, splits, materialize)
+    for split, files in zip(splits, (train_files, val_files, test_files)):
+        _write_labels(files, annotations, images_dir, output_dir, split, materialize)
+    materialize_split(images_dir, output_dir, splits, materialize, workers)
 
     print(
         f"Prepared YOLO dataset with {len(train_files)} train, {len(val_files)} val, {len(test_files)} test images"
     )
-    return str(output_path)
+    return str(Path(output_dir))
 
 
 def _prepare_from_classification(
-    input_dir: str, output_dir: str, train_ratio: float, val_ratio: float, test_ratio: float
+    input_dir: str,
+    output_dir: str,
+    train_ratio: float,
+    val_ratio: float,
+    test_ratio: float,
+    materialize: str,
+    workers: int,
 ) -> str:
     """Prepare dataset from classification folders, creating full-image bounding boxes."""
-    output_path = Path(output_dir)
-    images_out_dir = output_path / "images"
-    labels_out_dir = output_path / "labels"
-
     all_images = []
 
-    # Collect images from class folders
-    for class_name in CANONICAL_CLASSES:
-        class_dir = Path(input_dir) / class_name
-        if not class_dir.exists():
-            continue
-
-        class_id = CLASS_TO_ID[class_name]
-
-        for img_path in class_dir.glob("*"):
-            if img_path.suffix.lower() in [".jpg", ".jpeg", ".png"]:
-                all_images.append((img_path, class_id))
+    # Collect images directly inside the class folders
+    for indexed in index_files(input_dir):
+        class_name, sep, name = indexed.relpath.partition(os.sep)
+        if sep and os.sep not in name and class_name in CLASS_TO_ID:
+            all_images.append((Path(input_dir) / indexed.relpath, CLASS_TO_ID[class_name]))
 
     # Split into train/val/test
     train_files, temp_files = train_test_split(
@@ -157,51 +141,65 @@ def _prepare_from_classification(
         temp_files, test_size=(test_ratio / (val_ratio + test_ratio)), random_state=42
     )
 
-    # Copy images and create label files with full-image bounding boxes
-    _copy_classification_images(train_files, images_out_dir / "train", labels_out_dir / "train")
-    _copy_classification_images(val_files, images_out_dir / "val", labels_out_dir / "val")
-    _copy_classification_images(test_files, images_out_dir / "test", labels_out_dir / "test")
+    # Create label files with full-image bounding boxes, then copy or link the images
+    pairs_by_split = {"train": train_files, "val": val_files, "test": test_files}
+    splits = _relpaths(
+        {split: [img_path for img_path, _ in pairs] for split, pairs in pairs_by_split.items()},
+        input_dir,
+    )
+    prune_splits(output_dir, splits, materialize)
+    for split, pairs in pairs_by_split.items():
+        _write_classification_labels(pairs, input_dir, output_dir, split, materialize)
+    materialize_split(input_dir, output_dir, splits, materialize, workers)
 
     print(
         f"Prepared YOLO dataset from classification with {len(train_files)} train, {len(val_files)} val, {len(test_files)} test images"
     )
-    return str(output_path)
+    return str(Path(output_dir))
 
 
-def _copy_images_and_labels(
-    image_files: List[Path], annotations: Dict, images_dest: Path, labels_dest: Path
-):
-    """Copy images and create corresponding YOLO label files."""
-    for img_path in image_files:
-        filename = img_path.name
-        stem = img_path.stem
+def _relpaths(splits: Dict[str, List[Path]], root: str) -> Dict[str, List[str]]:
+    """Split image paths relative to root."""
+    return {split: [os.path.relpath(p, root) for p in files] for split, files in splits.items()}
 
-        # Copy image
-        shutil.copy2(img_path, images_dest / filename)
 
-        # Create label file
-        label_file = labels_dest / f"{stem}.txt"
-        with open(label_file, "w") as f:
-            for ann in annotations[filename]:
-                # YOLO format: class x_center y_center width height
-                line = "04d"
-                f.write(line)
+def _open_label(output_dir: str, split: str, rel: str, materialize: str):
+    label_file = label_path(output_dir, split, rel, materialize)
+    os.makedirs(os.path.dirname(label_file), exist_ok=True)
+    return open(label_file, "w")
 
 
-def _copy_classification_images(
-    image_class_pairs: List[Tuple[Path, int]], images_dest: Path, labels_dest: Path
+def _write_labels(
+    image_files: List[Path],
+    annotations: Dict,
+    images_dir: str,
+    output_dir: str,
+    split: str,
+    materialize: str,
 ):
-    """Copy images and create label files with full-image bounding boxes."""
-    for img_path, class_id in image_class_pairs:
-        filename = img_path.name
-        stem = img_path.stem
+    """Create the YOLO label files of one split's images."""
+    for img_path in image_files:
+        rel = os.path.relpath(img_path, images_dir)
+        with _open_label(output_dir, split, rel, materialize) as f:
+            for ann in annotations[img_path.name]:
+                # YOLO format: class x_center y_center width height
+                f.write(
+                    f"{ann['class_id']} {ann['x_center']:.6f} {ann['y_center']:.6f} "
+                    f"{ann['width']:.6f} {ann['height']:.6f}\n"
+                )
 
-        # Copy image
-        shutil.copy2(img_path, images_dest / filename)
 
-        # Create label file with full-image bbox (normalized coordinates)
-        label_file = labels_dest / f"{stem}.txt"
-        with open(label_file, "w") as f:
+def _write_classification_labels(
+    image_class_pairs: List[Tuple[Path, int]],
+    input_dir: str,
+    output_dir: str,
+    split: str,
+    materialize: str,
+):
+    """Create label files with full-image bounding boxes."""
+    for img_path, class_id in image_class_pairs:
+        rel = os.path.relpath(img_path, input_dir)
+        with _open_label(output_dir, split, rel, materialize) as f:
             # Full image bounding box: class 0.5 0.5 1.0 1.0
             f.write(f"{class_id} 0.5 0.5 1.0 1.0\n")
 
@@ -0,0 +1,150 @@
+"""Persistent, content-addressed cache of raw YOLO detections.
+
+Entries are keyed by (image content hash, weights hash, imgsz, confidence floor), so
+renamed files, duplicate images across datasets and repeat runs cost one lookup instead
+of a forward pass. Detections are stored as float32 rows of
+[x_center, y_center, width, height, confidence, coco_class_id], normalized to the
+original image.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, Optional, Tuple, Union
+
+import numpy as np
+
+DETECTION_COLUMNS = 6
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def bytes_digest(data) -> str:
+    """Content hash used for cache keys."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def file_digest(path: str) -> str:
+    """Content hash of a file, read in chunks (used for model weights)."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class DetectionCache:
+    """SQLite-backed detection cache with least-recently-used eviction.
+
+    Safe to share between decode threads; several processes (shard workers) may also
+    open the same file.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 1 << 30):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._touched = []
+
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS detections ("
+            "key TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL, "
+            "last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS detections_last_used ON detections(last_used)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(
+        image_digest: str, weights_digest: str, imgsz: Union[int, str], conf_floor: float
+    ) -> str:
+        return f"{image_digest}:{weights_digest}:{imgsz}:{conf_floor:g}"
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Return cached detections for key, or None on a miss."""
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM detections WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            # last_used is written back in bulk on the next put_many/close
+            self._touched.append((time.time(), key))
+        return np.frombuffer(row[0], dtype=np.float32).reshape(-1, DETECTION_COLUMNS)
+
+    def put_many(self, items: Iterable[Tuple[str, np.ndarray]]) -> None:
+        """Store detections for several keys and evict old entries if over budget."""
+        now = time.time()
+        rows = []
+        for key, detections in items:
+            data = np.ascontiguousarray(detections, dtype=np.float32).tobytes()
+            rows.append((key, data, len(data), now))
+
+        with self._lock:
+            self._flush_touched()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO detections (key, data, size, last_used) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+            self._evict()
+
+    def size_bytes(self) -> int:
+        with self._lock:
+            return self._total_size()
+
+    def summary(self) -> str:
+        lookups = self.hits + self.misses
+        rate = 100.0 * self.hits / lookups if lookups else 0.0
+        return (
+            f"{self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate), "
+            f"{self.evictions} evicted, {self.size_bytes() / 1e6:.1f} MB on disk"
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush_touched()
+            self._conn.commit()
+            self._conn.close()
+
+    def _flush_touched(self) -> None:
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE detections SET last_used = ? WHERE key = ?", self._touched
+            )
+            self._touched = []
+
+    def _total_size(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM detections").fetchone()[0]
+
+    def _evict(self) -> None:
+        excess = self._total_size() - self.max_bytes
+        if excess <= 0:
+            return
+        # Free an extra 10% so eviction does not run on every insert
+        target = excess + self.max_bytes // 10
+        freed = 0
+        victims = []
+        cursor = self._conn.execute("SELECT key, size FROM detections ORDER BY last_used")
+        for key, size in cursor:
+            victims.append((key,))
+            freed += size
+            if freed >= target:
+                break
+        cursor.close()
+        self._conn.executemany("DELETE FROM detections WHERE key = ?", victims)
+        self._conn.commit()
+        self.evictions += len(victims)
+
+
+__all__ = ["DetectionCache", "bytes_digest", "file_digest", "DETECTION_COLUMNS"]
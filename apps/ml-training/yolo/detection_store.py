@@ -0,0 +1,432 @@
+#!/usr/bin/env python
+"""Columnar detection store, a compact alternative to yolo_labels.csv.
+
+A store is a directory (conventionally named *.dets) holding one append-only binary
+file per column plus a filename dictionary:
+
+    yolo_labels.dets/
+      meta.json        format version and column dtypes
+      filenames.txt    dictionary of image paths, one per line (line number = file id)
+      file_id.bin      uint32, index into filenames.txt
+      boxes.bin        float32 x_center, y_center, width, height (normalized)
+      confidence.bin   float32
+      class_id.bin     uint8
+
+Columns are loaded with np.fromfile (or memory-mapped), so millions of detections load
+in milliseconds. All detection readers accept either a CSV file or a store.
+
+Usage:
+    # Export a store as CSV, or import a CSV into a store
+    python detection_store.py yolo_labels.dets yolo_labels.csv
+    python detection_store.py yolo_labels.csv yolo_labels.dets
+"""
+
+import argparse
+import csv
+import json
+import os
+import shutil
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+import numpy as np
+
+STORE_SUFFIX = ".dets"
+STORE_FORMAT = "reuseit-detections"
+STORE_VERSION = 1
+
+COLUMNS = {
+    "file_id": (np.dtype("<u4"), 1),
+    "boxes": (np.dtype("<f4"), 4),
+    "confidence": (np.dtype("<f4"), 1),
+    "class_id": (np.dtype("u1"), 1),
+}
+
+CSV_FIELDNAMES = ["filename", "x_center", "y_center", "width", "height", "confidence", "class_id"]
+
+
+class DetectionTable(NamedTuple):
+    """Detections as typed arrays with dictionary-encoded filenames."""
+
+    filenames: List[str]  # Dictionary; file_id indexes into it
+    file_id: np.ndarray  # (N,) uint32
+    boxes: np.ndarray  # (N, 4) float32 x_center, y_center, width, height
+    confidence: np.ndarray  # (N,) float32
+    class_id: np.ndarray  # (N,) uint8
+
+
+def is_detection_store(path: str) -> bool:
+    """True for an existing store directory or a path with the store suffix."""
+    if os.path.isdir(path):
+        return os.path.exists(os.path.join(path, "meta.json"))
+    return path.endswith(STORE_SUFFIX)
+
+
+def store_row_count(path: str) -> int:
+    conf_file = _column_path(path, "confidence")
+    if not os.path.exists(conf_file):
+        return 0
+    return os.path.getsize(conf_file) // COLUMNS["confidence"][0].itemsize
+
+
+class DetectionStoreWriter:
+    """Append detections to a store, one image block at a time.
+
+    Rows are buffered in memory and written by flush(), which returns the committed row
+    count; pass that count back as resume_rows to continue an interrupted run.
+    """
+
+    def __init__(self, path: str, resume_rows: Optional[int] = None):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        if resume_rows is None:
+            for name in COLUMNS:
+                _remove_if_exists(_column_path(path, name))
+            _remove_if_exists(os.path.join(path, "filenames.txt"))
+            self._num_files = 0
+        else:
+            self._num_files = truncate_store(path, resume_rows)
+        _write_meta(path)
+
+        self._names = open(os.path.join(path, "filenames.txt"), "a")
+        self._columns = {name: open(_column_path(path, name), "ab") for name in COLUMNS}
+        self._pending = {name: [] for name in COLUMNS}
+        self._pending_names = []
+
+    def add(self, filename: str, boxes: np.ndarray, confidence: np.ndarray, class_id) -> None:
+        """Buffer all detections of one image (class_id may be a scalar or per-row array)."""
+        n = len(confidence)
+        if n == 0:
+            return
+        file_id = self._num_files
+        self._num_files += 1
+        self._pending_names.append(filename)
+        self._pending["file_id"].append(np.full(n, file_id, dtype=COLUMNS["file_id"][0]))
+        self._pending["boxes"].append(np.asarray(boxes, dtype=COLUMNS["boxes"][0]).reshape(n, 4))
+        self._pending["confidence"].append(
+            np.asarray(confidence, dtype=COLUMNS["confidence"][0]).reshape(n)
+        )
+        self._pending["class_id"].append(
+            np.broadcast_to(np.asarray(class_id, dtype=COLUMNS["class_id"][0]), (n,))
+        )
+
+    def add_table(self, table: DetectionTable) -> None:
+        """Buffer a whole table, one block per image."""
+        order = np.argsort(table.file_id, kind="stable")
+        for file_id, rows in _group_rows(table.file_id[order]):
+            rows = order[rows]
+            self.add(
+                table.filenames[file_id],
+                table.boxes[rows],
+                table.confidence[rows],
+                table.class_id[rows],
+            )
+
+    def flush(self) -> int:
+        """Write buffered rows and return the total number of rows in the store."""
+        self._names.writelines(f"{name}\n" for name in self._pending_names)
+        self._names.flush()
+        for name, chunks in self._pending.items():
+            if chunks:
+                np.concatenate(chunks).tofile(self._columns[name])
+            self._columns[name].flush()
+            chunks.clear()
+        self._pending_names = []
+        return store_row_count(self.path)
+
+    def close(self) -> None:
+        self.flush()
+        self._names.close()
+        for handle in self._columns.values():
+            handle.close()
+
+
+class DetectionCsvWriter:
+    """CSV counterpart of DetectionStoreWriter with the same add/flush/close interface."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._file = open(path, "w", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(CSV_FIELDNAMES)
+
+    def add(self, filename: str, boxes: np.ndarray, confidence: np.ndarray, class_id) -> None:
+        class_ids = np.broadcast_to(np.asarray(class_id), (len(confidence),)).tolist()
+        self._writer.writerows(
+            (filename, x, y, w, h, conf, cls)
+            for (x, y, w, h), conf, cls in zip(
+                np.asarray(boxes).tolist(), np.asarray(confidence).tolist(), class_ids
+            )
+        )
+
+    def flush(self) -> int:
+        """Flush written rows and return the file's byte offset."""
+        self._file.flush()
+        return self._file.tell()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def open_detection_writer(path: str):
+    """DetectionStoreWriter for store paths, DetectionCsvWriter otherwise."""
+    if is_detection_store(path):
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        return DetectionStoreWriter(path)
+    return DetectionCsvWriter(path)
+
+
+def truncate_store(path: str, rows: int) -> int:
+    """Drop rows past `rows` (e.g. from an uncommitted batch) and return the image count."""
+    file_ids = _read_column(path, "file_id", mmap=True)
+    num_files = int(file_ids[:rows].max()) + 1 if rows else 0
+    del file_ids
+
+    for name, (dtype, width) in COLUMNS.items():
+        column = _column_path(path, name)
+        if os.path.exists(column):
+            with open(column, "r+b") as f:
+                f.truncate(rows * dtype.itemsize * width)
+
+    names_file = os.path.join(path, "filenames.txt")
+    names = _read_filenames(path)[:num_files]
+    with open(names_file, "w") as f:
+        f.writelines(f"{name}\n" for name in names)
+    return num_files
+
+
+def rewrite_filenames(path: str, filenames: List[str]) -> None:
+    """Replace a store's filename dictionary in place; the columns are not touched.
+
+    Renaming images this way costs one small file write instead of rewriting every row.
+    """
+    if len(filenames) != len(_read_filenames(path)):
+        raise ValueError("A renamed dictionary must keep one name per file id")
+    names_file = os.path.join(path, "filenames.txt")
+    with open(names_file + ".tmp", "w") as f:
+        f.writelines(f"{name}\n" for name in filenames)
+    os.replace(names_file + ".tmp", names_file)
+
+
+def load_detection_table(path: str, mmap: bool = False) -> DetectionTable:
+    """Load detections from a store or CSV file into typed arrays."""
+    if is_detection_store(path):
+        return DetectionTable(
+            _read_filenames(path),
+            _read_column(path, "file_id", mmap),
+            _read_column(path, "boxes", mmap),
+            _read_column(path, "confidence", mmap),
+            _read_column(path, "class_id", mmap),
+        )
+    return _load_csv_table(path)
+
+
+def iter_detection_rows(path: str, min_confidence: float = 0.0) -> Iterator[Dict]:
+    """Yield typed detection dicts (CSV field names) from a store or CSV file."""
+    if not is_detection_store(path):
+        with open(path, "r", newline="") as f:
+            for row in csv.DictReader(f):
+                confidence = float(row["confidence"])
+                if confidence < min_confidence:
+                    continue
+                yield {
+                    "filename": row["filename"],
+                    "x_center": float(row["x_center"]),
+                    "y_center": float(row["y_center"]),
+                    "width": float(row["width"]),
+                    "height": float(row["height"]),
+                    "confidence": confidence,
+                    "class_id": int(row["class_id"]),
+                }
+        return
+
+    table = load_detection_table(path)
+    keep = np.flatnonzero(table.confidence >= min_confidence)
+    boxes = table.boxes[keep].tolist()
+    for i, (x, y, w, h), conf, cls in zip(
+        table.file_id[keep].tolist(),
+        boxes,
+        table.confidence[keep].tolist(),
+        table.class_id[keep].tolist(),
+    ):
+        yield {
+            "filename": table.filenames[i],
+            "x_center": x,
+            "y_center": y,
+            "width": w,
+            "height": h,
+            "confidence": conf,
+            "class_id": cls,
+        }
+
+
+def write_detection_table(table: DetectionTable, path: str) -> None:
+    """Write a table as a store or CSV, depending on the destination path."""
+    if is_detection_store(path):
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        writer = DetectionStoreWriter(path)
+        writer.add_table(table)
+        writer.close()
+        return
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_FIELDNAMES)
+        for i, (x, y, w, h), conf, cls in zip(
+            table.file_id.tolist(),
+            table.boxes.tolist(),
+            table.confidence.tolist(),
+            table.class_id.tolist(),
+        ):
+            writer.writerow((table.filenames[i], x, y, w, h, conf, cls))
+
+
+def merge_detection_stores(paths: List[str], output: str) -> int:
+    """Merge stores into one, ordering image blocks by filename.
+
+    Returns:
+        Number of detection rows written
+    """
+    tables = [load_detection_table(path) for path in paths]
+    blocks = []
+    for t_idx, table in enumerate(tables):
+        for file_id, rows in _group_rows(table.file_id):
+            blocks.append((table.filenames[file_id], t_idx, rows))
+    blocks.sort(key=lambda block: block[0])
+
+    if os.path.isdir(output):
+        shutil.rmtree(output)
+    writer = DetectionStoreWriter(output)
+    for filename, t_idx, rows in blocks:
+        table = tables[t_idx]
+        writer.add(filename, table.boxes[rows], table.confidence[rows], table.class_id[rows])
+    writer.close()
+    return store_row_count(output)
+
+
+def _group_rows(file_id: np.ndarray) -> Iterator[tuple]:
+    """Yield (file_id, row slice) for each contiguous block of equal file ids."""
+    if not len(file_id):
+        return
+    starts = np.flatnonzero(np.diff(file_id)) + 1
+    bounds = np.concatenate([[0], starts, [len(file_id)]])
+    for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+        yield int(file_id[start]), slice(start, end)
+
+
+def _load_csv_table(path: str) -> DetectionTable:
+    filenames, index = [], {}
+    file_id, boxes, confidence, class_id = [], [], [], []
+    with open(path, "r", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return _empty_table()
+        cols = [header.index(name) for name in CSV_FIELDNAMES]
+        for row in reader:
+            name = row[cols[0]]
+            if name not in index:
+                index[name] = len(filenames)
+                filenames.append(name)
+            file_id.append(index[name])
+            boxes.append([row[cols[1]], row[cols[2]], row[cols[3]], row[cols[4]]])
+            confidence.append(row[cols[5]])
+            class_id.append(row[cols[6]])
+
+    if not file_id:
+        return _empty_table()
+    return DetectionTable(
+        filenames,
+        np.asarray(file_id, dtype=COLUMNS["file_id"][0]),
+        np.asarray(boxes, dtype=np.float64).astype(COLUMNS["boxes"][0]),
+        np.asarray(confidence, dtype=np.float64).astype(COLUMNS["confidence"][0]),
+        np.asarray(class_id, dtype=np.int64).astype(COLUMNS["class_id"][0]),
+    )
+
+
+def _empty_table() -> DetectionTable:
+    return DetectionTable(
+        [],
+        np.zeros(0, dtype=COLUMNS["file_id"][0]),
+        np.zeros((0, 4), dtype=COLUMNS["boxes"][0]),
+        np.zeros(0, dtype=COLUMNS["confidence"][0]),
+        np.zeros(0, dtype=COLUMNS["class_id"][0]),
+    )
+
+
+def _column_path(path: str, name: str) -> str:
+    return os.path.join(path, f"{name}.bin")
+
+
+def _read_column(path: str, name: str, mmap: bool = False) -> np.ndarray:
+    dtype, width = COLUMNS[name]
+    column = _column_path(path, name)
+    if not os.path.exists(column) or os.path.getsize(column) == 0:
+        data = np.zeros(0, dtype=dtype)
+    elif mmap:
+        data = np.memmap(column, dtype=dtype, mode="r")
+    else:
+        data = np.fromfile(column, dtype=dtype)
+    return data.reshape(-1, width) if width > 1 else data
+
+
+def _read_filenames(path: str) -> List[str]:
+    names_file = os.path.join(path, "filenames.txt")
+    if not os.path.exists(names_file):
+        return []
+    with open(names_file, "r") as f:
+        return f.read().splitlines()
+
+
+def _write_meta(path: str) -> None:
+    meta = {
+        "format": STORE_FORMAT,
+        "version": STORE_VERSION,
+        "columns": {name: [dtype.str, width] for name, (dtype, width) in COLUMNS.items()},
+    }
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+
+
+def _remove_if_exists(path: str) -> None:
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert detections between CSV and the columnar store format"
+    )
+    parser.add_argument("source", help="Source CSV file or .dets store")
+    parser.add_argument("destination", help="Destination CSV file or .dets store")
+    args = parser.parse_args()
+
+    table = load_detection_table(args.source)
+    write_detection_table(table, args.destination)
+    print(
+        f"Wrote {len(table.confidence)} detections for {len(table.filenames)} images "
+        f"to {args.destination}"
+    )
+
+
+__all__ = [
+    "DetectionTable",
+    "DetectionStoreWriter",
+    "DetectionCsvWriter",
+    "open_detection_writer",
+    "is_detection_store",
+    "load_detection_table",
+    "rewrite_filenames",
+    "iter_detection_rows",
+    "write_detection_table",
+    "merge_detection_stores",
+    "truncate_store",
+    "STORE_SUFFIX",
+]
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-import csv
+from detection_store import iter_detection_rows
 
 
 def find_battery_in_residual_waste(csv_file_path):
@@ -6,23 +6,21 @@ def find_battery_in_residual_waste(csv_file_path):
     Finds items that have 'battery' in their filename but are classified as 'residual_waste'.
 
     Args:
-        csv_file_path (str): Path to the YOLO labels CSV file.
+        csv_file_path (str): Path to the YOLO labels CSV file or columnar .dets store.
 
     Returns:
         list: List of dictionaries containing the rows that match the criteria.
     """
     matching_items = []
 
-    with open(csv_file_path, "r") as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            filename = row["filename"]
-            # Extract category from filename (part before first '/')
-            category = filename.split("/")[0]
+    for row in iter_detection_rows(csv_file_path):
+        filename = row["filename"]
+        # Extract category from filename (part before first '/')
+        category = filename.split("/")[0]
 
-            # Check if 'battery' is in filename and category is 'residual_waste'
-            if "battery" in filename and category == "residual_waste":
-                matching_items.append(row)
+        # Check if 'battery' is in filename and category is 'residual_waste'
+        if "battery" in filename and category == "residual_waste":
+            matching_items.append(row)
 
     return matching_items
 
@@ -0,0 +1,203 @@
+"""Per-image class counts for splitting, without re-reading label files.
+
+A balanced split needs the classes of every labeled image. Reading them back from the
+.txt files costs one open per image right after the conversion wrote those same files,
+so label_conversion returns an ImageClasses index (label file stem -> boxes per class)
+and also saves it as ``.image_classes.npz`` in the labels folder, together with each
+label file's mtime. load_label_classes uses the saved counts of every label file whose
+mtime still matches and only reads the files that are new or were rewritten since, so a
+split costs one stat per label file instead of an open and a read.
+
+iterative_stratification splits images that carry several classes so that every class
+keeps close to the requested ratios in each split (Sechidis et al., "On the
+Stratification of Multi-Label Data", 2011): the rarest remaining class is distributed
+first, each of its images going to the split that still needs that class most.
+"""
+
+import os
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+CLASSES_FILE = ".image_classes.npz"
+
+
+class ImageClasses(NamedTuple):
+    stems: List[str]  # Label file stems
+    counts: np.ndarray  # (images, classes) uint32 boxes per class
+
+    def lookup(self) -> Dict[str, np.ndarray]:
+        """Stem -> row of counts."""
+        return dict(zip(self.stems, self.counts))
+
+
+def classes_path(labels_dir: str) -> str:
+    return os.path.join(labels_dir, CLASSES_FILE)
+
+
+def _top_level_labels(labels_dir: str) -> Dict[str, int]:
+    """Stem -> mtime_ns of the .txt files directly in labels_dir (not its split folders).
+
+    Stats every file rather than using the image index: rewriting a label in place does
+    not change the directory's mtime, so the index would not notice.
+    """
+    mtimes = {}
+    try:
+        with os.scandir(labels_dir) as entries:
+            for entry in entries:
+                stem, ext = os.path.splitext(entry.name)
+                if ext == ".txt" and entry.is_file():
+                    mtimes[stem] = entry.stat().st_mtime_ns
+    except FileNotFoundError:
+        pass
+    return mtimes
+
+
+def _stack(rows: Sequence[np.ndarray]) -> np.ndarray:
+    width = max((len(row) for row in rows), default=0)
+    counts = np.zeros((len(rows), width), dtype=np.uint32)
+    for i, row in enumerate(rows):
+        counts[i, : len(row)] = row
+    return counts
+
+
+def save_image_classes(labels_dir: str, classes: ImageClasses) -> None:
+    """Persist classes next to the label files, keeping entries of other label files."""
+    mtimes = _top_level_labels(labels_dir)
+    merged = _load_saved(labels_dir, mtimes)
+    merged.update(classes.lookup())
+    stems = [stem for stem in merged if stem in mtimes]
+    tmp = classes_path(labels_dir) + ".tmp.npz"
+    np.savez(
+        tmp,
+        stems=np.array(stems, dtype=str),
+        mtime_ns=np.array([mtimes[stem] for stem in stems], dtype=np.int64),
+        counts=_stack([merged[stem] for stem in stems]),
+    )
+    os.replace(tmp, classes_path(labels_dir))
+
+
+def _load_saved(labels_dir: str, mtimes: Dict[str, int]) -> Dict[str, np.ndarray]:
+    """Saved counts of the label files that were not modified since they were saved."""
+    try:
+        with np.load(classes_path(labels_dir)) as saved:
+            stems, mtime_ns, counts = saved["stems"], saved["mtime_ns"], saved["counts"]
+    except (OSError, KeyError, ValueError):
+        return {}
+    return {
+        stem: row
+        for stem, mtime, row in zip(stems.tolist(), mtime_ns.tolist(), counts)
+        if mtimes.get(stem) == mtime
+    }
+
+
+def read_label_counts(label_file: str) -> np.ndarray:
+    """Boxes per class in one YOLO label file (empty if missing or unreadable)."""
+    class_ids = []
+    try:
+        with open(label_file, "r") as f:
+            for line in f:
+                parts = line.split()
+                if parts:
+                    class_ids.append(int(parts[0]))
+    except (OSError, ValueError):
+        return np.zeros(0, dtype=np.uint32)
+    return np.bincount(class_ids).astype(np.uint32) if class_ids else np.zeros(0, np.uint32)
+
+
+def load_label_classes(
+    labels_dir: str, stems: Sequence[str], known: Optional[ImageClasses] = None
+) -> ImageClasses:
+    """Class counts of the label files with the given stems.
+
+    Counts come from known (an in-memory index) without touching the folder when it
+    covers every stem. Otherwise the rest come from the saved index for label files that
+    were not modified since it was written, and only the remaining files are read.
+
+    Args:
+        labels_dir: Folder of the <stem>.txt label files
+        stems: Label file stems to look up
+        known: In-memory index, e.g. returned by convert_csv_to_yolo_txt
+
+    Returns:
+        Counts in the order of stems
+    """
+    found = known.lookup() if known is not None else {}
+    if any(stem not in found for stem in stems):
+        saved = _load_saved(labels_dir, _top_level_labels(labels_dir))
+        found = {**saved, **found}
+    rows = []
+    for stem in stems:
+        row = found.get(stem)
+        if row is None:
+            row = read_label_counts(os.path.join(labels_dir, f"{stem}.txt"))
+        rows.append(row)
+    return ImageClasses(list(stems), _stack(rows))
+
+
+def iterative_stratification(
+    counts: np.ndarray, ratios: Sequence[float], seed: int = 42
+) -> np.ndarray:
+    """Assign images carrying one or more classes to splits, stratified per class.
+
+    Args:
+        counts: (images, classes) boxes per class; only presence (> 0) matters
+        ratios: Fraction of images wanted in each split
+        seed: Random seed for tie-breaking and order within a class
+
+    Returns:
+        (images,) split index per image
+    """
+    rng = np.random.default_rng(seed)
+    ratios = np.asarray(ratios, dtype=np.float64) / np.sum(ratios)
+    present = np.asarray(counts) > 0
+    n_images = len(present)
+    assignment = np.full(n_images, -1, dtype=np.int64)
+
+    # Images still wanted per split, and images with each class wanted per split
+    wanted = ratios * n_images
+    wanted_class = np.outer(ratios, present.sum(axis=0)).astype(np.float64)
+    remaining = present.copy()
+
+    while True:
+        left = remaining.sum(axis=0)
+        if not left.any():
+            break
+        # Rarest class first: its few images have the least freedom
+        class_id = int(np.argmin(np.where(left > 0, left, np.iinfo(np.int64).max)))
+        for image in rng.permutation(np.flatnonzero(remaining[:, class_id])).tolist():
+            need = wanted_class[:, class_id]
+            candidates = np.flatnonzero(need == need.max())
+            if len(candidates) > 1:
+                by_size = wanted[candidates]
+                candidates = candidates[by_size == by_size.max()]
+            split = int(rng.choice(candidates))
+            assignment[image] = split
+            wanted[split] -= 1
+            wanted_class[split] -= present[image]
+            remaining[image] = False
+
+    # Images without any class only fill the splits by size
+    for image in rng.permutation(np.flatnonzero(assignment < 0)).tolist():
+        split = int(np.argmax(wanted))
+        assignment[image] = split
+        wanted[split] -= 1
+    return assignment
+
+
+def dominant_class(counts: np.ndarray) -> np.ndarray:
+    """(images,) class with the most boxes per image, -1 for images without boxes."""
+    if counts.shape[1] == 0:
+        return np.full(len(counts), -1, dtype=np.int64)
+    return np.where(counts.any(axis=1), counts.argmax(axis=1), -1)
+
+
+__all__ = [
+    "ImageClasses",
+    "classes_path",
+    "save_image_classes",
+    "read_label_counts",
+    "load_label_classes",
+    "iterative_stratification",
+    "dominant_class",
+]
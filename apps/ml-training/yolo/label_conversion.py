@@ -0,0 +1,315 @@
+"""Chunked, vectorized conversion of detections into YOLO label files.
+
+convert_csv_to_yolo_txt used to build a dict per detection and a list per image before
+writing anything, so memory and time grew with the number of detections. This engine
+works in two passes over bounded chunks:
+
+1. Detections are parsed chunk by chunk into typed arrays (csv's C reader, then one
+   numpy conversion per column, or slices of a memory-mapped .dets store), thresholded,
+   and spilled to temporary column files with a global per-image id. Only one small
+   record per image (class, row count, whether the image exists) stays in memory.
+2. Images are sampled per class on index arrays (max per class or balancing), then the
+   spilled columns are memory-mapped and streamed chunk by chunk again; each chunk is
+   grouped by image with a stable sort and handed to a pool of writer threads.
+
+Peak memory is therefore bounded by the chunk size plus a few bytes per image, not by
+the number of detections. An image's rows may span chunks; its label file is created
+by the first block and appended to by later ones, and every image is always written by
+the same writer thread, so blocks land in order.
+"""
+
+import csv
+import os
+import queue
+import tempfile
+import threading
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Collection, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from rich import print
+
+from detection_store import CSV_FIELDNAMES, is_detection_store, load_detection_table
+from image_classes import ImageClasses, save_image_classes
+
+DEFAULT_CHUNK_ROWS = 50_000
+DEFAULT_LABEL_WRITERS = 8
+
+
+class DetectionChunk(NamedTuple):
+    """A block of detections with chunk-local filename ids."""
+
+    names: List[str]  # Filename dictionary of this chunk
+    name_id: np.ndarray  # (n,) index into names
+    boxes: np.ndarray  # (n, 4) float64 x_center, y_center, width, height
+    confidence: np.ndarray  # (n,) as stored (float64 from CSV, float32 from a store)
+
+
+def _run_ids(names: np.ndarray) -> Tuple[List[str], np.ndarray]:
+    """Dictionary-encode an object array of filenames; consecutive repeats cost no lookup."""
+    if not len(names):
+        return [], np.zeros(0, dtype=np.int64)
+    starts = np.concatenate([[0], np.flatnonzero(names[1:] != names[:-1]) + 1])
+    index: Dict[str, int] = {}
+    run_ids = [index.setdefault(name, len(index)) for name in names[starts].tolist()]
+    lengths = np.diff(np.concatenate([starts, [len(names)]]))
+    return list(index), np.repeat(np.asarray(run_ids, dtype=np.int64), lengths)
+
+
+def iter_detection_chunks(
+    path: str, chunk_rows: int = DEFAULT_CHUNK_ROWS
+) -> Iterator[DetectionChunk]:
+    """Detections of a CSV file or columnar store, chunk_rows rows at a time."""
+    if is_detection_store(path):
+        table = load_detection_table(path, mmap=True)
+        for start in range(0, len(table.confidence), chunk_rows):
+            end = start + chunk_rows
+            file_ids, name_id = np.unique(np.asarray(table.file_id[start:end]), return_inverse=True)
+            yield DetectionChunk(
+                [table.filenames[i] for i in file_ids.tolist()],
+                name_id,
+                np.asarray(table.boxes[start:end], dtype=np.float64),
+                np.asarray(table.confidence[start:end]),
+            )
+        return
+
+    with open(path, "r", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        cols = [header.index(name) for name in CSV_FIELDNAMES]
+        while True:
+            rows = list(islice(reader, chunk_rows))
+            if not rows:
+                return
+            columns = list(zip(*rows))
+            del rows
+            names, name_id = _run_ids(np.array(columns[cols[0]], dtype=object))
+            yield DetectionChunk(
+                names,
+                name_id,
+                np.stack([np.asarray(columns[c], dtype=np.float64) for c in cols[1:5]], axis=1),
+                np.asarray(columns[cols[5]], dtype=np.float64),
+            )
+
+
+class LabelWriterPool:
+    """Threads writing YOLO label files.
+
+    Blocks are routed by image id, so all blocks of an image go to the same thread and
+    are written in submission order. Bounded queues keep pending blocks (and memory)
+    limited when the writers fall behind.
+    """
+
+    def __init__(self, labels_dir: str, workers: int = DEFAULT_LABEL_WRITERS, queue_size: int = 64):
+        self.labels_dir = labels_dir
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in range(max(1, workers))]
+        self._errors: List[Exception] = []
+        self._threads = [
+            threading.Thread(target=self._run, args=(q,), daemon=True) for q in self._queues
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(
+        self, image_id: int, filename: str, class_id: int, boxes: np.ndarray, append: bool
+    ) -> None:
+        """Queue the boxes of one image (append adds to a file started by an earlier block)."""
+        self._queues[image_id % len(self._queues)].put((filename, class_id, boxes, append))
+
+    def _run(self, blocks: queue.Queue) -> None:
+        while True:
+            block = blocks.get()
+            if block is None:
+                return
+            filename, class_id, boxes, append = block
+            try:
+                txt_file = os.path.join(self.labels_dir, f"{Path(filename).stem}.txt")
+                with open(txt_file, "a" if append else "w") as f:
+                    f.writelines(
+                        f"{class_id} {x:.6f} {y:.6f} {w:.6f} {h:.6f}\n"
+                        for x, y, w, h in boxes.tolist()
+                    )
+            except OSError as e:
+                self._errors.append(e)
+
+    def close(self) -> None:
+        """Wait for all queued blocks; re-raise the first write error, if any."""
+        for blocks in self._queues:
+            blocks.put(None)
+        for thread in self._threads:
+            thread.join()
+        if self._errors:
+            raise self._errors[0]
+
+
+def select_images(
+    image_class: np.ndarray,
+    eligible: np.ndarray,
+    max_images_per_class: Optional[int] = None,
+    balance_classes: bool = False,
+    seed: Optional[int] = None,
+) -> np.ndarray:
+    """Sample image ids per class.
+
+    Args:
+        image_class: (images,) class id of every image
+        eligible: Ids of the images that can be selected
+        max_images_per_class: Keep at most this many images per class (None keeps all)
+        balance_classes: Keep as many images per class as the smallest class has
+        seed: Random seed for the sampling
+
+    Returns:
+        Boolean mask over all images
+    """
+    rng = np.random.default_rng(seed)
+    classes, counts = np.unique(image_class[eligible], return_counts=True)
+    limit = max_images_per_class
+    if balance_classes:
+        limit = int(counts.min()) if len(counts) else 0
+        print(f"Balancing classes: limiting to {limit} images per class")
+
+    selected = np.zeros(len(image_class), dtype=bool)
+    for class_id, count in zip(classes.tolist(), counts.tolist()):
+        members = eligible[image_class[eligible] == class_id]
+        if limit and count > limit:
+            members = rng.choice(members, limit, replace=False)
+        selected[members] = True
+        print(f"Class {class_id}: selected {len(members)}/{count} images")
+    return selected
+
+
+def convert_detections_to_labels(
+    detections: str,
+    output_labels_dir: str,
+    class_of: Callable[[str], int],
+    image_files: Optional[Collection[str]] = None,
+    confidence_threshold: float = 0.5,
+    max_images_per_class: Optional[int] = None,
+    balance_classes: bool = False,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    writers: int = DEFAULT_LABEL_WRITERS,
+    seed: Optional[int] = None,
+) -> ImageClasses:
+    """Write one YOLO .txt file per selected image from a CSV file or columnar store.
+
+    The classes of the written images are also saved next to the labels (see
+    image_classes), so a balanced split does not have to read the files back.
+
+    Args:
+        detections: CSV file or .dets store with detections
+        output_labels_dir: Directory to write .txt label files to
+        class_of: Class id written for an image's boxes, from its filename
+        image_files: Filenames (as in the detections) that exist; others are skipped.
+            None writes labels for every filename.
+        confidence_threshold: Minimum confidence of a detection
+        max_images_per_class: Maximum images per class (randomly sampled)
+        balance_classes: Limit every class to the smallest class's image count
+        chunk_rows: Detections parsed and written per chunk
+        writers: Label writer threads
+        seed: Random seed for the per-class sampling
+
+    Returns:
+        Boxes per class of every image that got a label file
+
+    Raises:
+        FileNotFoundError: If there are detections but none of their images exist
+    """
+    os.makedirs(output_labels_dir, exist_ok=True)
+    file_ids: Dict[str, int] = {}
+    filenames: List[str] = []
+    image_class: List[int] = []
+
+    with tempfile.TemporaryDirectory(prefix="yolo_convert_") as spill_dir:
+        ids_path = os.path.join(spill_dir, "file_id.bin")
+        boxes_path = os.path.join(spill_dir, "boxes.bin")
+        rows = 0
+        counts = np.zeros(0, dtype=np.int64)  # Kept rows per image id
+        with open(ids_path, "wb") as ids_out, open(boxes_path, "wb") as boxes_out:
+            for chunk in iter_detection_chunks(detections, chunk_rows):
+                keep = chunk.confidence >= confidence_threshold
+                # Chunk-local name ids -> global image ids (one dict lookup per name)
+                global_ids = np.empty(len(chunk.names), dtype=np.uint32)
+                for i, name in enumerate(chunk.names):
+                    image_id = file_ids.get(name)
+                    if image_id is None:
+                        image_id = file_ids[name] = len(filenames)
+                        filenames.append(name)
+                        image_class.append(class_of(name))
+                    global_ids[i] = image_id
+                ids = global_ids[chunk.name_id[keep]]
+                ids.tofile(ids_out)
+                chunk.boxes[keep].tofile(boxes_out)
+                if len(counts) < len(filenames):  # Grow geometrically, not per chunk
+                    grown = np.zeros(max(len(filenames), 2 * len(counts)), dtype=np.int64)
+                    grown[: len(counts)] = counts
+                    counts = grown
+                np.add.at(counts, ids, 1)
+                rows += len(ids)
+
+        counts = counts[: len(filenames)]
+        classes = np.asarray(image_class, dtype=np.int64)
+        exists = np.ones(len(filenames), dtype=bool)
+        if image_files is not None:
+            exists = np.fromiter((name in image_files for name in filenames), bool, len(filenames))
+        eligible = np.flatnonzero((counts > 0) & exists)
+        if counts.any() and not len(eligible):
+            missing = filenames[int(np.flatnonzero(counts)[0])]
+            raise FileNotFoundError(
+                f"None of the {int(np.count_nonzero(counts))} images with detections exist "
+                f"(e.g. {missing}); check that the images folder matches the detections"
+            )
+        selected = select_images(classes, eligible, max_images_per_class, balance_classes, seed)
+        # Label files are named by stem only: of images sharing a stem, the last one wins
+        by_stem = {Path(filenames[i]).stem: i for i in np.flatnonzero(selected).tolist()}
+        selected[:] = False
+        selected[list(by_stem.values())] = True
+
+        started = np.zeros(len(filenames), dtype=bool)
+        pool = LabelWriterPool(output_labels_dir, writers)
+        try:
+            if rows:
+                all_ids = np.memmap(ids_path, dtype=np.uint32, mode="r")
+                all_boxes = np.memmap(boxes_path, dtype=np.float64, mode="r").reshape(-1, 4)
+                for start in range(0, rows, chunk_rows):
+                    ids = np.asarray(all_ids[start : start + chunk_rows])
+                    picked = np.flatnonzero(selected[ids])
+                    if not len(picked):
+                        continue
+                    picked = picked[np.argsort(ids[picked], kind="stable")]
+                    ids = ids[picked]
+                    boxes = np.asarray(all_boxes[start : start + chunk_rows])[picked]
+                    bounds = np.concatenate([[0], np.flatnonzero(np.diff(ids)) + 1, [len(ids)]])
+                    for lo, hi in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+                        image_id = int(ids[lo])
+                        pool.submit(
+                            image_id,
+                            filenames[image_id],
+                            int(classes[image_id]),
+                            boxes[lo:hi],
+                            bool(started[image_id]),
+                        )
+                        started[image_id] = True
+                del all_ids, all_boxes
+        finally:
+            pool.close()
+
+    written = np.flatnonzero(started)
+    image_counts = np.zeros((len(written), int(classes.max(initial=-1)) + 1), dtype=np.uint32)
+    image_counts[np.arange(len(written)), classes[written]] = counts[written]
+    image_classes = ImageClasses([Path(filenames[i]).stem for i in written.tolist()], image_counts)
+    save_image_classes(output_labels_dir, image_classes)
+    print(f"Converted {len(written)} images with annotations to YOLO format")
+    return image_classes
+
+
+__all__ = [
+    "DEFAULT_CHUNK_ROWS",
+    "DetectionChunk",
+    "LabelWriterPool",
+    "iter_detection_chunks",
+    "select_images",
+    "convert_detections_to_labels",
+]
@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+"""Materialize YOLO .txt labels from stored raw detections.
+
+Run auto-labeling once with --raw to keep every candidate box down to a low confidence
+floor, then pick thresholds offline: each materialization is a vectorized mask over the
+detection columns and takes seconds instead of a new inference run.
+
+Usage:
+    # One global threshold
+    python materialize_labels.py yolo_labels.dets --output yolo_dataset/labels --threshold 0.5
+
+    # Per-class thresholds (class name or id) and at most 5 boxes per image
+    python materialize_labels.py yolo_labels.dets --output yolo_dataset/labels \\
+        --threshold 0.5 --class-threshold battery=0.3 --class-threshold 1=0.6 --top-k 5
+
+    # Compare thresholds without writing anything
+    python materialize_labels.py yolo_labels.dets --sweep 0.1,0.2,0.3,0.4,0.5,0.6
+"""
+
+import argparse
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from rich import print
+from rich.table import Table
+
+from dataset_utils_yolo import CANONICAL_CLASSES, CLASS_TO_ID
+from detection_store import DetectionTable, load_detection_table
+
+
+def parse_class_thresholds(specs: Sequence[str]) -> Dict[int, float]:
+    """Parse CLASS=THRESHOLD pairs, where CLASS is a canonical class name or id."""
+    thresholds = {}
+    for spec in specs:
+        name, sep, value = spec.partition("=")
+        if not sep:
+            raise ValueError(f"Expected CLASS=THRESHOLD, got '{spec}'")
+        name = name.strip()
+        if name.isdigit():
+            class_id = int(name)
+        elif name in CLASS_TO_ID:
+            class_id = CLASS_TO_ID[name]
+        else:
+            raise ValueError(f"Unknown class '{name}' (expected one of {CANONICAL_CLASSES})")
+        thresholds[class_id] = float(value)
+    return thresholds
+
+
+def select_rows(
+    table: DetectionTable,
+    threshold: float,
+    class_thresholds: Optional[Dict[int, float]] = None,
+    top_k: int = 0,
+) -> np.ndarray:
+    """Indices of detections that pass the thresholds, in table order.
+
+    Args:
+        table: Detections to filter
+        threshold: Minimum confidence for classes without their own threshold
+        class_thresholds: Per-class minimum confidence overrides
+        top_k: Keep at most this many highest-confidence boxes per image (0 keeps all)
+
+    Returns:
+        Sorted row indices into the table
+    """
+    # Lookup table indexed by class id, so the per-class test is a single gather
+    per_class = np.full(256, threshold, dtype=np.float32)
+    for class_id, value in (class_thresholds or {}).items():
+        per_class[class_id] = value
+    keep = np.flatnonzero(table.confidence >= per_class[table.class_id])
+
+    if top_k > 0 and len(keep):
+        file_id = table.file_id[keep]
+        order = np.lexsort((-table.confidence[keep], file_id))
+        grouped = file_id[order]
+        # Rank within each image = position minus the index where its group starts
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(grouped)) + 1])
+        group_start = np.repeat(starts, np.diff(np.concatenate([starts, [len(grouped)]])))
+        rank = np.arange(len(grouped)) - group_start
+        keep = np.sort(keep[order[rank < top_k]])
+    return keep
+
+
+def write_yolo_label_files(labels_dir: str, blocks: List[Tuple[str, int, np.ndarray]]) -> int:
+    """Write one YOLO .txt file per image from (filename, class_id, xywh rows) blocks.
+
+    Returns:
+        Number of label files written
+    """
+    for filename, class_id, boxes in blocks:
+        image_stem = Path(filename).stem
+        txt_file = Path(labels_dir) / f"{image_stem}.txt"
+        with open(txt_file, "w") as f:
+            f.writelines(
+                f"{class_id} {x:.6f} {y:.6f} {w:.6f} {h:.6f}\n" for x, y, w, h in boxes.tolist()
+            )
+    return len(blocks)
+
+
+def materialize_labels(
+    detections: str,
+    output_labels_dir: str,
+    threshold: float = 0.5,
+    class_thresholds: Optional[Dict[int, float]] = None,
+    top_k: int = 0,
+    clean: bool = True,
+) -> int:
+    """Write YOLO .txt labels for the detections that pass the given thresholds.
+
+    Args:
+        detections: CSV file or columnar .dets store with raw detections
+        output_labels_dir: Directory to write .txt label files to
+        threshold: Minimum confidence for classes without their own threshold
+        class_thresholds: Per-class minimum confidence overrides
+        top_k: Keep at most this many highest-confidence boxes per image (0 keeps all)
+        clean: Remove existing .txt files first, so images that lost all boxes under
+            the new thresholds do not keep stale labels
+
+    Returns:
+        Number of label files written
+    """
+    table = load_detection_table(detections, mmap=True)
+    rows = select_rows(table, threshold, class_thresholds, top_k)
+
+    os.makedirs(output_labels_dir, exist_ok=True)
+    if clean:
+        for entry in os.scandir(output_labels_dir):
+            if entry.is_file() and entry.name.endswith(".txt"):
+                os.remove(entry.path)
+
+    # Group surviving rows by image; stable so boxes keep their stored order
+    rows = rows[np.argsort(table.file_id[rows], kind="stable")]
+    file_id = table.file_id[rows]
+    boxes = np.asarray(table.boxes[rows])
+    class_id = table.class_id[rows]
+    bounds = np.concatenate([[0], np.flatnonzero(np.diff(file_id)) + 1, [len(rows)]])
+
+    blocks = [
+        (table.filenames[file_id[start]], int(class_id[start]), boxes[start:end])
+        for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist())
+        if end > start
+    ]
+    written = write_yolo_label_files(output_labels_dir, blocks)
+    print(
+        f"[green]Materialized {len(rows)} boxes into {written} label files "
+        f"in {output_labels_dir}[/green]"
+    )
+    return written
+
+
+def sweep_thresholds(
+    detections: str,
+    thresholds: Sequence[float],
+    class_thresholds: Optional[Dict[int, float]] = None,
+    top_k: int = 0,
+) -> List[Dict]:
+    """Report boxes and labeled images per class for several global thresholds.
+
+    Returns:
+        One dictionary per threshold with total and per-class counts
+    """
+    table = load_detection_table(detections, mmap=True)
+    total_images = len(table.filenames)
+    print(f"[cyan]{len(table.confidence)} stored detections for {total_images} images[/cyan]")
+
+    # Only classes that occur in the detections get a column
+    present = [c for c in np.unique(table.class_id).tolist() if c < len(CANONICAL_CLASSES)]
+    summary = Table("threshold", "boxes", "images", "boxes/img", title="Threshold sweep")
+    for class_id in present:
+        summary.add_column(CANONICAL_CLASSES[class_id], justify="right")
+
+    report = []
+    for threshold in thresholds:
+        rows = select_rows(table, threshold, class_thresholds, top_k)
+        labeled, first = np.unique(table.file_id[rows], return_index=True)
+        # Images per class: every box of an image carries the image's class
+        per_class = np.bincount(table.class_id[rows][first], minlength=len(CANONICAL_CLASSES))
+        boxes_per_image = len(rows) / len(labeled) if len(labeled) else 0.0
+        summary.add_row(
+            f"{threshold:g}",
+            str(len(rows)),
+            str(len(labeled)),
+            f"{boxes_per_image:.2f}",
+            *(str(int(per_class[class_id])) for class_id in present),
+        )
+        report.append(
+            {
+                "threshold": threshold,
+                "boxes": int(len(rows)),
+                "images": int(len(labeled)),
+                "images_per_class": {
+                    name: int(n) for name, n in zip(CANONICAL_CLASSES, per_class.tolist())
+                },
+            }
+        )
+    print(summary)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Materialize YOLO labels from raw detections at any threshold",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("detections", help="CSV file or .dets store written with --raw")
+    parser.add_argument("--output", type=str, help="Directory for the YOLO .txt label files")
+    parser.add_argument(
+        "--threshold", type=float, default=0.5, help="Minimum confidence for every class"
+    )
+    parser.add_argument(
+        "--class-threshold",
+        action="append",
+        default=[],
+        metavar="CLASS=THRESHOLD",
+        help="Per-class override by class name or id; may be repeated",
+    )
+    parser.add_argument(
+        "--top-k", type=int, default=0, help="Keep at most K boxes per image (0 keeps all)"
+    )
+    parser.add_argument(
+        "--sweep",
+        type=str,
+        help="Comma-separated thresholds to compare instead of writing labels",
+    )
+    parser.add_argument(
+        "--keep-existing",
+        action="store_true",
+        help="Do not delete existing .txt files in --output before writing",
+    )
+    args = parser.parse_args()
+
+    try:
+        class_thresholds = parse_class_thresholds(args.class_threshold)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.sweep:
+        thresholds = [float(value) for value in args.sweep.split(",") if value.strip()]
+        sweep_thresholds(args.detections, thresholds, class_thresholds, args.top_k)
+    elif args.output:
+        materialize_labels(
+            args.detections,
+            args.output,
+            args.threshold,
+            class_thresholds,
+            args.top_k,
+            clean=not args.keep_existing,
+        )
+    else:
+        parser.error("either --output or --sweep is required")
+
+
+__all__ = [
+    "parse_class_thresholds",
+    "select_rows",
+    "write_yolo_label_files",
+    "materialize_labels",
+    "sweep_thresholds",
+]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,511 @@
+#!/usr/bin/env python
+"""Pack a split YOLO dataset into a few large, memory-mappable shard files.
+
+split_dataset and prepare_yolo_dataset write one image and one .txt label file per
+sample, which on network storage means two small-file opens for every image in every
+epoch. pack_dataset turns such a dataset into one directory of shards per split:
+
+    yolo_dataset.shards/
+      data.yaml            Ultralytics data config pointing at the split directories
+      train/00000.rshard   train/00001.rshard ...
+      val/00000.rshard
+      test/00000.rshard
+
+A shard is a single little-endian file: a fixed header, the encoded images back to
+back (bytes unchanged from the source files), then a float32 label array with one
+(class, x_center, y_center, width, height) row per box, a structured index with each
+record's image offset/size, label rows and (height, width), and the image names.
+ShardReader maps the file and exposes the labels and index as zero-copy numpy views, so
+records can be read at random (training) or streamed in order (packing, statistics).
+
+train_yolo_detector.py trains straight from the shards when --data points at the
+generated data.yaml (see shard_dataset.py).
+
+Usage:
+    python record_shards.py yolo_dataset yolo_dataset.shards --shard-size-mb 1024
+"""
+
+import argparse
+import glob
+import io
+import mmap
+import os
+import struct
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+from rich import print
+
+sys.path.append(str(Path(__file__).parent.parent))
+from dataset_utils import CANONICAL_CLASSES
+from split_materialize import SOURCE_DIR
+
+SHARD_SUFFIX = ".rshard"
+SHARD_MAGIC = b"RSHARD01"
+SPLITS = ("train", "val", "test")
+DEFAULT_SHARD_SIZE_MB = 1024
+DEFAULT_PACK_WORKERS = 16  # Reads are I/O bound, mostly waiting on network storage
+READ_AHEAD = 4  # Samples read ahead of the shard writer, per worker
+
+# magic, record count, label rows, labels offset, index offset, names offset, names size
+_HEADER = struct.Struct("<8s6Q")
+_DATA_START = 64
+_ALIGN = 8
+
+INDEX_DTYPE = np.dtype(
+    [
+        ("image_offset", "<u8"),
+        ("image_size", "<u8"),
+        ("label_start", "<u8"),
+        ("label_count", "<u4"),
+        ("height", "<u4"),
+        ("width", "<u4"),
+        ("_pad", "<u4"),
+    ]
+)
+LABEL_DTYPE = np.dtype("<f4")  # (rows, 5): class, x_center, y_center, width, height
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png")
+EXIF_ORIENTATION = 0x0112
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+class Record(NamedTuple):
+    """One sample of a shard. image is a view into the mapped file, valid while it is open."""
+
+    name: str
+    image: memoryview  # Encoded bytes, as in the source file
+    labels: np.ndarray  # (boxes, 5) float32 class, x_center, y_center, width, height
+    shape: Tuple[int, int]  # (height, width) as decoded, EXIF orientation applied
+
+
+def _aligned(offset: int) -> int:
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+class ShardWriter:
+    """Write one shard file; records are appended in order and the file is finalized on close."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._tmp = path + ".tmp"
+        self._file = open(self._tmp, "wb")
+        self._file.write(b"\0" * _DATA_START)
+        self._offset = _DATA_START
+        self._index: List[Tuple] = []
+        self._labels: List[np.ndarray] = []
+        self._label_rows = 0
+        self._names: List[str] = []
+
+    @property
+    def size(self) -> int:
+        """Bytes written so far (images only; the index and labels are small)."""
+        return self._offset
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def add(self, name: str, image: bytes, labels: np.ndarray, shape: Tuple[int, int]) -> None:
+        labels = np.asarray(labels, dtype=LABEL_DTYPE).reshape(-1, 5)
+        self._file.write(image)
+        self._index.append(
+            (self._offset, len(image), self._label_rows, len(labels), shape[0], shape[1], 0)
+        )
+        self._offset += len(image)
+        self._labels.append(labels)
+        self._label_rows += len(labels)
+        self._names.append(name)
+
+    def close(self) -> None:
+        """Append labels, index and names, write the header and move the file into place."""
+        labels = (
+            np.concatenate(self._labels) if self._labels else np.zeros((0, 5), dtype=LABEL_DTYPE)
+        )
+        index = np.array(self._index, dtype=INDEX_DTYPE)
+        names = "\n".join(self._names).encode("utf-8")
+
+        labels_offset = _aligned(self._offset)
+        index_offset = _aligned(labels_offset + labels.nbytes)
+        names_offset = index_offset + index.nbytes
+        self._file.write(b"\0" * (labels_offset - self._offset))
+        self._file.write(labels.tobytes())
+        self._file.write(b"\0" * (index_offset - labels_offset - labels.nbytes))
+        self._file.write(index.tobytes())
+        self._file.write(names)
+        self._file.seek(0)
+        self._file.write(
+            _HEADER.pack(
+                SHARD_MAGIC,
+                len(index),
+                len(labels),
+                labels_offset,
+                index_offset,
+                names_offset,
+                len(names),
+            )
+        )
+        self._file.close()
+        os.replace(self._tmp, self.path)
+
+
+class ShardReader:
+    """Random and sequential access to one memory-mapped shard.
+
+    The file is mapped lazily and again after a fork or unpickling, so readers can be
+    handed to DataLoader worker processes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._pid = None
+        with open(path, "rb") as f:
+            header = f.read(_HEADER.size)
+        magic, count, *_ = _HEADER.unpack(header)
+        if magic != SHARD_MAGIC:
+            raise ValueError(f"{path} is not a record shard")
+        self._count = count
+        self._open()
+
+    def _open(self) -> None:
+        with open(self.path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _, count, label_rows, labels_offset, index_offset, names_offset, names_size = (
+            _HEADER.unpack_from(self._map)
+        )
+        self.labels = np.frombuffer(
+            self._map, dtype=LABEL_DTYPE, count=label_rows * 5, offset=labels_offset
+        ).reshape(label_rows, 5)
+        self.index = np.frombuffer(self._map, dtype=INDEX_DTYPE, count=count, offset=index_offset)
+        names = self._map[names_offset : names_offset + names_size].decode("utf-8")
+        self.names = names.split("\n") if count else []
+        self._pid = os.getpid()
+
+    def _ensure_open(self) -> None:
+        if self._pid != os.getpid():
+            self._open()
+
+    def __getstate__(self) -> Dict:
+        # The mapping cannot be pickled; the receiving process maps the file again
+        return {"path": self.path, "_count": self._count, "_pid": None}
+
+    def __setstate__(self, state: Dict) -> None:
+        self.__dict__.update(state)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, i: int) -> Record:
+        self._ensure_open()
+        entry = self.index[i]
+        start = int(entry["image_offset"])
+        label_start = int(entry["label_start"])
+        return Record(
+            self.names[i],
+            memoryview(self._map)[start : start + int(entry["image_size"])],
+            self.labels[label_start : label_start + int(entry["label_count"])],
+            (int(entry["height"]), int(entry["width"])),
+        )
+
+    def __iter__(self) -> Iterator[Record]:
+        self._ensure_open()
+        if hasattr(self._map, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+            self._map.madvise(mmap.MADV_SEQUENTIAL)
+        for i in range(self._count):
+            yield self[i]
+
+    def decode(self, i: int, flags: int = cv2.IMREAD_COLOR) -> Optional[np.ndarray]:
+        """Decoded BGR image of record i (EXIF orientation applied, like cv2.imread)."""
+        return cv2.imdecode(np.frombuffer(self[i].image, dtype=np.uint8), flags)
+
+
+class ShardedSplit:
+    """All shards of one split directory, addressed as a single sequence of records."""
+
+    def __init__(self, split_dir: str):
+        self.split_dir = split_dir
+        self.shards = [ShardReader(p) for p in list_shards(split_dir)]
+        self._starts = np.cumsum([0] + [len(s) for s in self.shards])
+
+    def __len__(self) -> int:
+        return int(self._starts[-1])
+
+    def locate(self, i: int) -> Tuple[ShardReader, int]:
+        """(shard, index within the shard) of record i."""
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        shard = int(np.searchsorted(self._starts, i, side="right")) - 1
+        return self.shards[shard], i - int(self._starts[shard])
+
+    def __getitem__(self, i: int) -> Record:
+        shard, j = self.locate(i)
+        return shard[j]
+
+    def __iter__(self) -> Iterator[Record]:
+        for shard in self.shards:
+            yield from shard
+
+    def decode(self, i: int, flags: int = cv2.IMREAD_COLOR) -> Optional[np.ndarray]:
+        shard, j = self.locate(i)
+        return shard.decode(j, flags)
+
+    def names(self) -> List[str]:
+        for shard in self.shards:
+            shard._ensure_open()
+        return [name for shard in self.shards for name in shard.names]
+
+    def shapes(self) -> np.ndarray:
+        """(records, 2) array of (height, width)."""
+        if not self.shards:
+            return np.zeros((0, 2), dtype=np.int64)
+        for shard in self.shards:
+            shard._ensure_open()
+        return np.concatenate(
+            [np.stack([s.index["height"], s.index["width"]], axis=1) for s in self.shards]
+        ).astype(np.int64)
+
+
+def list_shards(split_dir: str) -> List[str]:
+    return sorted(glob.glob(os.path.join(glob.escape(split_dir), f"*{SHARD_SUFFIX}")))
+
+
+def is_shard_dir(path: str) -> bool:
+    """True for a split directory produced by pack_dataset."""
+    return isinstance(path, str) and os.path.isdir(path) and bool(list_shards(path))
+
+
+def image_shape(data: bytes) -> Tuple[int, int]:
+    """(height, width) after EXIF orientation, from the image header only."""
+    with Image.open(io.BytesIO(data)) as image:
+        width, height = image.size
+        if image.getexif().get(EXIF_ORIENTATION, 1) in TRANSPOSED_ORIENTATIONS:
+            width, height = height, width
+    return height, width
+
+
+def read_label_file(path: str) -> np.ndarray:
+    """YOLO label rows of a .txt file as a (boxes, 5) float32 array (empty if missing)."""
+    try:
+        with open(path) as f:
+            values = f.read().split()
+    except FileNotFoundError:
+        values = []
+    if len(values) % 5:
+        raise ValueError(f"Malformed label file {path}")
+    return np.array(values, dtype=LABEL_DTYPE).reshape(-1, 5)
+
+
+def _load_sample(image_path: str, label_path: str) -> Tuple:
+    """Read one image and its label file: (bytes, labels, shape) or an error message."""
+    try:
+        with open(image_path, "rb") as f:
+            data = f.read()
+        labels = read_label_file(label_path)
+        return data, labels, image_shape(data), None
+    except Exception as e:
+        return None, None, None, str(e)
+
+
+def _bounded_map(
+    executor: ThreadPoolExecutor, fn: Callable, items: Iterable, window: int
+) -> Iterator:
+    """executor.map in order, but with at most window calls submitted and not yet consumed.
+
+    executor.map submits everything up front, so with a slow consumer every result
+    (here: whole images) would pile up in memory.
+    """
+    pending = deque()
+    for item in items:
+        if len(pending) >= window:
+            yield pending.popleft().result()
+        pending.append(executor.submit(fn, item))
+    while pending:
+        yield pending.popleft().result()
+
+
+def pack_split(
+    images_dir: str,
+    labels_dir: str,
+    output_dir: str,
+    shard_size_mb: int = DEFAULT_SHARD_SIZE_MB,
+    workers: int = DEFAULT_PACK_WORKERS,
+    relpaths: Optional[List[str]] = None,
+) -> Tuple[int, int]:
+    """Pack one split's images and label files into numbered shards in output_dir.
+
+    Args:
+        images_dir: Directory with the split's images (e.g. yolo_dataset/images/train)
+        labels_dir: Directory with the matching .txt labels (e.g. yolo_dataset/labels/train)
+            at the images' relative paths
+        output_dir: Directory for the shards; existing shards there are replaced
+        shard_size_mb: Start a new shard once the current one holds this many MB of images
+        workers: Threads reading source files; at most READ_AHEAD samples per thread are
+            held in memory ahead of the shard writer
+        relpaths: Images to pack, relative to images_dir (default: every image in it)
+
+    Returns:
+        (records packed, shards written)
+    """
+    if relpaths is None:
+        relpaths = sorted(
+            os.path.relpath(p, images_dir)
+            for p in Path(images_dir).rglob("*")
+            if p.suffix.lower() in IMAGE_EXTS
+        )
+    os.makedirs(output_dir, exist_ok=True)
+    for stale in list_shards(output_dir):
+        os.remove(stale)
+
+    limit = shard_size_mb * 1024 * 1024
+    writer, shards, packed = None, 0, 0
+    workers = max(1, workers)
+
+    def load(rel: str) -> Tuple:
+        label_path = os.path.join(labels_dir, os.path.splitext(rel)[0] + ".txt")
+        return _load_sample(os.path.join(images_dir, rel), label_path)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        samples = _bounded_map(executor, load, relpaths, workers * READ_AHEAD)
+        for rel, (data, labels, shape, error) in zip(relpaths, samples):
+            if error is not None:
+                print(f"[yellow]Skipping {os.path.join(images_dir, rel)}: {error}[/yellow]")
+                continue
+            if writer is not None and writer.size + len(data) > limit and len(writer):
+                writer.close()
+                writer = None
+            if writer is None:
+                writer = ShardWriter(os.path.join(output_dir, f"{shards:05d}{SHARD_SUFFIX}"))
+                shards += 1
+            writer.add(rel, data, labels, shape)
+            packed += 1
+    if writer is not None:
+        writer.close()
+    return packed, shards
+
+
+def read_image_list(list_file: str, images_dir: str) -> List[str]:
+    """Paths of a listfile split (relative to the list's folder) made relative to images_dir.
+
+    Raises:
+        ValueError: If a listed image is not inside images_dir
+    """
+    base = os.path.dirname(os.path.abspath(list_file))
+    root = os.path.abspath(images_dir)
+    relpaths = []
+    with open(list_file) as f:
+        for line in f:
+            entry = line.strip()
+            if not entry:
+                continue
+            rel = os.path.relpath(os.path.normpath(os.path.join(base, entry)), root)
+            if rel.startswith(os.pardir):
+                raise ValueError(f"{list_file} lists {entry}, which is outside {images_dir}")
+            relpaths.append(rel)
+    return relpaths
+
+
+def pack_dataset(
+    dataset_dir: str,
+    output_dir: str,
+    shard_size_mb: int = DEFAULT_SHARD_SIZE_MB,
+    workers: int = DEFAULT_PACK_WORKERS,
+    names: Optional[List[str]] = None,
+) -> str:
+    """Pack a split YOLO dataset (images/<split>, labels/<split>) into shards.
+
+    Datasets split with --materialize listfile have <split>.txt image lists instead; their
+    images and labels are read through source/images and source/labels.
+
+    Args:
+        dataset_dir: Output of split_dataset or prepare_yolo_dataset
+        output_dir: Shard directory; gets one subdirectory per split and a data.yaml
+        shard_size_mb: Target shard size in MB
+        workers: Threads reading source files
+        names: Class names for data.yaml (defaults to the canonical classes)
+
+    Returns:
+        Path to the generated data.yaml
+    """
+    if names is None:
+        names = CANONICAL_CLASSES
+    splits = {}
+    for split in SPLITS:
+        images_dir = os.path.join(dataset_dir, "images", split)
+        labels_dir = os.path.join(dataset_dir, "labels", split)
+        list_file = os.path.join(dataset_dir, f"{split}.txt")
+        relpaths = None
+        if not os.path.isdir(images_dir):
+            if not os.path.isfile(list_file):
+                continue
+            images_dir = os.path.join(dataset_dir, SOURCE_DIR, "images")
+            labels_dir = os.path.join(dataset_dir, SOURCE_DIR, "labels")
+            relpaths = read_image_list(list_file, images_dir)
+        packed, shards = pack_split(
+            images_dir,
+            labels_dir,
+            os.path.join(output_dir, split),
+            shard_size_mb,
+            workers,
+            relpaths,
+        )
+        splits[split] = packed
+        print(f"[green]{split}: {packed} records in {shards} shard(s)[/green]")
+    if not splits:
+        raise FileNotFoundError(
+            f"No images/<split> directories or <split>.txt lists found in {dataset_dir}"
+        )
+
+    data_yaml = os.path.join(output_dir, "data.yaml")
+    with open(data_yaml, "w") as f:
+        f.write(f"path: {os.path.abspath(output_dir)}\n")
+        for split in splits:
+            f.write(f"{split}: {split}\n")
+        f.write("\nnames:\n")
+        f.writelines(f"  {i}: {name}\n" for i, name in enumerate(names))
+    print(
+        f"[cyan]Train from the shards with: python train_yolo_detector.py --data {data_yaml}[/cyan]"
+    )
+    return data_yaml
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Pack a split YOLO dataset into memory-mappable shards",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "dataset", help="Split dataset directory (images/<split>, labels/<split> or <split>.txt)"
+    )
+    parser.add_argument("output", help="Shard directory, e.g. yolo_dataset.shards")
+    parser.add_argument(
+        "--shard-size-mb", type=int, default=DEFAULT_SHARD_SIZE_MB, help="Target shard size"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=DEFAULT_PACK_WORKERS, help="Threads reading source files"
+    )
+    args = parser.parse_args()
+    pack_dataset(args.dataset, args.output, args.shard_size_mb, args.workers)
+
+
+__all__ = [
+    "SHARD_SUFFIX",
+    "Record",
+    "ShardWriter",
+    "ShardReader",
+    "ShardedSplit",
+    "list_shards",
+    "is_shard_dir",
+    "read_label_file",
+    "pack_split",
+    "read_image_list",
+    "pack_dataset",
+]
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,9 @@
 import csv
 
+import numpy as np
+
+from detection_store import is_detection_store, load_detection_table, rewrite_filenames
+
 
 def replace_residual_waste_with_battery(csv_file_path):
     """
@@ -7,11 +11,14 @@ def replace_residual_waste_with_battery(csv_file_path):
     that have 'battery' in their filename but are currently classified as 'residual_waste'.
 
     Args:
-        csv_file_path (str): Path to the YOLO labels CSV file.
+        csv_file_path (str): Path to the YOLO labels CSV file or columnar .dets store.
 
     Returns:
         int: Number of rows updated.
     """
+    if is_detection_store(csv_file_path):
+        return _replace_in_store(csv_file_path)
+
     updated_count = 0
     rows = []
 
@@ -39,6 +46,21 @@ def replace_residual_waste_with_battery(csv_file_path):
     return updated_count
 
 
+def _replace_in_store(store_path):
+    """Store variant: filenames are dictionary-encoded, so only filenames.txt is rewritten."""
+    table = load_detection_table(store_path, mmap=True)
+    filenames = list(table.filenames)
+    changed_ids = []
+    for file_id, filename in enumerate(filenames):
+        if "battery" in filename and filename.startswith("residual_waste/"):
+            filenames[file_id] = filename.replace("residual_waste/", "battery/", 1)
+            changed_ids.append(file_id)
+
+    if changed_ids:
+        rewrite_filenames(store_path, filenames)
+    return int(np.isin(table.file_id, changed_ids).sum())
+
+
 # Example usage
 if __name__ == "__main__":
     csv_file = "yolo_labels.csv"
@@ -0,0 +1,151 @@
+"""Ultralytics dataset, trainer and validator that read record shards.
+
+ShardYOLODataset takes a split directory written by record_shards.pack_dataset in place
+of an image folder: image names, labels and shapes come from the shard indexes (no
+label scan or label cache), and images are decoded straight from the memory-mapped
+shards. Augmentation, mosaic buffering and rectangular batching are Ultralytics' own.
+
+ShardDetectionTrainer and ShardDetectionValidator build this dataset for every split
+path that is a shard directory and fall back to the regular dataset otherwise, so they
+are passed as trainer=/validator= to YOLO.train/YOLO.val.
+"""
+
+import math
+import os
+from typing import Dict, List
+
+import cv2
+import numpy as np
+from ultralytics.data.dataset import YOLODataset
+from ultralytics.models.yolo.detect import DetectionTrainer, DetectionValidator
+from ultralytics.utils import LOGGER, colorstr
+
+from record_shards import ShardedSplit, is_shard_dir
+
+
+class ShardYOLODataset(YOLODataset):
+    """YOLODataset over one split of record shards."""
+
+    def get_img_files(self, img_path: str) -> List[str]:
+        self.split = ShardedSplit(img_path)
+        names = [os.path.join(img_path, name) for name in self.split.names()]
+        if not names:
+            raise FileNotFoundError(f"{self.prefix}No records found in {img_path}")
+        # Labels are reordered by set_rectangle, so images are looked up by name
+        self.record_index = {name: i for i, name in enumerate(names)}
+        fraction = self.fraction
+        count = fraction if isinstance(fraction, int) else max(1, round(len(names) * fraction))
+        return names[:count]
+
+    def get_labels(self) -> List[Dict]:
+        shapes = self.split.shapes()
+        labels = []
+        for im_file in self.im_files:
+            i = self.record_index[im_file]
+            rows = np.array(self.split[i].labels, dtype=np.float32)  # Writable copy
+            labels.append(
+                {
+                    "im_file": im_file,
+                    "shape": (int(shapes[i, 0]), int(shapes[i, 1])),
+                    "cls": rows[:, 0:1],
+                    "bboxes": rows[:, 1:],
+                    "segments": [],
+                    "keypoints": None,
+                    "normalized": True,
+                    "bbox_format": "xywh",
+                }
+            )
+        if not any(len(label["cls"]) for label in labels):
+            LOGGER.warning(f"{self.prefix}No labels found in {self.img_path}")
+        return labels
+
+    def check_cache_disk(self, safety_margin: float = 0.1) -> bool:
+        # *.npy caches live next to image files, which shards do not have
+        LOGGER.warning(f"{self.prefix}cache='disk' is not supported for shards, not caching")
+        return False
+
+    def load_image(self, i: int, rect_mode: bool = True, **kwargs):
+        """Decode image i from its shard and resize it like BaseDataset.load_image."""
+        if self.ims[i] is not None:
+            return self.ims[i], self.im_hw0[i], self.im_hw[i]
+
+        f = self.im_files[i]
+        im = self.split.decode(self.record_index[f], getattr(self, "cv2_flag", cv2.IMREAD_COLOR))
+        if im is None:
+            raise FileNotFoundError(f"Image could not be decoded {f}")
+        h0, w0 = im.shape[:2]
+        if rect_mode:  # Resize long side to imgsz keeping the aspect ratio
+            r = self.imgsz / max(h0, w0)
+            if r != 1:
+                w, h = (min(math.ceil(w0 * r), self.imgsz), min(math.ceil(h0 * r), self.imgsz))
+                im = cv2.resize(im, (w, h), interpolation=cv2.INTER_LINEAR)
+        elif not (h0 == w0 == self.imgsz):  # Stretch to a square imgsz
+            im = cv2.resize(im, (self.imgsz, self.imgsz), interpolation=cv2.INTER_LINEAR)
+        if im.ndim == 2:
+            im = im[..., None]
+
+        if self.augment and self.cache != "ram":
+            # Keep recent images for mosaic, as BaseDataset does
+            self.ims[i], self.im_hw0[i], self.im_hw[i] = im, (h0, w0), im.shape[:2]
+            self.buffer.append(i)
+            if 1 < len(self.buffer) >= self.max_buffer_length:
+                j = self.buffer.pop(0)
+                self.ims[j], self.im_hw0[j], self.im_hw[j] = None, None, None
+        return im, (h0, w0), im.shape[:2]
+
+
+def build_shard_dataset(cfg, img_path: str, batch: int, data: Dict, mode: str, stride: int):
+    """ShardYOLODataset with the arguments build_yolo_dataset would use."""
+    return ShardYOLODataset(
+        img_path=img_path,
+        imgsz=cfg.imgsz,
+        batch_size=batch,
+        augment=mode == "train",
+        hyp=cfg,
+        rect=cfg.rect or mode == "val",
+        cache=cfg.cache or None,
+        single_cls=cfg.single_cls or False,
+        stride=stride,
+        pad=0.0 if mode == "train" else 0.5,
+        prefix=colorstr(f"{mode}: "),
+        task=cfg.task,
+        classes=cfg.classes,
+        data=data,
+        fraction=cfg.fraction if mode == "train" else 1.0,
+    )
+
+
+class ShardDetectionTrainer(DetectionTrainer):
+    def build_dataset(self, img_path, mode="train", batch=None):
+        if not is_shard_dir(img_path):
+            return super().build_dataset(img_path, mode, batch)
+        model = getattr(self.model, "module", self.model)
+        stride = max(int(model.stride.max()), 32) if model is not None else 32
+        return build_shard_dataset(self.args, img_path, batch, self.data, mode, stride)
+
+
+class ShardDetectionValidator(DetectionValidator):
+    def build_dataset(self, img_path, mode="val", batch=None):
+        if not is_shard_dir(img_path):
+            return super().build_dataset(img_path, mode, batch)
+        return build_shard_dataset(self.args, img_path, batch, self.data, mode, self.stride)
+
+
+def is_shard_data_yaml(data_yaml: str) -> bool:
+    """True if data_yaml's train split is a shard directory."""
+    import yaml
+
+    with open(data_yaml) as f:
+        data = yaml.safe_load(f) or {}
+    root = data.get("path") or os.path.dirname(os.path.abspath(data_yaml))
+    train = data.get("train")
+    return isinstance(train, str) and is_shard_dir(os.path.join(root, train))
+
+
+__all__ = [
+    "ShardYOLODataset",
+    "ShardDetectionTrainer",
+    "ShardDetectionValidator",
+    "build_shard_dataset",
+    "is_shard_data_yaml",
+]
@@ -0,0 +1,86 @@
+"""Stable, hash-based train/val/test assignment.
+
+train_test_split needs every labeled image up front and reshuffles all of them when a
+single image is added. hash_split instead maps each image independently to a point in
+[0, 1) from a hash of its relative path (or its content) and picks the split whose
+ratio range contains that point:
+
+    0 ---- train_ratio ---- train_ratio + val_ratio ---- 1
+             train                   val                 test
+
+An image therefore keeps its split for as long as its key and the ratios stay the same,
+assignment is a single streaming pass, and a growing dataset only adds files to the
+splits.
+
+Stratified assignment salts the hash with the image's class, which gives every class
+its own independent sequence of points over the same ranges, so it stays a streaming
+pass and images still never move. The ratios then hold per class only on average: a
+class of n images lands about n * ratio +- sqrt(n * ratio) images in each split, and a
+class with a handful of images can miss val or test entirely. Exact per-class counts
+would need a cut over the sorted hashes of each class, which moves images near the cut
+whenever the class grows, so they are deliberately not offered here.
+"""
+
+import hashlib
+import os
+from pathlib import Path
+from typing import Optional
+
+from detection_cache import file_digest
+
+HASH_KEYS = ("path", "content")
+
+
+def hash_fraction(key: str, salt: str = "") -> float:
+    """Uniform point in [0, 1) derived from key (and salt)."""
+    digest = hashlib.blake2b(key.encode(), digest_size=8, person=salt.encode()[:16]).digest()
+    return int.from_bytes(digest, "big") / 2**64
+
+
+def hash_split(
+    key: str,
+    train_ratio: float = 0.7,
+    val_ratio: float = 0.2,
+    test_ratio: float = 0.1,
+    class_id: Optional[int] = None,
+) -> str:
+    """Split ("train", "val" or "test") of the image with the given key.
+
+    Args:
+        key: Stable identity of the image (see image_key)
+        train_ratio: Ratio for training set
+        val_ratio: Ratio for validation set
+        test_ratio: Ratio for test set
+        class_id: Class to stratify by; None assigns without stratification
+
+    Returns:
+        Split name
+    """
+    point = hash_fraction(key, "" if class_id is None else f"class{class_id}")
+    total = train_ratio + val_ratio + test_ratio
+    if point < train_ratio / total:
+        return "train"
+    if point < (train_ratio + val_ratio) / total:
+        return "val"
+    return "test"
+
+
+def image_key(images_dir: str, relpath: str, hash_key: str = "path") -> str:
+    """Key hash_split uses for an image: its relative path, or a digest of its bytes.
+
+    Content keys survive renames and moves between class folders, at the cost of
+    reading every image once.
+    """
+    if hash_key == "content":
+        return file_digest(os.path.join(images_dir, relpath))
+    if hash_key != "path":
+        raise ValueError(f"Unknown hash key {hash_key!r}, expected one of {HASH_KEYS}")
+    return Path(relpath).as_posix()
+
+
+__all__ = [
+    "HASH_KEYS",
+    "hash_fraction",
+    "hash_split",
+    "image_key",
+]
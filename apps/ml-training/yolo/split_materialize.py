@@ -0,0 +1,252 @@
+"""Materialize train/val/test splits by copying, linking or listing the source images.
+
+split_dataset and prepare_yolo_dataset used to copy every image into
+images/<split> with shutil.copy2, doubling disk usage and making each re-split an
+I/O-bound job. The modes here trade that copy for cheaper alternatives:
+
+    copy      Full copies (previous behavior), done by a thread pool
+    hardlink  Hard links; no extra space, source and split must share a filesystem
+    symlink   Symbolic links to the absolute source paths
+    reflink   Copy-on-write clones (Btrfs, XFS); no extra space until a file changes
+    listfile  No per-image files at all: train.txt/val.txt/test.txt list the images
+
+Hardlink and reflink fall back to copying when the filesystem refuses them.
+
+Ultralytics finds the label of an image by replacing the last /images/ of its path
+with /labels/. For listfile the output directory therefore gets a single symlink,
+source/images -> the source image folder, the lists name images as
+./source/images/<relpath>, and labels are placed at source/labels/<relpath>.txt. Labels
+do not depend on the split, so re-splitting with new ratios only rewrites the lists.
+In the other modes, files that keep their split are left alone and only moved, new or
+removed images cost any I/O (see prune_splits).
+
+Every mode writes <output>/data.yaml pointing at the splits.
+"""
+
+import os
+import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from rich import print
+
+sys.path.append(str(Path(__file__).parent.parent))
+from dataset_utils import CANONICAL_CLASSES
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+MATERIALIZE_MODES = ("copy", "hardlink", "symlink", "reflink", "listfile")
+SPLITS = ("train", "val", "test")
+SOURCE_DIR = "source"
+DEFAULT_COPY_WORKERS = 8
+FICLONE = 0x40049409  # linux/fs.h: _IOW(0x94, 9, int)
+
+
+def _reflink(src: str, dst: str) -> None:
+    if fcntl is None:
+        raise OSError("reflinks are not supported on this platform")
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+    shutil.copystat(src, dst)
+
+
+def _up_to_date(src: str, dst: str, mode: str) -> bool:
+    """True if dst already is what place_file would make of src."""
+    try:
+        if mode == "symlink":
+            return os.readlink(dst) == os.path.abspath(src)
+        if os.path.islink(dst):
+            return False
+        if mode == "hardlink" and os.path.samefile(src, dst):
+            return True
+        # Copies (and copy fallbacks) keep the source's size and mtime
+        src_stat, dst_stat = os.stat(src), os.stat(dst)
+        return (src_stat.st_size, src_stat.st_mtime_ns) == (dst_stat.st_size, dst_stat.st_mtime_ns)
+    except OSError:
+        return False
+
+
+def place_file(src: str, dst: str, mode: str) -> bool:
+    """Create dst from src with one of the file modes (copy, hardlink, symlink, reflink).
+
+    An up-to-date dst (same link target, same inode, or same size and mtime) is kept.
+
+    Returns:
+        False if a hardlink or reflink was refused and the file was copied instead
+    """
+    if _up_to_date(src, dst, mode):
+        return True
+    if os.path.lexists(dst):
+        os.remove(dst)
+    if mode == "symlink":
+        os.symlink(os.path.abspath(src), dst)
+        return True
+    if mode == "copy":
+        shutil.copy2(src, dst)
+        return True
+    try:
+        if mode == "hardlink":
+            os.link(src, dst)
+        else:
+            _reflink(src, dst)
+        return True
+    except OSError:  # Cross-device link, or no reflink support on this filesystem
+        if os.path.lexists(dst):
+            os.remove(dst)
+    shutil.copy2(src, dst)
+    return False
+
+
+def place_files(
+    pairs: Iterable[Tuple[str, str]], mode: str, workers: int = DEFAULT_COPY_WORKERS
+) -> int:
+    """Place (src, dst) files with a thread pool, creating destination folders.
+
+    Returns:
+        Number of files placed
+    """
+    pairs = list(pairs)
+    for parent in {os.path.dirname(dst) for _, dst in pairs}:
+        os.makedirs(parent, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        placed = list(executor.map(lambda pair: place_file(*pair, mode), pairs))
+    fallbacks = placed.count(False)
+    if fallbacks:
+        print(f"[yellow]{mode} not possible for {fallbacks} file(s), copied them instead[/yellow]")
+    return len(placed)
+
+
+def prune_splits(output_dir: str, splits: Dict[str, List[str]], mode: str) -> int:
+    """Remove files of a previous split that do not belong to the new one.
+
+    Files that stay where they are (same split, same name) are kept, so placing them
+    again is skipped when they are up to date; growing a stable split only adds files.
+
+    Args:
+        output_dir: Dataset directory
+        splits: Split name -> image paths relative to the source folder
+        mode: Materialize mode of the new split
+
+    Returns:
+        Number of files removed
+    """
+    keep = set()
+    if mode != "listfile":
+        for split, relpaths in splits.items():
+            for rel in relpaths:
+                keep.add(os.path.join(output_dir, "images", split, Path(rel).name))
+                keep.add(label_path(output_dir, split, rel, mode))
+    removed = 0
+    for kind in ("images", "labels"):
+        for split in SPLITS:
+            split_dir = os.path.join(output_dir, kind, split)
+            if os.path.islink(split_dir) or not os.path.isdir(split_dir):
+                continue
+            with os.scandir(split_dir) as entries:
+                for entry in entries:
+                    if entry.path not in keep and not entry.is_dir(follow_symlinks=False):
+                        os.remove(entry.path)
+                        removed += 1
+    for split in SPLITS:
+        list_file = os.path.join(output_dir, f"{split}.txt")
+        if os.path.exists(list_file):
+            os.remove(list_file)
+    return removed
+
+
+def label_path(output_dir: str, split: str, relpath: str, mode: str) -> str:
+    """Where the label of the image at relpath (relative to the source folder) goes."""
+    if mode == "listfile":
+        return os.path.join(output_dir, SOURCE_DIR, "labels", os.path.splitext(relpath)[0] + ".txt")
+    return os.path.join(output_dir, "labels", split, f"{Path(relpath).stem}.txt")
+
+
+def _link_source_images(images_dir: str, output_dir: str) -> str:
+    link = os.path.join(output_dir, SOURCE_DIR, "images")
+    target = os.path.abspath(images_dir)
+    if os.path.islink(link) and os.readlink(link) == target:
+        return link
+    if os.path.lexists(link):
+        os.remove(link)
+    os.makedirs(os.path.dirname(link), exist_ok=True)
+    os.symlink(target, link, target_is_directory=True)
+    return link
+
+
+def write_data_yaml(
+    output_dir: str, splits: Dict[str, str], names: Optional[List[str]] = None
+) -> str:
+    """Write output_dir/data.yaml with split paths relative to output_dir."""
+    if names is None:
+        names = CANONICAL_CLASSES
+    data_yaml = os.path.join(output_dir, "data.yaml")
+    with open(data_yaml, "w") as f:
+        f.write(f"path: {os.path.abspath(output_dir)}\n")
+        for split, path in splits.items():
+            f.write(f"{split}: {path}\n")
+        f.write("\nnames:\n")
+        f.writelines(f"  {i}: {name}\n" for i, name in enumerate(names))
+    return data_yaml
+
+
+def materialize_split(
+    images_dir: str,
+    output_dir: str,
+    splits: Dict[str, List[str]],
+    mode: str = "copy",
+    workers: int = DEFAULT_COPY_WORKERS,
+    names: Optional[List[str]] = None,
+) -> str:
+    """Lay out the images of each split and write data.yaml.
+
+    Call prune_splits first and place labels at label_path(); this function only
+    handles the images.
+
+    Args:
+        images_dir: Source image folder
+        output_dir: Dataset directory
+        splits: Split name -> image paths relative to images_dir
+        mode: One of MATERIALIZE_MODES
+        workers: Threads placing files
+        names: Class names for data.yaml (defaults to the canonical classes)
+
+    Returns:
+        Path to the generated data.yaml
+    """
+    if mode not in MATERIALIZE_MODES:
+        raise ValueError(f"Unknown materialize mode {mode!r}, expected one of {MATERIALIZE_MODES}")
+
+    if mode == "listfile":
+        _link_source_images(images_dir, output_dir)
+        prefix = f"./{SOURCE_DIR}/images/"
+        for split, relpaths in splits.items():
+            with open(os.path.join(output_dir, f"{split}.txt"), "w") as f:
+                f.writelines(f"{prefix}{Path(rel).as_posix()}\n" for rel in relpaths)
+        return write_data_yaml(output_dir, {split: f"{split}.txt" for split in splits}, names)
+
+    pairs = [
+        (os.path.join(images_dir, rel), os.path.join(output_dir, "images", split, Path(rel).name))
+        for split, relpaths in splits.items()
+        for rel in relpaths
+    ]
+    for split in splits:
+        os.makedirs(os.path.join(output_dir, "images", split), exist_ok=True)
+    place_files(pairs, mode, workers)
+    return write_data_yaml(output_dir, {split: f"images/{split}" for split in splits}, names)
+
+
+__all__ = [
+    "MATERIALIZE_MODES",
+    "DEFAULT_COPY_WORKERS",
+    "place_file",
+    "place_files",
+    "prune_splits",
+    "label_path",
+    "write_data_yaml",
+    "materialize_split",
+]
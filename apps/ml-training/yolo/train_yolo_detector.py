@@ -8,6 +8,8 @@ from ultralytics import YOLO
 from rich import print
 import torch
 
+from shard_dataset import ShardDetectionTrainer, ShardDetectionValidator, is_shard_data_yaml
+
 
 def train_yolo_detector(
     data_yaml: str = "data.yaml",
@@ -33,6 +35,8 @@ def train_yolo_detector(
         name: Experiment name
         save: Whether to save the model
         **kwargs: Additional arguments for YOLO training
+
+    A data.yaml written by record_shards.py trains straight from the record shards.
     """
     print(f"[cyan]Starting YOLO training with {model_name}[/cyan]")
     print(f"[cyan]Data config: {data_yaml}[/cyan]")
@@ -95,6 +99,10 @@ def train_yolo_detector(
             print(f"[red]Failed to load model {model_name}: {e}[/red]")
             return None
 
+    if is_shard_data_yaml(data_yaml):
+        print("[cyan]Reading images and labels from record shards[/cyan]")
+        kwargs.setdefault("trainer", ShardDetectionTrainer)
+
     # Train the model
     try:
         results = model.train(
@@ -121,6 +129,11 @@ def train_yolo_detector(
         return None
 
 
+def _validator_for(data_yaml: str):
+    """Validator class for data_yaml (None lets Ultralytics pick its default)."""
+    return ShardDetectionValidator if is_shard_data_yaml(data_yaml) else None
+
+
 def evaluate_model(model_path: str, data_yaml: str = "data.yaml"):
     """
     Evaluate trained YOLO model.
@@ -135,7 +148,7 @@ def evaluate_model(model_path: str, data_yaml: str = "data.yaml"):
         model = YOLO(model_path)
 
         # Run validation
-        results = model.val(data=data_yaml)
+        results = model.val(data=data_yaml, validator=_validator_for(data_yaml))
 
         print("[green]Evaluation completed![/green]")
         print(f"[cyan]Results: {results}[/cyan]")
@@ -154,7 +167,7 @@ def evaluate_model(model_path: str, data_yaml: str = "data.yaml"):
 
                 torch.serialization.add_safe_globals([DetectionModel])
                 model = YOLO(model_path)
-                results = model.val(data=data_yaml)
+                results = model.val(data=data_yaml, validator=_validator_for(data_yaml))
                 print("[green]Evaluation completed with safe globals![/green]")
                 print(f"[cyan]Results: {results}[/cyan]")
                 return results
@@ -183,7 +196,14 @@ def generate_confusion_matrix(
         model = YOLO(model_path)
 
         # Run validation with confusion matrix
-        results = model.val(data=data_yaml, conf=0.25, iou=0.6, save_json=True, plots=True)
+        results = model.val(
+            data=data_yaml,
+            validator=_validator_for(data_yaml),
+            conf=0.25,
+            iou=0.6,
+            save_json=True,
+            plots=True,
+        )
 
         # Confusion matrix is automatically saved during validation
         print(f"[green]Confusion matrix saved to results directory[/green]")
@@ -202,7 +222,14 @@ def generate_confusion_matrix(
 
                 torch.serialization.add_safe_globals([DetectionModel])
                 model = YOLO(model_path)
-                results = model.val(data=data_yaml, conf=0.25, iou=0.6, save_json=True, plots=True)
+                results = model.val(
+                    data=data_yaml,
+                    validator=_validator_for(data_yaml),
+                    conf=0.25,
+                    iou=0.6,
+                    save_json=True,
+                    plots=True,
+                )
                 print(f"[green]Confusion matrix saved to results directory[/green]")
                 return results
             except Exception as e2:
@@ -18,7 +18,6 @@ Usage examples:
 
 import os
 import argparse
-import csv
 from pathlib import Path
 from typing import Dict, List, Tuple, Optional
 import cv2
@@ -27,6 +26,9 @@ from rich import print
 
 # Import from local utils
 from dataset_utils_yolo import CANONICAL_CLASSES, CLASS_TO_ID
+from detection_store import iter_detection_rows
+from image_index import index_files
+from zip_dataset import list_virtual_images, read_image_bytes
 
 # COCO class names for YOLO detections (YOLOv8 uses COCO by default)
 COCO_CLASSES = [
@@ -114,31 +116,16 @@ COCO_CLASSES = [
 
 
 def load_csv_labels(csv_path: str, min_confidence: float = 0.0) -> Dict[str, List[Dict]]:
-    """Load YOLO labels from CSV file."""
+    """Load YOLO labels from a CSV file or columnar .dets store."""
     detections = {}
 
     try:
-        with open(csv_path, "r") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                filename = row["filename"].strip()
-                confidence = float(row["confidence"])
-
-                if confidence < min_confidence:
-                    continue
-
-                detection = {
-                    "x_center": float(row["x_center"]),
-                    "y_center": float(row["y_center"]),
-                    "width": float(row["width"]),
-                    "height": float(row["height"]),
-                    "confidence": confidence,
-                    "class_id": int(row["class_id"]),
-                }
-
-                if filename not in detections:
-                    detections[filename] = []
-                detections[filename].append(detection)
+        for row in iter_detection_rows(csv_path, min_confidence):
+            filename = row.pop("filename").strip()
+
+            if filename not in detections:
+                detections[filename] = []
+            detections[filename].append(row)
 
     except FileNotFoundError:
         print(f"[red]CSV file not found: {csv_path}[/red]")
@@ -199,19 +186,27 @@ def find_image_files(images_dir: str) -> Dict[str, str]:
         print(f"[red]Images directory not found: {images_dir}[/red]")
         return mapping
 
-    for img_path in images_path.rglob("*"):
-        if img_path.is_file() and img_path.suffix.lower() in [".jpg", ".jpeg", ".png"]:
-            try:
-                # Store relative path from images_dir as key
-                rel_path = img_path.relative_to(images_path)
-                mapping[str(rel_path)] = str(img_path)
-            except ValueError:
-                # Fallback to just filename if relative_to fails
-                mapping[img_path.name] = str(img_path)
+    # Relative path from images_dir as key
+    for indexed in index_files(images_dir):
+        mapping[indexed.relpath] = str(images_path / indexed.relpath)
+
+    # Zip-backed images of a virtual dataset (see zip_dataset.py)
+    for virtual_path in list_virtual_images(images_dir):
+        rel_path = os.path.relpath(virtual_path, images_path.resolve())
+        mapping.setdefault(rel_path, virtual_path)
 
     return mapping
 
 
+def load_image(image_path: str) -> Optional[np.ndarray]:
+    """Decode an image from disk or from a virtual dataset's zip."""
+    try:
+        data = np.frombuffer(read_image_bytes(image_path), dtype=np.uint8)
+    except Exception:
+        return None
+    return cv2.imdecode(data, cv2.IMREAD_COLOR)
+
+
 def yolo_to_pixels(
     x_center: float, y_center: float, width: float, height: float, img_width: int, img_height: int
 ) -> Tuple[int, int, int, int]:
@@ -299,7 +294,7 @@ def visualize_labels(
         image_path = image_mapping[image_stem]
 
         # Load image
-        image = cv2.imread(image_path)
+        image = load_image(image_path)
         if image is None:
             print(f"[red]Failed to load image: {image_path}[/red]")
             continue
@@ -354,7 +349,9 @@ def visualize_labels(
 
 def main():
     parser = argparse.ArgumentParser(description="Visualize YOLO labels on images")
-    parser.add_argument("--csv", type=str, help="Path to CSV file with YOLO labels")
+    parser.add_argument(
+        "--csv", type=str, help="Path to CSV file (or .dets store) with YOLO labels"
+    )
     parser.add_argument("--dataset", type=str, help="Path to prepared YOLO dataset directory")
     parser.add_argument(
         "--split",
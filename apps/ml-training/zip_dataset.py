@@ -0,0 +1,254 @@
+"""Read-only dataset layer over the raw dataset zips.
+
+Consolidating with ``from_zips=True`` validates images straight from the archives and,
+instead of linking files into merged_dataset/, writes a virtual index there that maps
+every merged path (``merged_dataset/<class>/<slug>_<label>_<file>``) to a zip member.
+Those paths do not exist on disk, but everything that reads images through
+read_image_bytes/open_image_file (the batch loader, the visualizer, the integrity
+checks) resolves them, and collect_image_paths lists them like regular files. Shard
+assignment and CSV filenames, which use paths relative to the dataset folder, are the
+same as for an extracted dataset.
+
+Each zip's central directory is parsed once and cached next to the zip as
+``<zip>.index.json``; reads then go straight to the member's local header with a
+positional read, so threads and worker processes can read the same archive concurrently.
+A member can also be addressed directly as ``<zip path>!/<member name>``.
+"""
+
+import io
+import json
+import os
+import threading
+import zipfile
+import zlib
+from typing import BinaryIO, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+MEMBER_SEPARATOR = "!/"
+VIRTUAL_INDEX_NAME = ".virtual_dataset.tsv"
+ZIP_INDEX_SUFFIX = ".index.json"
+
+_LOCAL_HEADER_SIZE = 30
+_LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+_FLAG_ENCRYPTED = 0x1
+
+
+class ZipMember(NamedTuple):
+    """Location of one member inside a zip, from the central directory."""
+
+    name: str
+    header_offset: int
+    compress_size: int
+    file_size: int
+    compress_type: int
+    crc: int
+    flag_bits: int
+
+
+_guard = threading.Lock()
+_zip_indexes: Dict[str, Tuple[Tuple[int, int], Dict[str, ZipMember]]] = {}
+_virtual_indexes: Dict[str, Tuple[int, Dict[str, str]]] = {}
+_fds: Dict[str, int] = {}
+_fds_pid = os.getpid()
+
+
+def member_path(zip_path: str, name: str) -> str:
+    """Path string addressing a member of a zip."""
+    return f"{zip_path}{MEMBER_SEPARATOR}{name}"
+
+
+def split_member_path(path: str) -> Optional[Tuple[str, str]]:
+    """(zip path, member name) for a member path, or None for a regular path."""
+    zip_path, sep, name = path.partition(MEMBER_SEPARATOR)
+    if not sep or not zip_path.lower().endswith(".zip"):
+        return None
+    return zip_path, name
+
+
+def load_zip_index(zip_path: str) -> Dict[str, ZipMember]:
+    """Members of a zip by name, from the cached index or the central directory."""
+    stat = os.stat(zip_path)
+    key = (stat.st_size, stat.st_mtime_ns)
+    with _guard:
+        cached = _zip_indexes.get(zip_path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    cache_file = zip_path + ZIP_INDEX_SUFFIX
+    members = None
+    try:
+        with open(cache_file) as f:
+            stored = json.load(f)
+        if tuple(stored["key"]) == key:
+            members = {row[0]: ZipMember(*row) for row in stored["members"]}
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    if members is None:
+        with zipfile.ZipFile(zip_path) as zf:
+            members = {
+                info.filename: ZipMember(
+                    info.filename,
+                    info.header_offset,
+                    info.compress_size,
+                    info.file_size,
+                    info.compress_type,
+                    info.CRC,
+                    info.flag_bits,
+                )
+                for info in zf.infolist()
+                if not info.is_dir()
+            }
+        try:
+            tmp = cache_file + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({"key": key, "members": list(members.values())}, f)
+            os.replace(tmp, cache_file)
+        except OSError:
+            pass  # Read-only mirror: keep the index in memory only
+
+    with _guard:
+        _zip_indexes[zip_path] = (key, members)
+    return members
+
+
+def _zip_fd(zip_path: str) -> int:
+    """Per-process read-only descriptor; pread keeps reads independent of any offset."""
+    global _fds_pid
+    with _guard:
+        if _fds_pid != os.getpid():
+            # Forked worker: descriptors inherited from the parent are not ours to reuse
+            _fds.clear()
+            _fds_pid = os.getpid()
+        fd = _fds.get(zip_path)
+        if fd is None:
+            fd = os.open(zip_path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+            _fds[zip_path] = fd
+        return fd
+
+
+def read_member(zip_path: str, name: str) -> bytes:
+    """Read and decompress one member, verifying its CRC."""
+    member = load_zip_index(zip_path).get(name)
+    if member is None:
+        raise FileNotFoundError(f"{name} not found in {zip_path}")
+    if member.flag_bits & _FLAG_ENCRYPTED or member.compress_type not in (
+        zipfile.ZIP_STORED,
+        zipfile.ZIP_DEFLATED,
+    ):
+        # Rare in practice; let zipfile deal with other compression methods
+        with zipfile.ZipFile(zip_path) as zf:
+            return zf.read(name)
+
+    fd = _zip_fd(zip_path)
+    header = os.pread(fd, _LOCAL_HEADER_SIZE, member.header_offset)
+    if len(header) < _LOCAL_HEADER_SIZE or not header.startswith(_LOCAL_HEADER_SIGNATURE):
+        raise zipfile.BadZipFile(f"Bad local header for {name} in {zip_path}")
+    name_len = int.from_bytes(header[26:28], "little")
+    extra_len = int.from_bytes(header[28:30], "little")
+    start = member.header_offset + _LOCAL_HEADER_SIZE + name_len + extra_len
+    data = os.pread(fd, member.compress_size, start)
+    if member.compress_type == zipfile.ZIP_DEFLATED:
+        data = zlib.decompress(data, -zlib.MAX_WBITS)
+    if len(data) != member.file_size or zlib.crc32(data) != member.crc:
+        raise zipfile.BadZipFile(f"Bad CRC or size for {name} in {zip_path}")
+    return data
+
+
+def write_virtual_index(root: str, entries: Iterable[Tuple[str, str]]) -> int:
+    """Write root's virtual index from (merged path, member path) pairs.
+
+    Returns:
+        Number of entries written
+    """
+    rows = sorted(
+        (os.path.relpath(dst, root), os.path.abspath(zip_path), name)
+        for dst, (zip_path, name) in ((dst, split_member_path(src)) for dst, src in entries)
+    )
+    path = os.path.join(root, VIRTUAL_INDEX_NAME)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.writelines(f"{rel}\t{zip_path}\t{name}\n" for rel, zip_path, name in rows)
+    os.replace(tmp, path)
+    return len(rows)
+
+
+def _virtual_index(root: str) -> Optional[Dict[str, str]]:
+    """Merged path -> member path for a virtual dataset rooted at root, if it has one."""
+    path = os.path.join(root, VIRTUAL_INDEX_NAME)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    with _guard:
+        cached = _virtual_indexes.get(root)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    index = {}
+    with open(path) as f:
+        for line in f:
+            rel, zip_path, name = line.rstrip("\n").split("\t")
+            index[os.path.join(root, rel)] = member_path(zip_path, name)
+    with _guard:
+        _virtual_indexes[root] = (mtime, index)
+    return index
+
+
+def _find_virtual(path: str) -> Optional[str]:
+    # Virtual paths are <root>/<class>/<file>, so the index sits one or two levels up
+    path = os.path.abspath(path)
+    root = os.path.dirname(path)
+    for _ in range(2):
+        index = _virtual_index(root)
+        if index is not None:
+            return index.get(path)
+        root = os.path.dirname(root)
+    return None
+
+
+def list_virtual_images(folder: str) -> List[str]:
+    """Virtual image paths under folder (a virtual dataset root or one of its classes)."""
+    folder = os.path.abspath(folder)
+    for root in (folder, os.path.dirname(folder)):
+        index = _virtual_index(root)
+        if index is not None:
+            prefix = folder + os.sep
+            return sorted(p for p in index if root == folder or p.startswith(prefix))
+    return []
+
+
+def resolve_image_path(path: str) -> str:
+    """The zip member path behind a virtual dataset path; other paths are returned as is."""
+    if split_member_path(path) is None and not os.path.exists(path):
+        return _find_virtual(path) or path
+    return path
+
+
+def read_image_bytes(path: str) -> bytes:
+    """Contents of a regular file, a member path or a virtual dataset path."""
+    member = split_member_path(resolve_image_path(path))
+    if member is not None:
+        return read_member(*member)
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def open_image_file(path: str) -> BinaryIO:
+    """Binary file object for any path read_image_bytes accepts."""
+    if split_member_path(path) is None and os.path.exists(path):
+        return open(path, "rb")
+    return io.BytesIO(read_image_bytes(path))
+
+
+__all__ = [
+    "VIRTUAL_INDEX_NAME",
+    "ZipMember",
+    "member_path",
+    "split_member_path",
+    "load_zip_index",
+    "read_member",
+    "write_virtual_index",
+    "list_virtual_images",
+    "resolve_image_path",
+    "read_image_bytes",
+    "open_image_file",
+]